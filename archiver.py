@@ -0,0 +1,95 @@
+"""Background archiver moving finished reposts from {prefix}reposts to {prefix}reposts_archive"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+import mysql.connector
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_COLUMNS = (
+    'id, from_channel_id, to_channel_id, repost_channel, from_user_id, to_user_id, '
+    'status, created_date, confirmed_date'
+)
+
+
+def archive_batch(conn, prefix, cutoff, batch_size):
+    """Move up to batch_size confirmed or rejected reposts created before cutoff, return how many moved.
+
+    One short transaction locking only the selected primary keys.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"SELECT id FROM {prefix}reposts "
+            "WHERE status IN ('confirmed', 'rejected') AND created_date < %s LIMIT %s",
+            (cutoff, batch_size)
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            return 0
+        placeholders = ', '.join(['%s'] * len(ids))
+
+        # Keep the per-channel totals shown by /find and /stat and weighed by match_score
+        for status, column in (('confirmed', 'archived_confirmed'), ('rejected', 'archived_unconfirmed')):
+            cursor.execute(
+                f"SELECT to_channel_id, COUNT(*) FROM {prefix}reposts "
+                f"WHERE id IN ({placeholders}) AND status = %s GROUP BY to_channel_id",
+                (*ids, status)
+            )
+            counts = [(count, channel_id) for channel_id, count in cursor.fetchall()]
+            if counts:
+                cursor.executemany(
+                    f"UPDATE {prefix}channels SET {column} = {column} + %s WHERE id = %s",
+                    counts
+                )
+
+        cursor.execute(
+            f"INSERT INTO {prefix}reposts_archive ({ARCHIVED_COLUMNS}) "
+            f"SELECT {ARCHIVED_COLUMNS} FROM {prefix}reposts WHERE id IN ({placeholders})",
+            ids
+        )
+        cursor.execute(f"DELETE FROM {prefix}reposts WHERE id IN ({placeholders})", ids)
+        conn.commit()
+        return len(ids)
+    finally:
+        cursor.close()
+
+
+def archive_reposts(get_connection, prefix, max_age_days, batch_size, pause):
+    """Archive everything older than max_age_days batch by batch, pausing between batches"""
+    conn = get_connection()
+    if not conn:
+        return 0
+
+    cutoff = datetime.now() - timedelta(days=max_age_days)
+    total = 0
+    try:
+        while True:
+            moved = archive_batch(conn, prefix, cutoff, batch_size)
+            total += moved
+            if moved < batch_size:
+                break
+            time.sleep(pause)
+    except mysql.connector.Error as err:
+        conn.rollback()
+        logger.error(f"Error archiving {prefix}reposts: {err}")
+    finally:
+        conn.close()
+
+    if total:
+        logger.info(f"Archived {total} reposts from {prefix}reposts")
+    return total
+
+
+def start_archiver(get_connection, prefix, max_age_days, batch_size, interval, pause):
+    """Run archive_reposts every interval seconds from a daemon thread"""
+    def run():
+        while True:
+            archive_reposts(get_connection, prefix, max_age_days, batch_size, pause)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name=f'{prefix}reposts-archiver', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,40 @@
+"""Micro-benchmark of the precompiled VK main menu.
+
+Compares the keyboard serialized once at import time against rebuilding and
+re-serializing it on every reply.
+
+    python benchmarks/bench_rendering.py
+"""
+import json
+
+from common import bench
+
+import vk_bot
+
+
+def legacy_main_menu_form():
+    buttons = vk_bot.vk_create_buttons(vk_bot.MAIN_MENU_BUTTONS, columns=2)
+    keyboard = {'one_time': False, 'inline': False, 'buttons': buttons}
+    return vk_bot.vk_build_message_form(1, "Выберите действие:", keyboard)
+
+
+def precompiled_main_menu_form():
+    return vk_bot.vk_build_message_form(1, vk_bot.MAIN_MENU_TEXT, vk_bot.MAIN_MENU_KEYBOARD)
+
+
+def main_bench():
+    assert json.loads(legacy_main_menu_form()['keyboard'][1]) == json.loads(precompiled_main_menu_form()['keyboard'][1])
+
+    cases = [
+        ("vk main menu", legacy_main_menu_form, precompiled_main_menu_form),
+    ]
+
+    print(f"{'case':<24}{'legacy, us':>12}{'current, us':>13}{'speedup':>9}")
+    for name, legacy, current in cases:
+        legacy_cost = bench(legacy)
+        current_cost = bench(current)
+        print(f"{name:<24}{legacy_cost:>12.2f}{current_cost:>13.2f}{legacy_cost / current_cost:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main_bench()
@@ -0,0 +1,135 @@
+"""Load test of the Telegram command handlers.
+
+Feeds synthetic ``Update`` objects through the ``Application`` built by
+``main.build_application`` with a fake Bot API transport, against an
+in-process SQLite stand-in (default) or the local MySQL configured in
+``.env`` (``--mysql``, uses and fills the configured database).
+
+    python benchmarks/bench_tg_handlers.py --channels 2000 --reposts 20000 --requests 300
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+
+from common import percentile
+
+import main
+from fake_mysql import FakeDatabase
+from fake_telegram import FakeTelegramRequest
+from metrics import InstrumentedConnection
+from rate_limiter import RateLimiter
+from seed_data import channel_name, owner_of, seed
+from telegram import Update
+
+COMMANDS = ('find', 'find_all', 'done', 'confirm', 'list', 'stat')
+
+
+def make_update(bot, update_id, user_id, text):
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'Bench'},
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return Update.de_json({'update_id': update_id, 'message': message}, bot)
+
+
+def build_workload(command, count, args, pending, rng):
+    """Return [(user_id, text)] for one command"""
+    workload = []
+    for _ in range(count):
+        index = rng.randrange(args.channels)
+        user_id = owner_of(index, args.channels_per_owner)
+        if command == 'find':
+            workload.append((user_id, f'/find {channel_name(index)}'))
+        elif command == 'find_all':
+            workload.append((user_id, '/find'))
+        elif command == 'done':
+            target = rng.randrange(args.channels)
+            workload.append((user_id, f'/done {channel_name(target)} {channel_name(index)}'))
+        elif command == 'confirm':
+            if pending:
+                from_channel, to_channel, to_user_id = pending.pop()
+                workload.append((to_user_id, f'/confirm {to_channel} {from_channel}'))
+            else:
+                workload.append((user_id, f'/confirm {channel_name(index)} {channel_name(0)}'))
+        elif command == 'list':
+            workload.append((user_id, '/list'))
+        elif command == 'stat':
+            workload.append((user_id, '/stat'))
+    return workload
+
+
+async def run_command(application, workload, update_ids):
+    # Updates are processed one at a time, as the application does by default
+    latencies = []
+    start = time.perf_counter()
+    for user_id, text in workload:
+        update = make_update(application.bot, next(update_ids), user_id, text)
+        update_start = time.perf_counter()
+        await application.process_update(update)
+        latencies.append(time.perf_counter() - update_start)
+    return latencies, time.perf_counter() - start
+
+
+async def run(args):
+    logging.getLogger().setLevel(logging.WARNING)
+    rng = random.Random(args.seed)
+    fake_db = None
+    if args.mysql:
+        main.Database.init_db()
+    else:
+        fake_db = FakeDatabase()
+        main.Database.get_connection = staticmethod(lambda: InstrumentedConnection(fake_db.connect()))
+
+    # The harness measures handlers, not the anti-flood guard
+    main.rate_limiter = RateLimiter({'default': (10 ** 9, 1)})
+    main.traffic_recorder = None
+
+    conn = main.Database.get_connection()
+    print(f"Seeding {args.channels} channels and {args.reposts} reposts...")
+    pending = seed(conn, args.channels, args.reposts, args.channels_per_owner, rng)
+    conn.close()
+    rng.shuffle(pending)
+
+    request = FakeTelegramRequest(latency=args.latency / 1000)
+    application = main.build_application(request=request)
+    await application.initialize()
+    update_ids = iter(range(1, 10 ** 9))
+
+    commands = args.commands.split(',') if args.commands else COMMANDS
+    print(f"\n{'command':<10}{'requests':>9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'api calls':>11}")
+    try:
+        for command in commands:
+            workload = build_workload(command, args.requests, args, pending, rng)
+            calls_before = sum(request.calls.values())
+            latencies, elapsed = await run_command(application, workload, update_ids)
+            api_calls = sum(request.calls.values()) - calls_before
+            latencies.sort()
+            print(
+                f"{command:<10}{len(latencies):>9}{len(latencies) / elapsed:>9.1f}"
+                f"{percentile(latencies, 50) * 1000:>9.2f}{percentile(latencies, 95) * 1000:>9.2f}"
+                f"{percentile(latencies, 99) * 1000:>9.2f}{api_calls / len(latencies):>11.2f}"
+            )
+    finally:
+        await application.shutdown()
+        if fake_db:
+            fake_db.remove()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--channels', type=int, default=1000)
+    parser.add_argument('--reposts', type=int, default=10000)
+    parser.add_argument('--channels-per-owner', type=int, default=3)
+    parser.add_argument('--requests', type=int, default=200, help='requests per command')
+    parser.add_argument('--latency', type=float, default=0.0, help='fake Bot API latency, ms')
+    parser.add_argument('--commands', default='', help='comma-separated subset of ' + ','.join(COMMANDS))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--mysql', action='store_true', help='use the MySQL database from .env')
+    asyncio.run(run(parser.parse_args()))
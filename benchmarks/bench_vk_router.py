@@ -0,0 +1,78 @@
+"""Benchmark of VK command dispatch plus text normalization per message.
+
+Compares the command table in ``vk_bot.vk_router`` with the previous
+``if/elif`` chain that recompiled the emoji pattern for every message.
+
+    python benchmarks/bench_vk_router.py
+"""
+import re
+
+from common import bench
+
+import vk_bot
+
+MESSAGES = [
+    '📊 Статистика', 'помощь', 'найти mygroup', 'готово targetgroup yourgroup',
+    'подтвердить mygroup repost_group', 'жалоба badgroup Не делает репосты',
+    'список', 'мои группы', 'что-то непонятное', 'добавить club123456',
+]
+
+
+def legacy_remove_emoji(text):
+    emoji_pattern = re.compile("["
+        u"\U0001F600-\U0001F64F"
+        u"\U0001F300-\U0001F5FF"
+        u"\U0001F680-\U0001F6FF"
+        u"\U0001F1E0-\U0001F1FF"
+        u"\U00002702-\U000027B0"
+        u"\U000024C2-\U0001F251"
+        "]+", flags=re.UNICODE)
+    return emoji_pattern.sub(r'', text)
+
+
+def legacy_dispatch(text):
+    text = legacy_remove_emoji(text).strip().lower()
+    if text in ['начать', 'start', 'старт']:
+        return 'start'
+    elif text in ['помощь', 'help', 'справка']:
+        return 'help'
+    elif text.startswith('добавить'):
+        return 'add'
+    elif text in ['мои', 'мои группы']:
+        return 'my'
+    elif text.startswith('удалить'):
+        return 'delete'
+    elif text.startswith('обновить'):
+        return 'update'
+    elif text.startswith('найти'):
+        return 'find_help' if text == 'найти_помощь' else 'find'
+    elif text.startswith('готово'):
+        return 'done_help' if text == 'готово_помощь' else 'done'
+    elif text.startswith('подтвердить'):
+        return 'confirm'
+    elif text in ['список', 'ожидают']:
+        return 'list'
+    elif text in ['статистика', 'стат', 'stat']:
+        return 'stat'
+    elif text.startswith('жалоба'):
+        return 'abuse'
+    return None
+
+
+def router_dispatch(text):
+    return vk_bot.vk_router.resolve(vk_bot.remove_emoji(text).strip().lower())
+
+
+def run_all(dispatch):
+    for text in MESSAGES:
+        dispatch(text)
+
+
+if __name__ == '__main__':
+    for text in MESSAGES:
+        assert (legacy_dispatch(text) is None) == (router_dispatch(text) is None), text
+
+    legacy_cost = bench(lambda: run_all(legacy_dispatch), 5000) / len(MESSAGES)
+    router_cost = bench(lambda: run_all(router_dispatch), 5000) / len(MESSAGES)
+    print(f"legacy chain:  {legacy_cost:.2f} us/message")
+    print(f"command table: {router_cost:.2f} us/message ({legacy_cost / router_cost:.1f}x)")
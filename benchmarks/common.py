@@ -0,0 +1,49 @@
+"""Shared bootstrap for the benchmark scripts.
+
+The bot modules read their configuration from the environment at import time,
+so dummy values are filled in here before ``main`` or ``vk_bot`` is imported.
+Settings from ``.env`` take precedence, so ``--mysql`` style options reach the
+configured databases.
+"""
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+BENCH_ENV = {
+    'DB_NAME': 'easytg_cross_promo_bot_bench',
+    'DB_USER_NAME': 'bench',
+    'DB_USER_PASSWORD': 'bench',
+    'BOT_TOKEN': '123456:BENCH-TOKEN',
+    'VK_DB_NAME': 'easytg_cross_promo_bot_vk_bench',
+    'VK_DB_USER_NAME': 'bench',
+    'VK_DB_USER_PASSWORD': 'bench',
+    'VK_ACCESS_TOKEN': 'bench',
+    'VK_GROUP_ID': '1',
+    'VK_CONFIRMATION_CODE': 'bench',
+}
+
+load_dotenv(os.path.join(ROOT_DIR, '.env'))
+for _key, _value in BENCH_ENV.items():
+    os.environ.setdefault(_key, _value)
+
+
+def percentile(sorted_values, pct):
+    """Return the nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def bench(func, number=20000):
+    """Return the mean cost of one call in microseconds"""
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return (time.perf_counter() - start) / number * 1e6
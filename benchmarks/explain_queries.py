@@ -0,0 +1,363 @@
+"""Plan regression suite for the hot SQL queries of both bots.
+
+Runs every query below with ``EXPLAIN FORMAT=JSON`` against the MySQL
+databases from ``.env`` (fill them with ``generate_data.py`` first), checks
+that each table is read through one of the expected indexes and prints the
+``EXPLAIN ANALYZE`` timing and the InnoDB index sizes. Exits with status 1 when any plan regresses, so
+it can gate schema or query changes. Requires MySQL 8.0.18+.
+
+The SQL is copied from ``main.py`` / ``vk_bot.py`` and has to be kept in
+step with them, together with ``EXPECTED`` when indexes change.
+
+    python benchmarks/explain_queries.py --platform both --verbose
+"""
+import argparse
+import json
+import re
+import sys
+from datetime import datetime, timedelta
+
+import common  # noqa: F401  (environment and sys.path)
+
+import main
+import vk_bot
+from similar_channels import (
+    MAX_CHANNELS, OVERSAMPLE, PER_CHANNEL_LIMIT, PROXIMITY_WEIGHTED_RANDOM, candidates_query, proximity_params
+)
+
+ANY_INDEX = object()
+ACTUAL_TIME = re.compile(r'actual time=[\d.]+\.\.([\d.]+)')
+
+# name: (SQL with {prefix}, sample parameter names)
+QUERIES = {
+    'find_target': (
+        "SELECT id, subscriber_count FROM {prefix}channels WHERE channel_username = %s",
+        ('channel',),
+    ),
+    'find_band': (
+        "SELECT c.id, c.channel_username, c.subscriber_count, "
+        "(SELECT COUNT(*) FROM {prefix}reposts r WHERE r.to_channel_id = c.id AND r.status = 'confirmed') "
+        "+ c.archived_confirmed as confirmed_count, "
+        "(SELECT COUNT(*) FROM {prefix}reposts r WHERE r.to_channel_id = c.id AND r.status = 'pending') as pending_count "
+        "FROM {prefix}channels c "
+        "WHERE c.channel_username != %s "
+        "AND c.owner_user_id != %s "
+        "AND c.subscriber_count BETWEEN %s AND %s "
+        f"ORDER BY {PROXIMITY_WEIGHTED_RANDOM} LIMIT %s",
+        ('channel', 'owner', 'band_low', 'band_high', 'subscribers', 'proximity_span', 'find_limit'),
+    ),
+    'find_all_channels': (
+        "SELECT id, channel_username, subscriber_count FROM {prefix}channels WHERE owner_user_id = %s "
+        "ORDER BY subscriber_count DESC LIMIT %s",
+        ('owner', 'max_channels'),
+    ),
+    # Two disjoint bands, built by the same helper as /find without a channel
+    'find_all_bands': (
+        candidates_query('{prefix}', [None, None]),
+        ('owner', 'band_low', 'band_high', 'band_limit', 'owner', 'band2_low', 'band2_high', 'band_limit'),
+    ),
+    'update_channel': (
+        "SELECT id, channel_id, subscriber_count FROM {prefix}channels "
+        "WHERE channel_username = %s AND owner_user_id = %s",
+        ('channel', 'owner'),
+    ),
+    'update_summary': (
+        "SELECT count_7d, count_30d FROM {prefix}subscriber_summary WHERE channel_id = %s",
+        ('id_low',),
+    ),
+    'history_downsample': (
+        "SELECT channel_id, observed_at, subscriber_count FROM {prefix}subscriber_history "
+        "WHERE channel_id BETWEEN %s AND %s AND observed_at < %s "
+        "ORDER BY channel_id, observed_at",
+        ('id_low', 'id_high', 'point_30d'),
+    ),
+    'history_summary': (
+        "SELECT c.id, "
+        "COALESCE((SELECT h.subscriber_count FROM {prefix}subscriber_history h "
+        "WHERE h.channel_id = c.id AND h.observed_at <= %s ORDER BY h.observed_at DESC LIMIT 1), "
+        "(SELECT d.last_count FROM {prefix}subscriber_daily d "
+        "WHERE d.channel_id = c.id AND d.day < %s ORDER BY d.day DESC LIMIT 1)), "
+        "NOW() FROM {prefix}channels c WHERE c.id BETWEEN %s AND %s",
+        ('point_7d', 'day_7d', 'id_low', 'id_high'),
+    ),
+    'my_channels': (
+        "SELECT channel_username, subscriber_count, added_date "
+        "FROM {prefix}channels WHERE owner_user_id = %s ORDER BY added_date DESC",
+        ('owner',),
+    ),
+    'list_pending': (
+        "SELECT f.channel_username AS from_channel, t.channel_username AS to_channel, r.created_date "
+        "FROM {prefix}reposts r "
+        "JOIN {prefix}channels f ON f.id = r.from_channel_id "
+        "JOIN {prefix}channels t ON t.id = r.to_channel_id "
+        "WHERE r.to_user_id = %s AND r.status = 'pending' "
+        "ORDER BY r.created_date DESC",
+        ('pending_owner',),
+    ),
+    'done_target': (
+        "SELECT c.id, c.channel_id, c.owner_user_id, COALESCE(s.digest, 0) AS digest FROM {prefix}channels c "
+        "LEFT JOIN {prefix}user_settings s ON s.user_id = c.owner_user_id WHERE c.channel_username = %s",
+        ('channel',),
+    ),
+    'digest_due': (
+        "SELECT r.to_user_id, f.channel_username AS from_channel, t.channel_username AS to_channel, "
+        "r.created_date "
+        "FROM {prefix}user_settings s "
+        "JOIN {prefix}reposts r ON r.to_user_id = s.user_id AND r.status = 'pending' "
+        "AND r.created_date > s.digest_sent_at AND r.created_date <= %s "
+        "JOIN {prefix}channels f ON f.id = r.from_channel_id "
+        "JOIN {prefix}channels t ON t.id = r.to_channel_id "
+        "WHERE s.digest = 1 AND s.digest_sent_at <= %s "
+        "ORDER BY r.to_user_id, r.created_date",
+        ('digest_cutoff', 'digest_due'),
+    ),
+    'confirm_pending': (
+        "SELECT r.id, r.from_user_id "
+        "FROM {prefix}reposts r "
+        "JOIN {prefix}channels f ON f.id = r.from_channel_id "
+        "WHERE r.to_channel_id = %s AND f.channel_username = %s AND r.to_user_id = %s AND r.status = 'pending' "
+        "LIMIT 1",
+        ('pending_to_id', 'pending_from', 'pending_owner'),
+    ),
+    'button_repost': (
+        "SELECT r.id, r.status, r.from_user_id, r.to_user_id, r.from_channel_id, r.to_channel_id, "
+        "f.channel_username AS from_channel, t.channel_username AS to_channel "
+        "FROM {prefix}reposts r "
+        "JOIN {prefix}channels f ON f.id = r.from_channel_id "
+        "JOIN {prefix}channels t ON t.id = r.to_channel_id "
+        "WHERE r.id = %s",
+        ('pending_id',),
+    ),
+    'stat_pending': (
+        "SELECT COUNT(*) as total FROM {prefix}reposts WHERE status = 'pending'",
+        (),
+    ),
+    'expiry_load': (
+        "SELECT id, created_date FROM {prefix}reposts WHERE status = 'pending'",
+        (),
+    ),
+    'admin_channels': (
+        "SELECT * FROM {prefix}channels ORDER BY added_date DESC LIMIT %s OFFSET %s",
+        ('page_size', 'offset'),
+    ),
+    'admin_channels_deep': (
+        "SELECT * FROM {prefix}channels ORDER BY added_date DESC LIMIT %s OFFSET %s",
+        ('page_size', 'deep_offset'),
+    ),
+    'admin_channels_search': (
+        "SELECT * FROM {prefix}channels WHERE channel_username LIKE %s ORDER BY added_date DESC LIMIT %s OFFSET %s",
+        ('search', 'page_size', 'offset'),
+    ),
+    'admin_reposts': (
+        "SELECT r.*, f.channel_username AS from_channel, t.channel_username AS to_channel "
+        "FROM {prefix}reposts r "
+        "LEFT JOIN {prefix}channels f ON f.id = r.from_channel_id "
+        "LEFT JOIN {prefix}channels t ON t.id = r.to_channel_id "
+        "ORDER BY r.created_date DESC LIMIT %s OFFSET %s",
+        ('page_size', 'offset'),
+    ),
+    'admin_reposts_archive': (
+        "SELECT r.*, f.channel_username AS from_channel, t.channel_username AS to_channel "
+        "FROM {prefix}reposts_archive r "
+        "LEFT JOIN {prefix}channels f ON f.id = r.from_channel_id "
+        "LEFT JOIN {prefix}channels t ON t.id = r.to_channel_id "
+        "ORDER BY r.created_date DESC LIMIT %s OFFSET %s",
+        ('page_size', 'offset'),
+    ),
+    'archive_batch': (
+        "SELECT id FROM {prefix}reposts "
+        "WHERE status IN ('confirmed', 'rejected') AND created_date < %s LIMIT %s",
+        ('archive_cutoff', 'archive_batch'),
+    ),
+    'admin_reports': (
+        "SELECT * FROM {prefix}abuse_reports ORDER BY report_date DESC LIMIT %s OFFSET %s",
+        ('page_size', 'offset'),
+    ),
+}
+
+# name: {table or alias: acceptable index names, ANY_INDEX, or None when a full scan is expected}
+EXPECTED = {
+    'find_target': {'{prefix}channels': ('channel_username',)},
+    'find_band': {'c': ('idx_subs_score',), 'r': ('idx_to_channel_status',)},
+    'find_all_channels': {'{prefix}channels': ('idx_owner',)},
+    'find_all_bands': {'c': ('idx_subs_score',), 'r': ('idx_to_channel_status',)},
+    'my_channels': {'{prefix}channels': ('idx_owner',)},
+    'update_channel': {'{prefix}channels': ('channel_username',)},
+    'update_summary': {'{prefix}subscriber_summary': ('PRIMARY',)},
+    'history_downsample': {'{prefix}subscriber_history': ('PRIMARY',)},
+    'history_summary': {'c': ('PRIMARY',), 'h': ('PRIMARY',), 'd': ('PRIMARY',)},
+    'list_pending': {'r': ('idx_to_user_status',), 'f': ('PRIMARY',), 't': ('PRIMARY',)},
+    'done_target': {'c': ('channel_username',), 's': ('PRIMARY',)},
+    'digest_due': {
+        's': ('idx_digest_due',), 'r': ('idx_to_user_status',), 'f': ('PRIMARY',), 't': ('PRIMARY',),
+    },
+    'confirm_pending': {'r': ('idx_to_channel_status',), 'f': ('PRIMARY', 'channel_username')},
+    'button_repost': {'r': ('PRIMARY',), 'f': ('PRIMARY',), 't': ('PRIMARY',)},
+    'stat_pending': {'{prefix}reposts': ('idx_status_created',)},
+    'expiry_load': {'{prefix}reposts': ('idx_status_created',)},
+    # No index on the sort columns yet: these read and sort the whole table
+    'admin_channels': {'{prefix}channels': None},
+    'admin_channels_deep': {'{prefix}channels': None},
+    'admin_channels_search': {'{prefix}channels': None},
+    'admin_reposts': {'r': None, 'f': ('PRIMARY',), 't': ('PRIMARY',)},
+    'admin_reports': {'{prefix}abuse_reports': None},
+    'admin_reposts_archive': {'r': ('idx_created',), 'f': ('PRIMARY',), 't': ('PRIMARY',)},
+    'archive_batch': {'{prefix}reposts': ('idx_status_created',)},
+}
+
+PLATFORMS = {
+    'tg': ('', main.Database),
+    'vk': ('vk_', vk_bot.VKDatabase),
+}
+
+
+def plan_tables(node):
+    """Yield every table access in an EXPLAIN FORMAT=JSON tree, subqueries included"""
+    if isinstance(node, dict):
+        table = node.get('table')
+        if isinstance(table, dict) and 'table_name' in table:
+            yield table
+        for value in node.values():
+            yield from plan_tables(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from plan_tables(value)
+
+
+def sample_params(cursor, prefix, deep_page):
+    """Pick representative parameter values from the data"""
+    cursor.execute(f"SELECT COUNT(*) FROM {prefix}channels")
+    total = cursor.fetchone()[0]
+    if not total:
+        raise SystemExit(f"{prefix}channels is empty, run generate_data.py first")
+    cursor.execute(
+        f"SELECT channel_username, owner_user_id, subscriber_count FROM {prefix}channels "
+        "ORDER BY id LIMIT 1 OFFSET %s",
+        (total // 2,)
+    )
+    channel, owner, subscribers = cursor.fetchone()
+    cursor.execute(
+        f"SELECT f.channel_username, r.to_channel_id, r.to_user_id, r.id FROM {prefix}reposts r "
+        f"JOIN {prefix}channels f ON f.id = r.from_channel_id "
+        "WHERE r.status = 'pending' LIMIT 1"
+    )
+    pending = cursor.fetchone() or (channel, 0, owner, 0)
+    diff = -(-max(subscribers, 100) * 2 // 10)
+    return {
+        'channel': channel,
+        'owner': owner,
+        'band_low': max(subscribers - diff, 0),
+        'band_high': subscribers + diff,
+        'subscribers': subscribers,
+        'proximity_span': proximity_params(subscribers)[1],
+        'band2_low': (subscribers + diff) * 2,
+        'band2_high': (subscribers + diff) * 3,
+        'band_limit': PER_CHANNEL_LIMIT * OVERSAMPLE,
+        'max_channels': MAX_CHANNELS,
+        'find_limit': main.FIND_RESULTS_LIMIT * OVERSAMPLE,
+        'pending_from': pending[0],
+        'pending_to_id': pending[1],
+        'pending_owner': pending[2],
+        'pending_id': pending[3],
+        'page_size': vk_bot.ITEMS_PER_PAGE,
+        'offset': 0,
+        'deep_offset': (deep_page - 1) * vk_bot.ITEMS_PER_PAGE,
+        'search': '%bench_1%',
+        'id_low': 1,
+        'id_high': 1000,
+        'point_7d': datetime.now() - timedelta(days=7),
+        'day_7d': (datetime.now() - timedelta(days=7)).date(),
+        'point_30d': datetime.now() - timedelta(days=30),
+        'archive_cutoff': datetime.now() - timedelta(days=main.ARCHIVE_AFTER_DAYS or 30),
+        'archive_batch': main.ARCHIVE_BATCH_SIZE,
+        'digest_cutoff': datetime.now(),
+        'digest_due': datetime.now() - timedelta(seconds=main.DIGEST_INTERVAL or 86400),
+    }
+
+
+def index_sizes(cursor, table):
+    """InnoDB index sizes in bytes, from the persistent statistics"""
+    cursor.execute(
+        "SELECT index_name, stat_value * @@innodb_page_size FROM mysql.innodb_index_stats "
+        "WHERE database_name = DATABASE() AND table_name = %s AND stat_name = 'size' ORDER BY index_name",
+        (table,)
+    )
+    return cursor.fetchall()
+
+
+def check(name, tables, prefix):
+    """Return a list of regressions for one query plan"""
+    problems = []
+    expected = {table.format(prefix=prefix): keys for table, keys in EXPECTED[name].items()}
+    for table in tables:
+        table_name = table['table_name']
+        if table_name not in expected:
+            continue
+        keys = expected[table_name]
+        key = table.get('key')
+        if keys is None:
+            continue
+        if table.get('access_type') == 'ALL' or key is None:
+            wanted = 'any index' if keys is ANY_INDEX else ' or '.join(keys)
+            problems.append(f"{table_name}: full scan, expected {wanted}")
+        elif keys is not ANY_INDEX and key not in keys:
+            problems.append(f"{table_name}: uses {key}, expected {' or '.join(keys)}")
+    return problems
+
+
+def run_platform(platform, args):
+    prefix, database = PLATFORMS[platform]
+    conn = database.get_connection()
+    if not conn:
+        raise SystemExit(f"Cannot connect to the {platform} database")
+    cursor = conn.cursor()
+    samples = sample_params(cursor, prefix, args.deep_page)
+    regressions = 0
+
+    print(f"\n{platform}")
+    print(f"{'query':<24}{'time ms':>10}{'rows':>12}  plan")
+    for name, (sql, param_names) in QUERIES.items():
+        sql = sql.format(prefix=prefix)
+        params = tuple(samples[param] for param in param_names)
+
+        cursor.execute("EXPLAIN FORMAT=JSON " + sql, params)
+        tables = list(plan_tables(json.loads(cursor.fetchone()[0])))
+        cursor.execute("EXPLAIN ANALYZE " + sql, params)
+        analyze = cursor.fetchone()[0]
+        match = ACTUAL_TIME.search(analyze)
+
+        rows = sum(int(table.get('rows_examined_per_scan', 0)) for table in tables)
+        plan = ', '.join(f"{t['table_name']}:{t.get('access_type')}/{t.get('key') or '-'}" for t in tables)
+        print(f"{name:<24}{float(match.group(1)) if match else 0.0:>10.2f}{rows:>12}  {plan}")
+        if args.verbose:
+            print('    ' + analyze.replace('\n', '\n    '))
+
+        for problem in check(name, tables, prefix):
+            regressions += 1
+            print(f"    REGRESSION {problem}")
+
+    print(f"\n{'index':<40}{'size MB':>10}")
+    for table in ('channels', 'reposts', 'reposts_archive', 'subscriber_history', 'subscriber_daily',
+                  'user_settings', 'abuse_reports'):
+        for index, size in index_sizes(cursor, prefix + table):
+            print(f"{prefix + table + '.' + index:<40}{size / 1024 / 1024:>10.2f}")
+
+    cursor.close()
+    conn.close()
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--platform', choices=('tg', 'vk', 'both'), default='both')
+    parser.add_argument('--deep-page', type=int, default=1000, help='admin page number for the deep pagination query')
+    parser.add_argument('--verbose', action='store_true', help='print the EXPLAIN ANALYZE trees')
+    args = parser.parse_args()
+    total = sum(
+        run_platform(name, args)
+        for name in (('tg', 'vk') if args.platform == 'both' else (args.platform,))
+    )
+    if total:
+        print(f"\n{total} plan regression(s)")
+        sys.exit(1)
+    print("\nAll plans as expected")
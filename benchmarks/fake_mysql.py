@@ -0,0 +1,219 @@
+"""In-process stand-in for the MySQL database, backed by SQLite.
+
+Only what the bots need is emulated: ``%s`` placeholders, dictionary
+cursors, a handful of MySQL functions and ``IntegrityError``. The schema
+below mirrors ``Database.init_db`` / ``VKDatabase.init_db`` in SQLite syntax
+and has to be kept in step with them.
+"""
+import os
+import re
+import sqlite3
+import tempfile
+from datetime import date, datetime
+
+import mysql.connector
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS {prefix}channels (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel_username VARCHAR(255) UNIQUE NOT NULL,
+    channel_id BIGINT,
+    owner_user_id BIGINT NOT NULL,
+    subscriber_count INT NOT NULL,
+    added_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    archived_confirmed INT NOT NULL DEFAULT 0,
+    archived_unconfirmed INT NOT NULL DEFAULT 0,
+    match_score FLOAT NOT NULL DEFAULT 0.5,
+    impressions INT NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS {prefix}channels_idx_owner ON {prefix}channels (owner_user_id);
+CREATE INDEX IF NOT EXISTS {prefix}channels_idx_subs_score ON {prefix}channels (subscriber_count, match_score, impressions);
+
+CREATE TABLE IF NOT EXISTS {prefix}reposts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    from_channel_id INTEGER NOT NULL REFERENCES {prefix}channels (id) ON DELETE CASCADE,
+    to_channel_id INTEGER NOT NULL REFERENCES {prefix}channels (id) ON DELETE CASCADE,
+    repost_channel VARCHAR(255) NULL,
+    from_user_id BIGINT NOT NULL,
+    to_user_id BIGINT NOT NULL,
+    status TEXT DEFAULT 'pending',
+    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    confirmed_date TIMESTAMP NULL
+);
+CREATE INDEX IF NOT EXISTS {prefix}reposts_idx_status_created ON {prefix}reposts (status, created_date);
+CREATE INDEX IF NOT EXISTS {prefix}reposts_idx_to_channel_status
+    ON {prefix}reposts (to_channel_id, status, from_channel_id, to_user_id, from_user_id);
+CREATE INDEX IF NOT EXISTS {prefix}reposts_idx_to_user_status
+    ON {prefix}reposts (to_user_id, status, created_date, from_channel_id, to_channel_id);
+-- MySQL enforces this through the generated pending_key column
+CREATE UNIQUE INDEX IF NOT EXISTS {prefix}reposts_uniq_pending_pair
+    ON {prefix}reposts (from_channel_id, to_channel_id) WHERE status = 'pending';
+
+CREATE TABLE IF NOT EXISTS {prefix}reposts_archive (
+    id INTEGER PRIMARY KEY,
+    from_channel_id INTEGER NOT NULL,
+    to_channel_id INTEGER NOT NULL,
+    repost_channel VARCHAR(255) NULL,
+    from_user_id BIGINT NOT NULL,
+    to_user_id BIGINT NOT NULL,
+    status TEXT NOT NULL,
+    created_date TIMESTAMP NULL,
+    confirmed_date TIMESTAMP NULL,
+    archived_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS {prefix}reposts_archive_idx_created ON {prefix}reposts_archive (created_date);
+
+CREATE TABLE IF NOT EXISTS {prefix}subscriber_history (
+    channel_id INTEGER NOT NULL REFERENCES {prefix}channels (id) ON DELETE CASCADE,
+    observed_at TIMESTAMP NOT NULL,
+    subscriber_count INT NOT NULL,
+    PRIMARY KEY (channel_id, observed_at)
+);
+
+CREATE TABLE IF NOT EXISTS {prefix}subscriber_daily (
+    channel_id INTEGER NOT NULL REFERENCES {prefix}channels (id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    min_count INT NOT NULL,
+    max_count INT NOT NULL,
+    last_count INT NOT NULL,
+    PRIMARY KEY (channel_id, day)
+);
+
+CREATE TABLE IF NOT EXISTS {prefix}subscriber_summary (
+    channel_id INTEGER PRIMARY KEY REFERENCES {prefix}channels (id) ON DELETE CASCADE,
+    count_7d INT NULL,
+    count_30d INT NULL,
+    refreshed_at TIMESTAMP NULL
+);
+
+CREATE TABLE IF NOT EXISTS {prefix}user_settings (
+    user_id BIGINT PRIMARY KEY,
+    digest TINYINT NOT NULL DEFAULT 0,
+    digest_sent_at TIMESTAMP NULL
+);
+CREATE INDEX IF NOT EXISTS {prefix}user_settings_idx_digest_due ON {prefix}user_settings (digest, digest_sent_at);
+
+CREATE TABLE IF NOT EXISTS {prefix}abuse_reports (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    reporter_user_id BIGINT NOT NULL,
+    channel_id INTEGER NULL REFERENCES {prefix}channels (id) ON DELETE SET NULL,
+    channel_username VARCHAR(255) NOT NULL,
+    reason TEXT NOT NULL,
+    report_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS {prefix}abuse_reports_idx_channel ON {prefix}abuse_reports (channel_username);
+CREATE INDEX IF NOT EXISTS {prefix}abuse_reports_idx_channel_id ON {prefix}abuse_reports (channel_id);
+'''
+
+# MySQL syntax -> SQLite syntax, applied to every statement
+TRANSLATIONS = [
+    (re.compile(r'%s'), '?'),
+    # RANDOM() is a signed 64-bit integer, the weighted order needs a uniform (0, 1]
+    (re.compile(r'\b1 - RAND\(\)', re.I), '(0.5 - RANDOM() / 18446744073709551616.0)'),
+    (re.compile(r'\bRAND\(\)', re.I), 'RANDOM()'),
+    (re.compile(r'\bNOW\(\)', re.I), "datetime('now')"),
+    # SQLite has no row locks, a write transaction already excludes other writers
+    (re.compile(r'\s+FOR UPDATE\b', re.I), ''),
+]
+
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.fromisoformat(value.decode('utf-8')))
+sqlite3.register_converter('DATE', lambda value: date.fromisoformat(value.decode('utf-8')))
+
+
+def translate(sql):
+    for pattern, replacement in TRANSLATIONS:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+class FakeCursor:
+
+    def __init__(self, conn, dictionary=False):
+        self._cursor = conn.cursor()
+        self._dictionary = dictionary
+
+    def execute(self, sql, params=()):
+        try:
+            self._cursor.execute(translate(sql), tuple(params or ()))
+        except sqlite3.IntegrityError as e:
+            raise mysql.connector.IntegrityError(msg=str(e), errno=1062)
+
+    def executemany(self, sql, seq_params):
+        try:
+            self._cursor.executemany(translate(sql), [tuple(params) for params in seq_params])
+        except sqlite3.IntegrityError as e:
+            raise mysql.connector.IntegrityError(msg=str(e), errno=1062)
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return {column[0]: value for column, value in zip(self._cursor.description, row)}
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def close(self):
+        self._cursor.close()
+
+
+class FakeConnection:
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, timeout=30, detect_types=sqlite3.PARSE_DECLTYPES,
+                                     check_same_thread=False)
+        self._conn.execute('PRAGMA foreign_keys = ON')
+
+    def cursor(self, dictionary=False, **kwargs):
+        return FakeCursor(self._conn, dictionary)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def start_transaction(self):
+        pass
+
+    def close(self):
+        self._conn.close()
+
+    def is_connected(self):
+        return True
+
+
+class FakeDatabase:
+    """A temporary SQLite file with the bot schema for one table prefix ('' or 'vk_')"""
+
+    def __init__(self, prefix='', path=None):
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix='bench_', suffix='.sqlite3')
+            os.close(fd)
+        self.path = path
+        conn = sqlite3.connect(path)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.executescript(SCHEMA.format(prefix=prefix))
+        conn.commit()
+        conn.close()
+
+    def connect(self):
+        return FakeConnection(self.path)
+
+    def remove(self):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
@@ -0,0 +1,82 @@
+"""Stand-in for the Telegram Bot API used by the benchmark harness.
+
+``FakeTelegramRequest`` plugs into ``main.build_application(request=...)``
+in place of the HTTP transport, answers the Bot API methods the handlers
+use and records every call with a configurable artificial latency.
+"""
+import asyncio
+import json
+import time
+import zlib
+from collections import Counter
+
+from telegram.request import BaseRequest
+
+BOT_USER = {'id': 777000, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+
+
+def chat_id_for(username):
+    """Stable fake channel id for a channel username"""
+    return -1000000000000 - zlib.crc32(username.lower().encode('utf-8'))
+
+
+def subscribers_for(chat_id):
+    """Stable fake subscriber count for a channel id"""
+    return 100 + abs(chat_id) % 50000
+
+
+class FakeTelegramRequest(BaseRequest):
+    """Answers Bot API calls locally and records them"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.sent_messages = []
+        self._message_id = 0
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[api_method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        result = self.answer(api_method, params)
+        return 200, json.dumps({'ok': True, 'result': result}).encode('utf-8')
+
+    def answer(self, api_method, params):
+        if api_method == 'getMe':
+            return BOT_USER
+        if api_method == 'getChat':
+            chat_id = params['chat_id']
+            if isinstance(chat_id, str):
+                chat_id = chat_id_for(chat_id)
+            return {'id': chat_id, 'type': 'channel', 'title': str(params['chat_id']),
+                    'accent_color_id': 0, 'max_reaction_count': 11}
+        if api_method == 'getChatMember':
+            return {'status': 'creator', 'user': BOT_USER, 'is_anonymous': False}
+        if api_method == 'getChatMemberCount':
+            chat_id = params['chat_id']
+            if isinstance(chat_id, str) and chat_id.startswith('@'):
+                chat_id = chat_id_for(chat_id)
+            return subscribers_for(int(chat_id))
+        if api_method in ('sendMessage', 'editMessageText'):
+            self._message_id += 1
+            self.sent_messages.append((params.get('chat_id'), params.get('text')))
+            return {
+                'message_id': params.get('message_id', self._message_id),
+                'date': int(time.time()),
+                'chat': {'id': params.get('chat_id', 0), 'type': 'private'},
+                'text': params.get('text', ''),
+            }
+        return True
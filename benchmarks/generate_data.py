@@ -0,0 +1,92 @@
+"""Fill the bot databases with synthetic data for scale tests.
+
+Creates the schema through ``Database.init_db`` / ``VKDatabase.init_db`` and
+fills ``channels``, ``reposts``, ``abuse_reports``, ``subscriber_history``,
+``user_settings`` and their ``vk_`` twins
+in the MySQL databases configured in ``.env``. Subscriber counts follow a
+power law and abuse reports concentrate on a few channels, like in
+production. Sizes up to 1M channels and 10M reposts per platform are
+supported (rows are streamed in batches).
+
+    python benchmarks/generate_data.py --channels 1000000 --reposts 10000000 --reports 50000
+
+With ``--sqlite DIR`` the SQLite stand-ins are written to DIR instead.
+"""
+import argparse
+import os
+import random
+import time
+
+import common  # noqa: F401  (environment and sys.path)
+
+import main
+import vk_bot
+from fake_mysql import FakeDatabase
+from seed_data import seed_channels, seed_history, seed_reports, seed_reposts, seed_settings
+
+PLATFORMS = {
+    # platform: (table prefix, database class)
+    'tg': ('', main.Database),
+    'vk': ('vk_', vk_bot.VKDatabase),
+}
+
+
+def connect(platform, args):
+    prefix, database = PLATFORMS[platform]
+    if args.sqlite:
+        return FakeDatabase(prefix, os.path.join(args.sqlite, f'{platform}.sqlite3')).connect()
+    database.init_db()
+    return database.get_connection()
+
+
+def truncate(conn, prefix):
+    cursor = conn.cursor()
+    for table in ('abuse_reports', 'reposts_archive', 'reposts', 'subscriber_summary', 'subscriber_daily',
+                  'subscriber_history', 'user_settings', 'channels'):
+        cursor.execute(f"DELETE FROM {prefix}{table}")
+    conn.commit()
+    cursor.close()
+
+
+def timed(label, func, *args):
+    start = time.perf_counter()
+    rows = func(*args)
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<14}{rows:>10} rows in {elapsed:8.1f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)")
+
+
+def generate(platform, args):
+    prefix = PLATFORMS[platform][0]
+    conn = connect(platform, args)
+    if not conn:
+        raise SystemExit(f"Cannot connect to the {platform} database")
+    rng = random.Random(args.seed)
+    print(f"{platform}: {args.channels} channels, ~{args.reposts} reposts, {args.reports} reports")
+    if args.truncate:
+        truncate(conn, prefix)
+    timed('channels', seed_channels, conn, args.channels, args.channels_per_owner, rng, prefix)
+    timed('reposts', seed_reposts, conn, args.channels, args.reposts, args.channels_per_owner, rng, prefix)
+    timed('abuse_reports', seed_reports, conn, args.channels, args.reports, rng, prefix)
+    if args.history:
+        timed('history', seed_history, conn, args.history, rng, prefix)
+    if args.digest_share:
+        timed('user_settings', seed_settings, conn, args.channels, args.channels_per_owner, args.digest_share,
+              rng, prefix)
+    conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--platform', choices=('tg', 'vk', 'both'), default='both')
+    parser.add_argument('--channels', type=int, default=100000)
+    parser.add_argument('--reposts', type=int, default=1000000)
+    parser.add_argument('--reports', type=int, default=10000)
+    parser.add_argument('--history', type=int, default=5, help='subscriber count observations per channel')
+    parser.add_argument('--digest-share', type=float, default=0.1, help='share of owners with digests enabled')
+    parser.add_argument('--channels-per-owner', type=int, default=3)
+    parser.add_argument('--truncate', action='store_true', help='delete existing rows first')
+    parser.add_argument('--sqlite', metavar='DIR', help='write SQLite stand-ins to DIR instead of MySQL')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    for name in (('tg', 'vk') if args.platform == 'both' else (args.platform,)):
+        generate(name, args)
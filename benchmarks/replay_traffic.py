@@ -0,0 +1,215 @@
+"""Replay recorded production traffic through the bots.
+
+Reads files written with ``TRAFFIC_RECORD_FILE`` and pushes every message
+back through the Telegram handlers (fake Bot API) and the VK callback
+endpoint (VK API stub), keeping the recorded timing scaled by ``--speed``:
+1 replays in real time, 10 ten times faster, 0 as fast as possible.
+Channels mentioned in the recording are seeded into SQLite stand-ins on
+top of ``--channels`` filler channels, so lookups hit like in production.
+
+    python benchmarks/replay_traffic.py tg_traffic.jsonl vk_traffic.jsonl --speed 10
+"""
+import argparse
+import asyncio
+import logging
+import random
+import re
+import threading
+import time
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+from common import percentile
+
+import main
+import vk_bot
+from bench_tg_handlers import make_update
+from fake_mysql import FakeDatabase
+from fake_telegram import FakeTelegramRequest, chat_id_for
+from rate_limiter import RateLimiter
+from seed_data import insert_batches, seed_channels, seed_reposts, subscriber_count
+from traffic_recorder import HASH_PREFIX, read_recording
+from vk_load import message_payload, start_bot, start_stub
+
+HASHED_WORD = re.compile(rf'^@?{HASH_PREFIX}[0-9a-f]{{10}}$')
+ADD_COMMANDS = {'tg': '/add', 'vk': 'добавить'}
+PREFIXES = {'tg': '', 'vk': 'vk_'}
+
+
+def load(paths):
+    """Return {platform: [entry, ...]} ordered by time"""
+    entries = defaultdict(list)
+    for path in paths:
+        for entry in read_recording(path):
+            entries[entry['p']].append(entry)
+    for platform_entries in entries.values():
+        platform_entries.sort(key=lambda entry: entry['t'])
+    return entries
+
+
+def mentioned_channels(platform, entries):
+    """Hashed channel names and the first user who mentioned them, minus channels the recording adds itself"""
+    channels = {}
+    added = set()
+    for entry in entries:
+        words = entry['x'].split()
+        for word in words[1:]:
+            if not HASHED_WORD.match(word) or word in channels or word in added:
+                continue
+            if words[0] == ADD_COMMANDS[platform]:
+                added.add(word)
+            else:
+                channels[word] = entry['u']
+    return channels
+
+
+def prepare_database(platform, entries, args, rng):
+    prefix = PREFIXES[platform]
+    db = FakeDatabase(prefix=prefix)
+    conn = db.connect()
+    seed_channels(conn, args.channels, 3, rng, prefix)
+    seed_reposts(conn, args.channels, args.channels * 10, 3, rng, prefix)
+
+    now = datetime.now()
+    rows = [
+        (name, str(chat_id_for(name) if platform == 'tg' else zlib.crc32(name.encode('utf-8'))), owner,
+         subscriber_count(rng), now)
+        for name, owner in mentioned_channels(platform, entries).items()
+    ]
+    cursor = conn.cursor()
+    insert_batches(
+        conn, cursor,
+        f"INSERT INTO {prefix}channels (channel_username, channel_id, owner_user_id, subscriber_count, added_date) "
+        "VALUES (%s, %s, %s, %s, %s)",
+        rows
+    )
+    cursor.close()
+    conn.close()
+    print(f"{platform}: {len(entries)} messages, {len(rows)} recorded channels + {args.channels} filler channels")
+    return db
+
+
+def schedule_offsets(entries, speed):
+    """Offsets from the start of the replay, all zero at maximum speed"""
+    start = entries[0]['t']
+    return [(entry['t'] - start) / speed if speed else 0.0 for entry in entries]
+
+
+def tg_command(text):
+    return text.split()[0][1:].split('@')[0].lower() if text.startswith('/') else 'text'
+
+
+async def replay_tg(entries, args, stats):
+    request = FakeTelegramRequest(latency=args.latency / 1000)
+    application = main.build_application(request=request)
+    await application.initialize()
+    try:
+        start = time.perf_counter()
+        # Updates are processed one at a time, as the application does by default
+        for update_id, (entry, offset) in enumerate(zip(entries, schedule_offsets(entries, args.speed)), 1):
+            scheduled = start + offset
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            update = make_update(application.bot, update_id, entry['u'], entry['x'])
+            await application.process_update(update)
+            stats[tg_command(entry['x'])].append((time.perf_counter() - scheduled, True))
+        return time.perf_counter() - start
+    finally:
+        await application.shutdown()
+
+
+def replay_vk(entries, args, bot_url, stats):
+    lock = threading.Lock()
+    local = threading.local()
+
+    def post(scheduled, command, payload):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        try:
+            response = local.session.post(f'{bot_url}/vk_callback', json=payload, timeout=30)
+            ok = response.status_code == 200 and response.text == 'ok'
+        except requests.RequestException:
+            ok = False
+        with lock:
+            stats[command].append((time.perf_counter() - scheduled, ok))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for event_id, (entry, offset) in enumerate(zip(entries, schedule_offsets(entries, args.speed)), 1):
+            scheduled = start + offset
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            route = vk_bot.vk_router.resolve(entry['x'])
+            command = route[0] if route else 'unknown'
+            pool.submit(post, scheduled, command, message_payload(event_id, entry['u'], entry['x']))
+    return time.perf_counter() - start
+
+
+def report(platform, entries, stats, elapsed):
+    recorded = entries[-1]['t'] - entries[0]['t']
+    print(f"\n{platform}: replayed {len(entries)} messages in {elapsed:.1f}s "
+          f"(recorded over {recorded:.1f}s), {len(entries) / elapsed:.1f} msg/s")
+    print(f"{'command':<10}{'count':>8}{'errors':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for command, samples in sorted(stats.items(), key=lambda item: -len(item[1])):
+        latencies = sorted(latency for latency, _ in samples)
+        errors = sum(1 for _, ok in samples if not ok)
+        print(
+            f"{command:<10}{len(samples):>8}{errors / len(samples) * 100:>8.2f}%"
+            f"{percentile(latencies, 50) * 1000:>9.2f}{percentile(latencies, 95) * 1000:>9.2f}"
+            f"{percentile(latencies, 99) * 1000:>9.2f}"
+        )
+
+
+def run(args):
+    logging.getLogger().setLevel(logging.WARNING)
+    rng = random.Random(args.seed)
+    recordings = load(args.files)
+    databases = []
+
+    # Replays measure the handlers, not the anti-flood guard, and must not record themselves
+    main.rate_limiter = vk_bot.rate_limiter = RateLimiter({'default': (10 ** 9, 1)})
+    main.traffic_recorder = vk_bot.traffic_recorder = None
+
+    try:
+        entries = recordings.get('tg')
+        if entries:
+            tg_db = prepare_database('tg', entries, args, rng)
+            databases.append(tg_db)
+            main.Database.get_connection = staticmethod(lambda: main.InstrumentedConnection(tg_db.connect()))
+            stats = defaultdict(list)
+            elapsed = asyncio.run(replay_tg(entries, args, stats))
+            report('tg', entries, stats, elapsed)
+
+        entries = recordings.get('vk')
+        if entries:
+            vk_db = prepare_database('vk', entries, args, rng)
+            admin_db = FakeDatabase()
+            databases += [vk_db, admin_db]
+            bot_url = start_bot(vk_db, admin_db, start_stub(args))
+            logging.disable(logging.INFO)
+            stats = defaultdict(list)
+            elapsed = replay_vk(entries, args, bot_url, stats)
+            report('vk', entries, stats, elapsed)
+    finally:
+        for db in databases:
+            db.remove()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='+', help='recordings written by TRAFFIC_RECORD_FILE')
+    parser.add_argument('--speed', type=float, default=1, help='1 = real time, 10 = ten times faster, 0 = maximum')
+    parser.add_argument('--channels', type=int, default=1000, help='filler channels per platform')
+    parser.add_argument('--workers', type=int, default=32, help='concurrent VK callback requests')
+    parser.add_argument('--latency', type=float, default=0.0, help='fake Bot API latency, ms')
+    parser.add_argument('--api-latency', type=float, default=20, help='stub VK API latency, ms')
+    parser.add_argument('--api-error-rate', type=float, default=0.0)
+    parser.add_argument('--api-http-error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=1)
+    run(parser.parse_args())
@@ -0,0 +1,205 @@
+"""Synthetic catalog data shared by the benchmark scripts"""
+from datetime import datetime, timedelta
+
+from fake_telegram import chat_id_for
+
+USERS_BASE = 10000
+REPORTERS_BASE = 5000000
+BATCH_SIZE = 1000
+HISTORY_MINUTES = 60 * 24 * 60
+REPORT_REASONS = (
+    'Не сделал репост',
+    'Удалил репост через час',
+    'Накрученные подписчики',
+    'Запрещённый контент',
+    'Спам в комментариях',
+)
+
+
+def channel_name(index, prefix=''):
+    """Telegram channels are '@bench_N', VK groups are 'bench_N'"""
+    return f"{'' if prefix else '@'}bench_{index}"
+
+
+def owner_of(index, channels_per_owner):
+    return USERS_BASE + index // channels_per_owner
+
+
+def subscriber_count(rng):
+    """Power-law (Pareto) audience size, most channels are small"""
+    return min(int(100 * rng.paretovariate(1.2)), 5000000)
+
+
+def insert_batches(conn, cursor, sql, rows):
+    """Insert rows from an iterable in batches, committing after each one; return the row count"""
+    batch = []
+    total = 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            cursor.executemany(sql, batch)
+            conn.commit()
+            total += len(batch)
+            batch = []
+    if batch:
+        cursor.executemany(sql, batch)
+        conn.commit()
+        total += len(batch)
+    return total
+
+
+def channel_rows(channels, channels_per_owner, rng, prefix='', start=0):
+    now = datetime.now()
+    for i in range(start, start + channels):
+        name = channel_name(i, prefix)
+        channel_id = str(1000000 + i) if prefix else chat_id_for(name)
+        added = now - timedelta(minutes=rng.randrange(HISTORY_MINUTES))
+        yield name, channel_id, owner_of(i, channels_per_owner), subscriber_count(rng), added
+
+
+def repost_rows(channels, reposts, channels_per_owner, rng, pending_share=0.4):
+    """Random pairs of channels with different owners; ~reposts rows, self-pairs are dropped.
+
+    A pair has at most one pending row, like the unique pending pair index requires.
+    """
+    now = datetime.now()
+    pending_pairs = set()
+    for _ in range(reposts):
+        from_index = rng.randrange(channels)
+        to_index = rng.randrange(channels)
+        if owner_of(from_index, channels_per_owner) == owner_of(to_index, channels_per_owner):
+            continue
+        created = now - timedelta(minutes=rng.randrange(HISTORY_MINUTES))
+        pair = from_index * channels + to_index
+        if rng.random() < pending_share and pair not in pending_pairs:
+            pending_pairs.add(pair)
+            status, confirmed = 'pending', None
+        else:
+            status, confirmed = 'confirmed', created + timedelta(minutes=rng.randrange(1, 60 * 24))
+        yield (
+            from_index, to_index, owner_of(from_index, channels_per_owner),
+            owner_of(to_index, channels_per_owner), status, created, confirmed,
+        )
+
+
+def report_rows(channels, reports, rng):
+    """Reports pile up on a few channels, following a power law over channel indexes"""
+    now = datetime.now()
+    for i in range(reports):
+        index = min(int(rng.paretovariate(1.0)) - 1, channels - 1)
+        reason = rng.choice(REPORT_REASONS)
+        yield REPORTERS_BASE + i, index, reason, now - timedelta(minutes=rng.randrange(HISTORY_MINUTES))
+
+
+def history_rows(ids, observations, rng):
+    """A random walk of subscriber counts per channel at distinct minutes of the history window"""
+    now = datetime.now()
+    for channel_id in ids:
+        count = subscriber_count(rng)
+        for minutes in sorted(rng.sample(range(HISTORY_MINUTES), observations), reverse=True):
+            count = max(count + int(rng.gauss(0, count * 0.02 + 1)), 0)
+            yield channel_id, (now - timedelta(minutes=minutes)).replace(second=0, microsecond=0), count
+
+
+def seed_channels(conn, channels, channels_per_owner, rng, prefix=''):
+    cursor = conn.cursor()
+    total = insert_batches(
+        conn, cursor,
+        f"INSERT INTO {prefix}channels (channel_username, channel_id, owner_user_id, subscriber_count, added_date) "
+        "VALUES (%s, %s, %s, %s, %s)",
+        channel_rows(channels, channels_per_owner, rng, prefix)
+    )
+    cursor.close()
+    return total
+
+
+def channel_ids(conn, prefix=''):
+    """Map of channel username to id"""
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT channel_username, id FROM {prefix}channels")
+    ids = dict(cursor.fetchall())
+    cursor.close()
+    return ids
+
+
+def seed_reposts(conn, channels, reposts, channels_per_owner, rng, prefix=''):
+    ids = channel_ids(conn, prefix)
+    cursor = conn.cursor()
+    rows = (
+        (ids[channel_name(f, prefix)], ids[channel_name(t, prefix)], channel_name(f, prefix), fu, tu,
+         status, created, confirmed)
+        for f, t, fu, tu, status, created, confirmed in repost_rows(channels, reposts, channels_per_owner, rng)
+    )
+    total = insert_batches(
+        conn, cursor,
+        f"INSERT INTO {prefix}reposts (from_channel_id, to_channel_id, repost_channel, from_user_id, to_user_id, "
+        "status, created_date, confirmed_date) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+        rows
+    )
+    cursor.close()
+    return total
+
+
+def seed_history(conn, observations, rng, prefix=''):
+    ids = sorted(channel_ids(conn, prefix).values())
+    cursor = conn.cursor()
+    total = insert_batches(
+        conn, cursor,
+        f"INSERT INTO {prefix}subscriber_history (channel_id, observed_at, subscriber_count) VALUES (%s, %s, %s)",
+        history_rows(ids, observations, rng)
+    )
+    cursor.close()
+    return total
+
+
+def seed_settings(conn, channels, channels_per_owner, digest_share, rng, prefix=''):
+    """Digests for a share of owners, each last sent at a random point of the past day"""
+    now = datetime.now()
+    owners = range(owner_of(0, channels_per_owner), owner_of(channels - 1, channels_per_owner) + 1)
+    cursor = conn.cursor()
+    total = insert_batches(
+        conn, cursor,
+        f"INSERT INTO {prefix}user_settings (user_id, digest, digest_sent_at) VALUES (%s, 1, %s)",
+        (
+            (owner, now - timedelta(minutes=rng.randrange(60 * 24)))
+            for owner in owners if rng.random() < digest_share
+        )
+    )
+    cursor.close()
+    return total
+
+
+def seed_reports(conn, channels, reports, rng, prefix=''):
+    ids = channel_ids(conn, prefix)
+    cursor = conn.cursor()
+    rows = (
+        (reporter, ids[channel_name(index, prefix)], channel_name(index, prefix), reason, date)
+        for reporter, index, reason, date in report_rows(channels, reports, rng)
+    )
+    total = insert_batches(
+        conn, cursor,
+        f"INSERT INTO {prefix}abuse_reports (reporter_user_id, channel_id, channel_username, reason, report_date) "
+        "VALUES (%s, %s, %s, %s, %s)",
+        rows
+    )
+    cursor.close()
+    return total
+
+
+def seed(conn, channels, reposts, channels_per_owner, rng, prefix='', reports=0):
+    """Fill {prefix}channels, {prefix}reposts and {prefix}abuse_reports, return the pending (from, to, to_user_id) rows"""
+    seed_channels(conn, channels, channels_per_owner, rng, prefix)
+    seed_reposts(conn, channels, reposts, channels_per_owner, rng, prefix)
+    if reports:
+        seed_reports(conn, channels, reports, rng, prefix)
+
+    cursor = conn.cursor()
+    cursor.execute(
+        f"SELECT f.channel_username, t.channel_username, r.to_user_id FROM {prefix}reposts r "
+        f"JOIN {prefix}channels f ON f.id = r.from_channel_id "
+        f"JOIN {prefix}channels t ON t.id = r.to_channel_id "
+        "WHERE r.status = 'pending'"
+    )
+    pending = cursor.fetchall()
+    cursor.close()
+    return pending
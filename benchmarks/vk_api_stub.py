@@ -0,0 +1,95 @@
+"""Local stub of the VK API for load tests.
+
+Implements ``messages.send``, ``groups.getById`` and ``execute`` with a
+configurable latency and error injection. Point the bot at it with
+``VK_API_URL=http://127.0.0.1:8081/method``.
+
+    python benchmarks/vk_api_stub.py --port 8081 --latency 30 --error-rate 0.01
+"""
+import argparse
+import random
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+
+from flask import Flask, jsonify, request
+
+EXECUTE_CALL = re.compile(r'API\.([A-Za-z]+\.[A-Za-z]+)\(')
+
+
+def group_for(screen_name):
+    """Stable fake group for a screen name or numeric id"""
+    screen_name = str(screen_name)
+    group_id = int(screen_name[4:]) if screen_name.startswith('club') and screen_name[4:].isdigit() else \
+        100000 + zlib.crc32(screen_name.encode('utf-8')) % 10000000
+    return {
+        'id': group_id,
+        'screen_name': screen_name,
+        'name': screen_name,
+        'members_count': 100 + zlib.crc32(screen_name.encode('utf-8')) % 50000,
+    }
+
+
+def create_app(latency=0.0, error_rate=0.0, http_error_rate=0.0, seed=None):
+    """Build the stub app; latency in seconds, error rates as fractions of requests"""
+    app = Flask(__name__)
+    rng = random.Random(seed)
+    lock = threading.Lock()
+    stats = Counter()
+    message_ids = iter(range(1, 10 ** 12))
+
+    def method_result(method, params):
+        if method == 'messages.send':
+            with lock:
+                return next(message_ids)
+        if method == 'messages.sendMessageEventAnswer':
+            return 1
+        if method == 'groups.getById':
+            names = params.get('group_ids') or params.get('group_id') or ''
+            return {'groups': [group_for(name) for name in str(names).split(',') if name]}
+        if method == 'wall.get':
+            return {'count': 0, 'items': []}
+        return 1
+
+    @app.route('/method/<method>', methods=['GET', 'POST'])
+    def call(method):
+        params = request.values.to_dict()
+        with lock:
+            stats[method] += 1
+            roll = rng.random()
+        if latency:
+            time.sleep(latency)
+        if roll < http_error_rate:
+            with lock:
+                stats['http_errors'] += 1
+            return 'Internal Server Error', 500
+        if roll < http_error_rate + error_rate:
+            with lock:
+                stats['api_errors'] += 1
+            return jsonify({'error': {'error_code': 10, 'error_msg': 'Internal server error'}})
+        if method == 'execute':
+            calls = EXECUTE_CALL.findall(params.get('code', ''))
+            return jsonify({'response': [method_result(name, {}) for name in calls]})
+        return jsonify({'response': method_result(method, params)})
+
+    @app.route('/stats')
+    def show_stats():
+        with lock:
+            return jsonify(dict(stats))
+
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0, help='ms per call')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of VK API errors')
+    parser.add_argument('--http-error-rate', type=float, default=0.0, help='fraction of HTTP 500 responses')
+    args = parser.parse_args()
+    create_app(args.latency / 1000, args.error_rate, args.http_error_rate).run(
+        host=args.host, port=args.port, threaded=True
+    )
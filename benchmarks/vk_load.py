@@ -0,0 +1,256 @@
+"""Load driver for the VK bot callback endpoint and admin pages.
+
+POSTs realistic ``message_new`` payloads to ``/vk_callback`` at a fixed
+rate (open loop, latency counted from the scheduled send time) and, in
+parallel, fetches admin pages. Reports throughput, latency distribution and
+error rate for both.
+
+By default everything runs in-process: the VK API stub, a SQLite stand-in
+for both databases seeded with synthetic data, and the bot's Flask app.
+With ``--url`` the driver targets an already running bot instead (start it
+with ``VK_API_URL`` pointing to ``vk_api_stub.py``).
+
+    python benchmarks/vk_load.py --rate 50 --duration 20 --admin-rate 2
+"""
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from werkzeug.serving import make_server
+
+from common import percentile
+
+MESSAGE_MIX = (
+    ('find', 25), ('list', 15), ('stat', 10), ('my', 10), ('done', 15),
+    ('confirm', 10), ('help', 5), ('button', 5), ('unknown', 5),
+)
+ADMIN_PAGES = [
+    {'platform': platform, 'section': section, 'page': page}
+    for platform in ('telegram', 'vk')
+    for section in ('channels', 'reposts', 'reports')
+    for page in (1, 2, 5)
+]
+
+
+def serve(app):
+    """Run a WSGI app on an ephemeral port in a daemon thread, return its base URL"""
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', server
+
+
+def start_stub(args):
+    """Start the VK API stub, return its base URL"""
+    from vk_api_stub import create_app
+
+    stub_url, _ = serve(create_app(args.api_latency / 1000, args.api_error_rate, args.api_http_error_rate))
+    return stub_url
+
+
+def start_bot(vk_db, tg_db, stub_url, admin_password=''):
+    """Serve the bot against the given databases and VK API stub, return its base URL"""
+    from metrics import InstrumentedConnection
+    from rate_limiter import RateLimiter
+    import vk_bot
+
+    vk_bot.VKDatabase.get_connection = staticmethod(lambda: InstrumentedConnection(vk_db.connect()))
+    vk_bot.TGDatabase.get_connection = staticmethod(lambda: InstrumentedConnection(tg_db.connect()))
+    vk_bot.VK_API_URL = stub_url + '/method'
+    vk_bot.ADMIN_PASSWORD = admin_password
+    vk_bot.traffic_recorder = None
+    # The driver measures the handlers, not the anti-flood guard
+    vk_bot.rate_limiter = RateLimiter({'default': (10 ** 9, 1)})
+
+    bot_url, _ = serve(vk_bot.app)
+    return bot_url
+
+
+def start_local_bot(args):
+    """Start the stub VK API and the bot with seeded SQLite databases, return (bot url, stub url, databases)"""
+    from fake_mysql import FakeDatabase
+    from seed_data import seed
+
+    stub_url = start_stub(args)
+    rng = random.Random(args.seed)
+    vk_db = FakeDatabase(prefix='vk_')
+    tg_db = FakeDatabase()
+    for db, prefix in ((vk_db, 'vk_'), (tg_db, '')):
+        conn = db.connect()
+        seed(conn, args.channels, args.reposts, 3, rng, prefix=prefix)
+        conn.close()
+
+    bot_url = start_bot(vk_db, tg_db, stub_url, args.admin_password)
+    return bot_url, stub_url, (vk_db, tg_db)
+
+
+def message_text(kind, rng, channels):
+    group = f'bench_{rng.randrange(channels)}'
+    other = f'bench_{rng.randrange(channels)}'
+    return {
+        'find': f'найти {group}',
+        'list': 'список',
+        'stat': 'статистика',
+        'my': 'мои',
+        'done': f'готово {other} {group}',
+        'confirm': f'подтвердить {group} {other}',
+        'help': 'помощь',
+        'button': '📊 Статистика',
+        'unknown': 'привет! как дела?',
+    }[kind]
+
+
+def message_payload(event_id, user_id, text, command=None):
+    """A message_new callback as VK sends it; command fills the button payload"""
+    message = {
+        'date': int(time.time()),
+        'from_id': user_id,
+        'id': event_id,
+        'out': 0,
+        'peer_id': user_id,
+        'text': text,
+        'conversation_message_id': event_id,
+        'fwd_messages': [],
+        'important': False,
+        'random_id': 0,
+        'attachments': [],
+        'is_hidden': False,
+    }
+    if command:
+        message['payload'] = json.dumps({'command': command})
+    return {
+        'type': 'message_new',
+        'object': {
+            'message': message,
+            'client_info': {'button_actions': ['text', 'callback'], 'keyboard': True, 'inline_keyboard': True},
+        },
+        'group_id': 1,
+        'event_id': f'{event_id:040x}',
+        'v': '5.199',
+    }
+
+
+def make_payload(event_id, rng, channels):
+    kind = rng.choices([k for k, _ in MESSAGE_MIX], [w for _, w in MESSAGE_MIX])[0]
+    user_id = 10000 + rng.randrange(max(channels // 3, 1))
+    command = 'статистика' if kind == 'button' else None
+    return message_payload(event_id, user_id, message_text(kind, rng, channels), command)
+
+
+class Recorder:
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def add(self, latency, ok):
+        with self.lock:
+            self.latencies.append(latency)
+            if not ok:
+                self.errors += 1
+
+    def report(self, name, elapsed):
+        latencies = sorted(self.latencies)
+        count = len(latencies)
+        if not count:
+            print(f"{name:<10}no requests")
+            return
+        print(
+            f"{name:<10}{count:>8}{count / elapsed:>9.1f}{self.errors / count * 100:>8.2f}%"
+            f"{percentile(latencies, 50) * 1000:>9.1f}{percentile(latencies, 95) * 1000:>9.1f}"
+            f"{percentile(latencies, 99) * 1000:>9.1f}{latencies[-1] * 1000:>9.1f}"
+        )
+
+
+def admin_session(url, password):
+    session = requests.Session()
+    session.post(f'{url}/bot_admin/login', data={'password': password}, allow_redirects=False)
+    return session.cookies.get_dict()
+
+
+def run(args):
+    stub_url = None
+    databases = ()
+    if args.url:
+        bot_url = args.url.rstrip('/')
+    else:
+        bot_url, stub_url, databases = start_local_bot(args)
+    # Per-request access and message logs would dominate the measurement
+    logging.disable(logging.INFO)
+
+    cookies = admin_session(bot_url, args.admin_password) if args.admin_rate and args.admin_password else None
+    local = threading.local()
+    callback_stats = Recorder()
+    admin_stats = Recorder()
+    rng = random.Random(args.seed)
+
+    def session():
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        return local.session
+
+    def post_callback(scheduled, payload):
+        try:
+            response = session().post(f'{bot_url}/vk_callback', json=payload, timeout=30)
+            ok = response.status_code == 200 and response.text == 'ok'
+        except requests.RequestException:
+            ok = False
+        callback_stats.add(time.perf_counter() - scheduled, ok)
+
+    def get_admin(scheduled, params):
+        try:
+            response = session().get(f'{bot_url}/bot_admin', params=params, cookies=cookies, timeout=30)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        admin_stats.add(time.perf_counter() - scheduled, ok)
+
+    # Open-loop schedule of both streams, merged by time
+    schedule = [(i / args.rate, 'callback') for i in range(int(args.rate * args.duration))]
+    if cookies is not None:
+        schedule += [(i / args.admin_rate, 'admin') for i in range(int(args.admin_rate * args.duration))]
+    schedule.sort()
+
+    print(f"Driving {bot_url} for {args.duration}s: {args.rate} callbacks/s, {args.admin_rate} admin pages/s")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for event_id, (offset, kind) in enumerate(schedule, 1):
+            scheduled = start + offset
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if kind == 'callback':
+                pool.submit(post_callback, scheduled, make_payload(event_id, rng, args.channels))
+            else:
+                pool.submit(get_admin, scheduled, ADMIN_PAGES[event_id % len(ADMIN_PAGES)])
+    elapsed = time.perf_counter() - start
+
+    print(f"\n{'stream':<10}{'sent':>8}{'req/s':>9}{'errors':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    callback_stats.report('callback', elapsed)
+    admin_stats.report('admin', elapsed)
+    if stub_url:
+        print(f"\nVK API calls: {requests.get(f'{stub_url}/stats').json()}")
+    for db in databases:
+        db.remove()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='base URL of a running bot; omit to start one in-process')
+    parser.add_argument('--rate', type=float, default=20, help='callbacks per second')
+    parser.add_argument('--admin-rate', type=float, default=1, help='admin page views per second')
+    parser.add_argument('--admin-password', default='bench')
+    parser.add_argument('--duration', type=float, default=10, help='seconds')
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--channels', type=int, default=1000, help='seeded groups (in-process mode)')
+    parser.add_argument('--reposts', type=int, default=10000, help='seeded reposts (in-process mode)')
+    parser.add_argument('--api-latency', type=float, default=20, help='stub VK API latency, ms')
+    parser.add_argument('--api-error-rate', type=float, default=0.0)
+    parser.add_argument('--api-http-error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=1)
+    run(parser.parse_args())
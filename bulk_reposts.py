@@ -0,0 +1,128 @@
+"""Database side of the bulk /done and /confirm_all commands, shared by both bots"""
+from subscriber_history import record_observations
+
+# Target channels accepted by one bulk /done
+MAX_TARGETS = 20
+# Pending reposts confirmed by one /confirm_all, the oldest first
+MAX_CONFIRM = 100
+
+
+def split_bulk_args(args, keyword):
+    """Split 'a b c <keyword> mine' into ([a, b, c], mine); None without the keyword, (targets, None) when malformed"""
+    lowered = [arg.lower() for arg in args]
+    if keyword not in lowered:
+        return None
+    index = lowered.index(keyword)
+    rest = args[index + 1:]
+    return args[:index], rest[0] if len(rest) == 1 else None
+
+
+def unique_names(names):
+    """Names without repeats, compared case-insensitively like the catalog; pass them normalized"""
+    first = {}
+    for name in names:
+        first.setdefault(name.lower(), name)
+    return list(first.values())
+
+
+def load_channels(cursor, prefix, usernames):
+    """Catalog rows for usernames with the owner's digest flag, keyed by lowercase username"""
+    cursor.execute(
+        "SELECT c.id, c.channel_id, c.channel_username, c.owner_user_id, COALESCE(s.digest, 0) AS digest "
+        f"FROM {prefix}channels c LEFT JOIN {prefix}user_settings s ON s.user_id = c.owner_user_id "
+        f"WHERE c.channel_username IN ({', '.join(['%s'] * len(usernames))})",
+        usernames
+    )
+    return {row['channel_username'].lower(): row for row in cursor.fetchall()}
+
+
+def create_pending(conn, cursor, prefix, user_id, own, targets):
+    """Insert a pending repost from own to every target row in one transaction.
+
+    Targets that already have a pending repost from own are skipped. Returns
+    (created, existing); created rows carry the new id as repost_id.
+    """
+    cursor.execute(
+        f"SELECT to_channel_id FROM {prefix}reposts WHERE from_channel_id = %s "
+        f"AND to_channel_id IN ({', '.join(['%s'] * len(targets))}) AND status = 'pending'",
+        (own['id'], *[target['id'] for target in targets])
+    )
+    existing = {row['to_channel_id'] for row in cursor.fetchall()}
+    new = [target for target in targets if target['id'] not in existing]
+    if not new:
+        return [], targets
+
+    cursor.executemany(
+        f"INSERT INTO {prefix}reposts (from_channel_id, to_channel_id, repost_channel, from_user_id, to_user_id, "
+        "status) VALUES (%s, %s, %s, %s, %s, 'pending')",
+        [(own['id'], target['id'], own['channel_username'], user_id, target['owner_user_id']) for target in new]
+    )
+    cursor.execute(
+        f"SELECT id, to_channel_id FROM {prefix}reposts WHERE from_channel_id = %s "
+        f"AND to_channel_id IN ({', '.join(['%s'] * len(new))}) AND status = 'pending'",
+        (own['id'], *[target['id'] for target in new])
+    )
+    repost_ids = {row['to_channel_id']: row['id'] for row in cursor.fetchall()}
+    conn.commit()
+    return (
+        [dict(target, repost_id=repost_ids[target['id']]) for target in new],
+        [target for target in targets if target['id'] in existing],
+    )
+
+
+def pending_for_channel(cursor, prefix, user_id, channel_username):
+    """The user's channel and up to MAX_CONFIRM of its pending reposts in one query.
+
+    Returns (None, []) when the channel is not in the catalog or not the user's.
+    """
+    cursor.execute(
+        "SELECT t.id AS to_id, t.channel_username AS to_channel, "
+        "r.id, r.from_user_id, r.from_channel_id, f.channel_id AS from_chat_id, f.channel_username AS from_channel "
+        f"FROM {prefix}channels t "
+        f"LEFT JOIN {prefix}reposts r ON r.to_channel_id = t.id AND r.to_user_id = %s AND r.status = 'pending' "
+        f"LEFT JOIN {prefix}channels f ON f.id = r.from_channel_id "
+        "WHERE t.channel_username = %s AND t.owner_user_id = %s "
+        "ORDER BY r.created_date LIMIT %s",
+        (user_id, channel_username, user_id, MAX_CONFIRM)
+    )
+    rows = cursor.fetchall()
+    if not rows:
+        return None, []
+    own = {'id': rows[0]['to_id'], 'channel_username': rows[0]['to_channel']}
+    return own, [row for row in rows if row['id'] is not None]
+
+
+def confirm_pending(conn, cursor, prefix, reposts, counts):
+    """Confirm reposts and store refreshed {channel id: subscriber count} in one transaction.
+
+    Returns the reposts actually confirmed: those confirmed, rejected or expired
+    in the meantime are left out. cursor must be a dictionary cursor.
+    """
+    if counts:
+        cursor.executemany(
+            f"UPDATE {prefix}channels SET subscriber_count = %s WHERE id = %s",
+            [(count, channel_id) for channel_id, count in counts.items()]
+        )
+        record_observations(cursor, prefix, counts.items())
+    cursor.execute(
+        f"SELECT id FROM {prefix}reposts "
+        f"WHERE id IN ({', '.join(['%s'] * len(reposts))}) AND status = 'pending' FOR UPDATE",
+        [repost['id'] for repost in reposts]
+    )
+    pending = {row['id'] for row in cursor.fetchall()}
+    confirmed = [repost for repost in reposts if repost['id'] in pending]
+    if confirmed:
+        cursor.execute(
+            f"UPDATE {prefix}reposts SET status = 'confirmed', confirmed_date = NOW() "
+            f"WHERE id IN ({', '.join(['%s'] * len(confirmed))})",
+            [repost['id'] for repost in confirmed]
+        )
+    conn.commit()
+    return confirmed
+
+
+def group_by(rows, key):
+    groups = {}
+    for row in rows:
+        groups.setdefault(row[key], []).append(row)
+    return groups
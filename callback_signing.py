@@ -0,0 +1,40 @@
+"""Compact HMAC-signed button payloads carrying an action and a repost id"""
+import base64
+import hashlib
+import hmac
+
+# Bytes of the truncated HMAC-SHA256 tag, 11 characters once encoded
+TAG_BYTES = 8
+ACTIONS = {'c': 'confirm', 'r': 'reject'}
+
+
+def _tag(key, body):
+    digest = hmac.new(key, body.encode('ascii'), hashlib.sha256).digest()[:TAG_BYTES]
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode('ascii')
+
+
+def sign_callback(key, action, repost_id):
+    """Encode e.g. ('confirm', 12345) as 'c9ix.<tag>', well within Telegram's 64-byte callback_data"""
+    body = f"{action[0]}{_base36(repost_id)}"
+    return f"{body}.{_tag(key, body)}"
+
+
+def verify_callback(key, data):
+    """Return (action, repost id) for a payload signed with key, None when it is malformed or forged"""
+    body, _, tag = (data or '').partition('.')
+    if len(body) < 2 or body[0] not in ACTIONS or not hmac.compare_digest(tag, _tag(key, body)):
+        return None
+    try:
+        return ACTIONS[body[0]], int(body[1:], 36)
+    except ValueError:
+        return None
+
+
+def _base36(number):
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    encoded = ''
+    while True:
+        number, remainder = divmod(number, 36)
+        encoded = digits[remainder] + encoded
+        if not number:
+            return encoded
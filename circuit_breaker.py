@@ -0,0 +1,81 @@
+"""Circuit breakers for the database and external APIs used by both bots"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# All breakers created in the process, by name
+BREAKERS = {}
+
+
+class CircuitBreaker:
+    """Closed -> open after ``failure_threshold`` consecutive failures.
+
+    While open, calls fail fast. After ``reset_timeout`` seconds the breaker
+    goes half-open and lets a single trial call through: success closes it,
+    failure opens it again for another ``reset_timeout``.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_started_at = None
+        self._lock = threading.Lock()
+        BREAKERS[name] = self
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def allow_request(self):
+        """Return True if a call may be attempted now"""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            now = time.monotonic()
+            if self._state == OPEN:
+                if now - self._opened_at < self.reset_timeout:
+                    return False
+                self._set_state(HALF_OPEN)
+            # Half-open: one trial at a time; a trial that never reported back expires
+            if self._trial_started_at is not None and now - self._trial_started_at < self.reset_timeout:
+                return False
+            self._trial_started_at = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._trial_started_at = None
+            if self._state != CLOSED:
+                self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_started_at = None
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                if self._state != OPEN:
+                    self._set_state(OPEN)
+
+    def _set_state(self, state):
+        logger.warning(f"Circuit breaker '{self.name}': {self._state} -> {state}")
+        self._state = state
+
+
+def breaker_states():
+    """Return {name: state} for every breaker in the process"""
+    return {name: breaker.state for name, breaker in BREAKERS.items()}
@@ -0,0 +1,112 @@
+"""Digest of new pending reposts, one message per owner and window instead of one per /done"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+import mysql.connector
+
+logger = logging.getLogger(__name__)
+
+# Reposts listed in one digest message, the rest are summarized by a count
+DIGEST_MAX_ITEMS = 30
+# Longest sleep between looking for owners whose window has passed, seconds
+MAX_POLL = 300
+
+
+def set_digest(cursor, prefix, user_id, enabled):
+    """Switch the digest for user_id; pending reposts created before now are not repeated in it"""
+    cursor.execute(
+        f"REPLACE INTO {prefix}user_settings (user_id, digest, digest_sent_at) VALUES (%s, %s, NOW())",
+        (user_id, 1 if enabled else 0)
+    )
+
+
+def digest_enabled(cursor, prefix, user_id):
+    cursor.execute(f"SELECT COUNT(*) FROM {prefix}user_settings WHERE user_id = %s AND digest = 1", (user_id,))
+    return cursor.fetchone()[0] > 0
+
+
+def collect_digests(conn, prefix, cutoff, due):
+    """Pending reposts created since the previous digest of every owner whose last one is older than due.
+
+    A single query for all recipients, grouped by owner in Python.
+    """
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            "SELECT r.to_user_id, f.channel_username AS from_channel, t.channel_username AS to_channel, "
+            "r.created_date "
+            f"FROM {prefix}user_settings s "
+            f"JOIN {prefix}reposts r ON r.to_user_id = s.user_id AND r.status = 'pending' "
+            "AND r.created_date > s.digest_sent_at AND r.created_date <= %s "
+            f"JOIN {prefix}channels f ON f.id = r.from_channel_id "
+            f"JOIN {prefix}channels t ON t.id = r.to_channel_id "
+            "WHERE s.digest = 1 AND s.digest_sent_at <= %s "
+            "ORDER BY r.to_user_id, r.created_date",
+            (cutoff, due)
+        )
+        digests = {}
+        for row in cursor.fetchall():
+            digests.setdefault(row['to_user_id'], []).append(row)
+        return digests
+    finally:
+        cursor.close()
+
+
+def mark_sent(conn, prefix, user_ids, cutoff):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"UPDATE {prefix}user_settings SET digest_sent_at = %s "
+            f"WHERE user_id IN ({', '.join(['%s'] * len(user_ids))})",
+            (cutoff, *user_ids)
+        )
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+def send_digests(get_connection, prefix, notify, render, window, rate):
+    """Send digests to owners that got none for window seconds, at most rate messages per second"""
+    conn = get_connection()
+    if not conn:
+        return 0
+
+    # Whole seconds, so reposts committed later within the same second wait for the next window
+    cutoff = datetime.now().replace(microsecond=0) - timedelta(seconds=1)
+    try:
+        digests = collect_digests(conn, prefix, cutoff, cutoff - timedelta(seconds=window))
+        if digests:
+            # Marked before sending: a failed message is skipped rather than repeated to everyone
+            mark_sent(conn, prefix, list(digests), cutoff)
+    except mysql.connector.Error as err:
+        conn.rollback()
+        logger.error(f"Error collecting {prefix}reposts digests: {err}")
+        return 0
+    finally:
+        conn.close()
+
+    interval = 1 / rate if rate > 0 else 0
+    for user_id, reposts in digests.items():
+        try:
+            notify(user_id, render(reposts[:DIGEST_MAX_ITEMS], len(reposts)))
+        except Exception as e:
+            logger.error(f"Error sending digest to {user_id}: {e}")
+        time.sleep(interval)
+
+    if digests:
+        logger.info(f"Sent {len(digests)} {prefix}reposts digests")
+    return len(digests)
+
+
+def start_digest(get_connection, prefix, notify, render, window, rate):
+    """Send due digests from a daemon thread; the window is per owner, so restarts don't shorten it"""
+    def run():
+        while True:
+            send_digests(get_connection, prefix, notify, render, window, rate)
+            time.sleep(min(window, MAX_POLL))
+
+    thread = threading.Thread(target=run, name=f'{prefix}reposts-digest', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,171 @@
+"""Expiry of stale pending reposts, driven by an in-memory heap of deadlines"""
+import heapq
+import logging
+import threading
+import time
+
+import mysql.connector
+
+logger = logging.getLogger(__name__)
+
+# Longest sleep of the scheduler thread, bounds the effect of wall clock jumps
+MAX_WAIT = 300
+# Delay before a batch that failed to apply is tried again, seconds
+RETRY_DELAY = 60
+
+
+class ExpiryScheduler:
+    """Rejects pending {prefix}reposts once they are ttl_days old.
+
+    Deadlines of all pending rows are loaded from created_date at start and
+    new rows are added with schedule(), so the database is only touched when
+    something is due. Due reposts are rejected batch_size at a time and, with
+    notify(user_id, text) set, both parties are told at most notify_rate
+    messages per second. on_expire(row) is called for every rejected row, which
+    carries the repost, user and channel ids.
+    """
+
+    def __init__(self, get_connection, prefix, ttl_days, batch_size=500, notify=None, notify_rate=10,
+                 requester_text='', owner_text='', on_expire=None):
+        self.get_connection = get_connection
+        self.prefix = prefix
+        self.ttl_days = ttl_days
+        self.ttl = ttl_days * 86400
+        self.batch_size = batch_size
+        self.notify = notify
+        self.notify_interval = 1 / notify_rate if notify_rate > 0 else 0
+        self.requester_text = requester_text
+        self.owner_text = owner_text
+        self.on_expire = on_expire
+        self._heap = []
+        self._cond = threading.Condition()
+
+    def _push(self, deadline, repost_id):
+        with self._cond:
+            heapq.heappush(self._heap, (deadline, repost_id))
+            if self._heap[0][1] == repost_id:
+                self._cond.notify()
+
+    def schedule(self, repost_id, created=None):
+        """Add a pending repost; created is its created_date, now by default"""
+        self._push((created.timestamp() if created else time.time()) + self.ttl, repost_id)
+
+    def load(self):
+        """Schedule every pending row in the database, return how many or None without a connection"""
+        conn = self.get_connection()
+        if not conn:
+            return None
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"SELECT id, created_date FROM {self.prefix}reposts WHERE status = 'pending'")
+            entries = [(created.timestamp() + self.ttl, repost_id) for repost_id, created in cursor.fetchall()]
+        finally:
+            cursor.close()
+            conn.close()
+        with self._cond:
+            self._heap.extend(entries)
+            heapq.heapify(self._heap)
+            self._cond.notify()
+        return len(entries)
+
+    def _next_batch(self):
+        """Block until something is due, then pop up to batch_size due repost ids"""
+        with self._cond:
+            while True:
+                now = time.time()
+                if self._heap and self._heap[0][0] <= now:
+                    break
+                timeout = min(self._heap[0][0] - now, MAX_WAIT) if self._heap else MAX_WAIT
+                self._cond.wait(timeout)
+            ids = []
+            while self._heap and self._heap[0][0] <= now and len(ids) < self.batch_size:
+                ids.append(heapq.heappop(self._heap)[1])
+            return ids
+
+    def expire(self, ids):
+        """Reject the reposts among ids that are still pending, return their details"""
+        conn = self.get_connection()
+        if not conn:
+            raise mysql.connector.Error(msg="No database connection")
+        cursor = conn.cursor(dictionary=True)
+        try:
+            # Locking the rows still pending keeps a concurrent confirmation from
+            # slipping in between, so exactly the rows rejected here are reported
+            cursor.execute(
+                f"SELECT id FROM {self.prefix}reposts "
+                f"WHERE id IN ({', '.join(['%s'] * len(ids))}) AND status = 'pending' FOR UPDATE",
+                ids
+            )
+            pending = [row['id'] for row in cursor.fetchall()]
+            if not pending:
+                conn.commit()
+                return []
+            placeholders = ', '.join(['%s'] * len(pending))
+            cursor.execute(
+                f"UPDATE {self.prefix}reposts SET status = 'rejected' WHERE id IN ({placeholders})",
+                pending
+            )
+            cursor.execute(
+                "SELECT r.id, r.from_user_id, r.to_user_id, r.from_channel_id, r.to_channel_id, "
+                "f.channel_username AS from_channel, t.channel_username AS to_channel "
+                f"FROM {self.prefix}reposts r "
+                f"JOIN {self.prefix}channels f ON f.id = r.from_channel_id "
+                f"JOIN {self.prefix}channels t ON t.id = r.to_channel_id "
+                f"WHERE r.id IN ({placeholders})",
+                pending
+            )
+            rows = cursor.fetchall()
+            conn.commit()
+            return rows
+        except mysql.connector.Error:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    def send_notices(self, rows):
+        for row in rows:
+            for user_id, text in (
+                (row['from_user_id'], self.requester_text),
+                (row['to_user_id'], self.owner_text),
+            ):
+                try:
+                    self.notify(user_id, text.format(days=self.ttl_days, **row))
+                except Exception as e:
+                    logger.error(f"Error sending expiry notice: {e}")
+                time.sleep(self.notify_interval)
+
+    def run(self):
+        while True:
+            try:
+                count = self.load()
+            except mysql.connector.Error as err:
+                logger.error(f"Error loading pending {self.prefix}reposts: {err}")
+                count = None
+            if count is not None:
+                logger.info(f"Scheduled expiry of {count} pending {self.prefix}reposts")
+                break
+            time.sleep(RETRY_DELAY)
+
+        while True:
+            ids = self._next_batch()
+            try:
+                rows = self.expire(ids)
+            except mysql.connector.Error as err:
+                logger.error(f"Error expiring {self.prefix}reposts: {err}")
+                for repost_id in ids:
+                    self._push(time.time() + RETRY_DELAY, repost_id)
+                continue
+            if rows:
+                logger.info(f"Expired {len(rows)} pending {self.prefix}reposts")
+                if self.on_expire:
+                    for row in rows:
+                        self.on_expire(row)
+                if self.notify:
+                    self.send_notices(rows)
+
+    def start(self):
+        thread = threading.Thread(target=self.run, name=f'{self.prefix}reposts-expiry', daemon=True)
+        thread.start()
+        return thread
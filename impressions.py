@@ -0,0 +1,98 @@
+"""Write-behind counters of how often channels are shown by /find"""
+import logging
+import threading
+import time
+from collections import Counter
+
+import mysql.connector
+
+from subscriber_history import channel_id_batches
+
+logger = logging.getLogger(__name__)
+
+
+class ImpressionBuffer:
+    """Impressions counted in memory and added to {prefix}channels.impressions in batches.
+
+    /find only touches a Counter under a lock; a daemon thread flushes it every
+    flush_interval seconds with one executemany in id order, and halves all
+    counters every decay_interval seconds so exposure reflects recent days.
+    Counts of a failed flush are put back for the next one.
+    """
+
+    def __init__(self, get_connection, prefix, flush_interval, decay_interval):
+        self.get_connection = get_connection
+        self.prefix = prefix
+        self.flush_interval = flush_interval
+        self.decay_interval = decay_interval
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, channel_ids):
+        with self._lock:
+            self._counts.update(channel_ids)
+
+    def flush(self):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        if not counts:
+            return 0
+
+        conn = self.get_connection()
+        if not conn:
+            self._restore(counts)
+            return 0
+        cursor = conn.cursor()
+        try:
+            cursor.executemany(
+                f"UPDATE {self.prefix}channels SET impressions = impressions + %s WHERE id = %s",
+                [(count, channel_id) for channel_id, count in sorted(counts.items())]
+            )
+            conn.commit()
+            return len(counts)
+        except mysql.connector.Error as err:
+            conn.rollback()
+            self._restore(counts)
+            logger.error(f"Error flushing {self.prefix}channels impressions: {err}")
+            return 0
+        finally:
+            cursor.close()
+            conn.close()
+
+    def decay(self):
+        conn = self.get_connection()
+        if not conn:
+            return
+        cursor = conn.cursor()
+        try:
+            for first_id, last_id in channel_id_batches(cursor, self.prefix):
+                cursor.execute(
+                    f"UPDATE {self.prefix}channels SET impressions = FLOOR(impressions / 2) "
+                    "WHERE id BETWEEN %s AND %s AND impressions > 0",
+                    (first_id, last_id)
+                )
+                conn.commit()
+        except mysql.connector.Error as err:
+            conn.rollback()
+            logger.error(f"Error decaying {self.prefix}channels impressions: {err}")
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _restore(self, counts):
+        with self._lock:
+            self._counts.update(counts)
+
+    def start(self):
+        def run():
+            decayed_at = time.monotonic()
+            while True:
+                time.sleep(self.flush_interval)
+                self.flush()
+                if self.decay_interval and time.monotonic() - decayed_at >= self.decay_interval:
+                    self.decay()
+                    decayed_at = time.monotonic()
+
+        thread = threading.Thread(target=run, name=f'{self.prefix}impressions', daemon=True)
+        thread.start()
+        return thread
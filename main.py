@@ -1,15 +1,49 @@
+import asyncio
+import functools
 import logging
-import math
 import os
-
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, BotCommand
-from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters
+import threading
+import time
+
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, BotCommand, MessageOriginChannel
+from telegram.error import NetworkError
+from telegram.ext import (
+    Application, ApplicationHandlerStop, CallbackQueryHandler, CommandHandler, ContextTypes, MessageHandler,
+    TypeHandler, filters
+)
+from telegram.request import HTTPXRequest
 import mysql.connector
 from mysql.connector import Error
 import random
 from datetime import datetime
 from dotenv import load_dotenv
 
+from archiver import start_archiver
+from bulk_reposts import (
+    MAX_TARGETS, confirm_pending, create_pending, group_by, load_channels, pending_for_channel, split_bulk_args,
+    unique_names
+)
+from callback_signing import sign_callback, verify_callback
+from circuit_breaker import CircuitBreaker, breaker_states
+from digest import digest_enabled, set_digest, start_digest
+from expiry import ExpiryScheduler
+from impressions import ImpressionBuffer
+from match_score import start_score_job
+from metrics import CommandTimer, InstrumentedConnection, api_errors, api_latency, start_metrics_server
+from migrations import (
+    migrate_abuse_reports_channel_ids, migrate_impressions, migrate_match_score, migrate_reposts_archive,
+    migrate_reposts_to_channel_ids
+)
+from pagination import PageCache, page_callback, parse_page_callback, split_pages
+from pair_index import PairIndex
+from rate_limiter import RateLimiter, ReplyCache, THROTTLED_TEXT, parse_rate_limits
+from similar_channels import (
+    MAX_CHANNELS, OVERSAMPLE, PER_CHANNEL_LIMIT, PROXIMITY_WEIGHTED_RANDOM, assign_candidates,
+    candidates_params, candidates_query, merge_bands, proximity_params, subscriber_band
+)
+from subscriber_history import record_observations, start_history_jobs
+from traffic_recorder import TrafficRecorder
+
 load_dotenv()
 
 logging.basicConfig(
@@ -27,6 +61,14 @@ DB_CONFIG = {
 
 BOT_TOKEN = os.environ['BOT_TOKEN']
 
+# Prometheus metrics listener, disabled when METRICS_PORT is empty
+METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.environ.get('METRICS_PORT', '0') or 0)
+
+# Telegram user allowed to run service commands such as /health
+ADMIN_USER_ID = os.environ.get('ADMIN_USER_ID', '')
+ADMIN_USER_ID = int(ADMIN_USER_ID) if ADMIN_USER_ID.isdigit() else None
+
 # Bot mode configuration
 BOT_MODE = os.environ.get('BOT_MODE', 'polling').lower()
 
@@ -37,15 +79,151 @@ WEBHOOK_SECRET_TOKEN = os.environ.get('WEBHOOK_SECRET_TOKEN', '')
 WEBHOOK_CERT = os.environ.get('WEBHOOK_CERT', '')
 WEBHOOK_KEY = os.environ.get('WEBHOOK_KEY', '')
 
+# Anti-flood configuration, e.g. RATE_LIMITS=find=3/60,stat=5/60,default=20/60
+RATE_LIMITS = parse_rate_limits(os.environ.get('RATE_LIMITS', 'find=5/60,stat=5/60,done=10/60,confirm=10/60'))
+RATE_LIMIT_IDLE_TTL = int(os.environ.get('RATE_LIMIT_IDLE_TTL', '600'))
+
+# Commands whose last reply is served from cache when the user is throttled
+CACHED_REPLY_COMMANDS = ('find', 'stat')
+
+rate_limiter = RateLimiter(RATE_LIMITS, idle_ttl=RATE_LIMIT_IDLE_TTL)
+reply_cache = ReplyCache()
+
+# Circuit breakers: fail fast instead of waiting for timeouts during outages
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', '5'))
+CIRCUIT_RESET_TIMEOUT = int(os.environ.get('CIRCUIT_RESET_TIMEOUT', '30'))
+
+db_breaker = CircuitBreaker('mysql', CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+telegram_breaker = CircuitBreaker('telegram_api', CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+
+# Opt-in recording of anonymized traffic for replay load tests
+TRAFFIC_RECORD_FILE = os.environ.get('TRAFFIC_RECORD_FILE', '')
+TRAFFIC_RECORD_KEY = os.environ.get('TRAFFIC_RECORD_KEY', '')
+traffic_recorder = TrafficRecorder(TRAFFIC_RECORD_FILE, TRAFFIC_RECORD_KEY) if TRAFFIC_RECORD_FILE else None
+
+# Archiving of confirmed and rejected reposts older than ARCHIVE_AFTER_DAYS (0 disables it)
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '30'))
+ARCHIVE_INTERVAL = int(os.environ.get('ARCHIVE_INTERVAL', '3600'))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '500'))
+ARCHIVE_BATCH_PAUSE = float(os.environ.get('ARCHIVE_BATCH_PAUSE', '0.5'))
+
+# Pending reposts are rejected after PENDING_EXPIRY_DAYS (0 disables it), both
+# parties are notified at most EXPIRY_NOTIFY_RATE messages per second
+PENDING_EXPIRY_DAYS = int(os.environ.get('PENDING_EXPIRY_DAYS', '7'))
+PENDING_EXPIRY_BATCH_SIZE = int(os.environ.get('PENDING_EXPIRY_BATCH_SIZE', '500'))
+PENDING_EXPIRY_NOTIFY = os.environ.get('PENDING_EXPIRY_NOTIFY', '1') == '1'
+EXPIRY_NOTIFY_RATE = float(os.environ.get('EXPIRY_NOTIFY_RATE', '10'))
+
+# Started with the bot when PENDING_EXPIRY_DAYS is set
+expiry_scheduler = None
+
+# Raw subscriber counts are kept HISTORY_RAW_DAYS, then folded into daily aggregates
+HISTORY_RAW_DAYS = int(os.environ.get('HISTORY_RAW_DAYS', '30'))
+HISTORY_JOB_INTERVAL = int(os.environ.get('HISTORY_JOB_INTERVAL', '86400'))
+
+# match_score weighting /find candidates is recomputed every MATCH_SCORE_INTERVAL seconds (0 disables it)
+MATCH_SCORE_INTERVAL = int(os.environ.get('MATCH_SCORE_INTERVAL', '3600'))
+
+# /find impressions are buffered in memory and written every IMPRESSION_FLUSH_INTERVAL
+# seconds (0 stops counting them), all counters are halved every IMPRESSION_DECAY_INTERVAL
+IMPRESSION_FLUSH_INTERVAL = int(os.environ.get('IMPRESSION_FLUSH_INTERVAL', '10'))
+IMPRESSION_DECAY_INTERVAL = int(os.environ.get('IMPRESSION_DECAY_INTERVAL', '86400'))
+
+# Started with the bot when IMPRESSION_FLUSH_INTERVAL is set
+impression_buffer = None
+
+# Owners who enabled /digest get new pending reposts at most once per DIGEST_INTERVAL
+# seconds (0 disables digests), sent at most DIGEST_NOTIFY_RATE messages per second
+DIGEST_INTERVAL = int(os.environ.get('DIGEST_INTERVAL', '86400'))
+DIGEST_NOTIFY_RATE = float(os.environ.get('DIGEST_NOTIFY_RATE', '10'))
+
+# Notifications of the bulk commands sent concurrently per batch
+NOTIFY_BATCH_SIZE = int(os.environ.get('NOTIFY_BATCH_SIZE', '20'))
+
+# Key signing the Confirm/Reject buttons of repost notifications
+CALLBACK_SECRET = (os.environ.get('CALLBACK_SECRET', '') or BOT_TOKEN).encode('utf-8')
+
+# /find draws up to FIND_RESULTS_LIMIT candidates at once and shows FIND_PAGE_SIZE per page;
+# pages of long replies stay available to the Next/Prev buttons for PAGE_CACHE_TTL seconds
+FIND_RESULTS_LIMIT = int(os.environ.get('FIND_RESULTS_LIMIT', '50'))
+FIND_PAGE_SIZE = int(os.environ.get('FIND_PAGE_SIZE', '10'))
+PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL', '600'))
+
+# Static replies, rendered once at import time
+ERROR_TEXT = "❌ Ошибка. Пожалуйста, попробуйте повторить попытку позже."
+
+# Expiry notices, formatted with from_channel, to_channel and days
+EXPIRY_REQUESTER_TEXT = (
+    "⌛ Владелец канала {to_channel} не подтвердил репост на канале {from_channel} за {days} дн., "
+    "запрос отменён."
+)
+EXPIRY_OWNER_TEXT = (
+    "⌛ Запрос на подтверждение репоста канала {from_channel} для {to_channel} не был подтверждён "
+    "за {days} дн. и отменён."
+)
+
+START_TEXT = (
+    "👋 Добро пожаловать в бот обмена аудиторией!\n\n"
+    "Используйте /help для просмотра всех команд."
+)
+
+HELP_TEXT = """
+📚 *Справка по командам:*
+
+/add - Добавить свой канал в каталог
+/my - Показать мои каналы
+/delete *[канал]* - Удалить канал из каталога
+/update *[канал]* - Обновить количество подписчиков
+/find *[канал]* - Найти похожие каналы для обмена (без канала - для всех ваших каналов)
+/done *[канал]* *[на_каком_канале]* - Сообщить владельцу канала о выполненном репосте
+/done *[канал]* *[канал]* ... on *[на_каком_канале]* - То же для нескольких каналов сразу
+/confirm *[свой_канал]* *[канал_репоста]* - Подтвердить репост
+/confirm\\_all *[свой_канал]* - Подтвердить все ожидающие репосты для канала
+/list - Список каналов, ожидающих подтверждения
+/digest *[on|off]* - Получать уведомления о репостах одной сводкой
+/stat - Показать статистику бота
+/abuse *[канал]* *[причина]* - Пожаловаться на канал и владельца
+/help - Показать эту справку
+
+*Как это работает:*
+1. Добавьте свой канал командой /add
+2. Найдите похожие каналы /find
+3. Подпишитесь и сделайте репост любого поста
+4. Сообщите /done после репоста
+5. Владелец канала подтвердит /confirm, а репост пересылкой поста бот подтвердит сам
+6. Ожидайте ответного репоста
+    """
+
+BOT_COMMANDS = (
+    BotCommand("start", "Запустить бота"),
+    BotCommand("help", "Показать справку по командам"),
+    BotCommand("add", "Добавить свой канал в каталог"),
+    BotCommand("my", "Показать мои каналы"),
+    BotCommand("delete", "Удалить канал из каталога"),
+    BotCommand("update", "Обновить количество подписчиков"),
+    BotCommand("find", "Найти похожие каналы для обмена"),
+    BotCommand("done", "Сообщить о выполненном репосте"),
+    BotCommand("confirm", "Подтвердить репост"),
+    BotCommand("confirm_all", "Подтвердить все репосты для канала"),
+    BotCommand("list", "Список ожидающих подтверждения"),
+    BotCommand("digest", "Уведомления о репостах сводкой"),
+    BotCommand("stat", "Показать статистику бота"),
+    BotCommand("abuse", "Пожаловаться на канал"),
+)
+
 
 class Database:
 
     @staticmethod
     def get_connection():
+        if not db_breaker.allow_request():
+            return None
         try:
             conn = mysql.connector.connect(**DB_CONFIG)
-            return conn
+            db_breaker.record_success()
+            return InstrumentedConnection(conn)
         except Error as e:
+            db_breaker.record_failure()
             logger.error(f"Error connecting to the database: {e}")
             return None
 
@@ -65,25 +243,93 @@ class Database:
                 owner_user_id BIGINT NOT NULL,
                 subscriber_count INT NOT NULL,
                 added_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                archived_confirmed INT NOT NULL DEFAULT 0,
+                archived_unconfirmed INT NOT NULL DEFAULT 0,
+                match_score FLOAT NOT NULL DEFAULT 0.5,
+                impressions INT NOT NULL DEFAULT 0,
                 INDEX idx_owner (owner_user_id),
-                INDEX idx_subs (subscriber_count)
+                INDEX idx_subs_score (subscriber_count, match_score, impressions)
             )
         ''')
 
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS reposts (
                 id INT AUTO_INCREMENT PRIMARY KEY,
-                from_channel VARCHAR(255) NOT NULL,
-                to_channel VARCHAR(255) NOT NULL,
+                from_channel_id INT NOT NULL,
+                to_channel_id INT NOT NULL,
+                repost_channel VARCHAR(255) NULL,
                 from_user_id BIGINT NOT NULL,
                 to_user_id BIGINT NOT NULL,
                 status ENUM('pending', 'confirmed', 'rejected') DEFAULT 'pending',
                 created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 confirmed_date TIMESTAMP NULL,
-                INDEX idx_status (status),
-                INDEX idx_to_user (to_user_id),
-                FOREIGN KEY (from_channel) REFERENCES channels(channel_username) ON DELETE CASCADE,
-                FOREIGN KEY (to_channel) REFERENCES channels(channel_username) ON DELETE CASCADE
+                pending_key TINYINT AS (IF(status = 'pending', 1, NULL)) STORED,
+                INDEX idx_status_created (status, created_date),
+                INDEX idx_to_channel_status (to_channel_id, status, from_channel_id, to_user_id, from_user_id),
+                INDEX idx_to_user_status (to_user_id, status, created_date, from_channel_id, to_channel_id),
+                UNIQUE INDEX uniq_pending_pair (from_channel_id, to_channel_id, pending_key),
+                FOREIGN KEY (from_channel_id) REFERENCES channels(id) ON DELETE CASCADE,
+                FOREIGN KEY (to_channel_id) REFERENCES channels(id) ON DELETE CASCADE
+            )
+        ''')
+
+        # Finished reposts moved out of reposts by the archiver, kept for the admin interface
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS reposts_archive (
+                id INT PRIMARY KEY,
+                from_channel_id INT NOT NULL,
+                to_channel_id INT NOT NULL,
+                repost_channel VARCHAR(255) NULL,
+                from_user_id BIGINT NOT NULL,
+                to_user_id BIGINT NOT NULL,
+                status ENUM('pending', 'confirmed', 'rejected') NOT NULL,
+                created_date TIMESTAMP NULL,
+                confirmed_date TIMESTAMP NULL,
+                archived_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_created (created_date)
+            )
+        ''')
+
+        # Subscriber counts: raw observations, daily aggregates of older ones, precomputed deltas
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS subscriber_history (
+                channel_id INT NOT NULL,
+                observed_at TIMESTAMP NOT NULL,
+                subscriber_count INT NOT NULL,
+                PRIMARY KEY (channel_id, observed_at),
+                FOREIGN KEY (channel_id) REFERENCES channels(id) ON DELETE CASCADE
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS subscriber_daily (
+                channel_id INT NOT NULL,
+                day DATE NOT NULL,
+                min_count INT NOT NULL,
+                max_count INT NOT NULL,
+                last_count INT NOT NULL,
+                PRIMARY KEY (channel_id, day),
+                FOREIGN KEY (channel_id) REFERENCES channels(id) ON DELETE CASCADE
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS subscriber_summary (
+                channel_id INT PRIMARY KEY,
+                count_7d INT NULL,
+                count_30d INT NULL,
+                refreshed_at TIMESTAMP NULL,
+                FOREIGN KEY (channel_id) REFERENCES channels(id) ON DELETE CASCADE
+            )
+        ''')
+
+        # Per-user preferences, digest_sent_at is where the next /digest window starts
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS user_settings (
+                user_id BIGINT PRIMARY KEY,
+                digest TINYINT NOT NULL DEFAULT 0,
+                digest_sent_at TIMESTAMP NULL,
+                INDEX idx_digest_due (digest, digest_sent_at)
             )
         ''')
 
@@ -91,10 +337,13 @@ class Database:
             CREATE TABLE IF NOT EXISTS abuse_reports (
                 id INT AUTO_INCREMENT PRIMARY KEY,
                 reporter_user_id BIGINT NOT NULL,
+                channel_id INT NULL,
                 channel_username VARCHAR(255) NOT NULL,
                 reason TEXT NOT NULL,
                 report_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                INDEX idx_channel (channel_username)
+                INDEX idx_channel (channel_username),
+                INDEX idx_channel_id (channel_id),
+                FOREIGN KEY (channel_id) REFERENCES channels(id) ON DELETE SET NULL
             )
         ''')
 
@@ -102,7 +351,7 @@ class Database:
         try:
             cursor.execute('''
                 ALTER TABLE reposts
-                ADD COLUMN repost_channel VARCHAR(255) NULL AFTER to_channel
+                ADD COLUMN repost_channel VARCHAR(255) NULL
             ''')
             conn.commit()
             logger.info("Added repost_channel column to reposts table")
@@ -112,47 +361,353 @@ class Database:
             else:
                 logger.error(f"Error adding repost_channel column: {err}")
 
+        # Older databases reference channels by username
+        migrate_reposts_to_channel_ids(conn, '')
+        migrate_abuse_reports_channel_ids(conn, '')
+        migrate_reposts_archive(conn, '')
+        migrate_match_score(conn, '')
+        migrate_impressions(conn, '')
+
         conn.commit()
         cursor.close()
         conn.close()
         logger.info("The database has been initialized.")
 
 
+class CircuitBreakerRequest(HTTPXRequest):
+    """Bot API transport that fails fast while the Telegram API circuit is open"""
+
+    async def do_request(self, *args, **kwargs):
+        url = kwargs['url'] if 'url' in kwargs else args[0]
+        api_method = url.rsplit('/', 1)[-1]
+        if not telegram_breaker.allow_request():
+            api_errors.inc('telegram', api_method)
+            raise NetworkError("Telegram API circuit breaker is open")
+        start = time.perf_counter()
+        try:
+            code, payload = await super().do_request(*args, **kwargs)
+        except NetworkError:
+            telegram_breaker.record_failure()
+            api_errors.inc('telegram', api_method)
+            raise
+        finally:
+            api_latency.observe(time.perf_counter() - start, 'telegram', api_method)
+        if code >= 500:
+            telegram_breaker.record_failure()
+        else:
+            telegram_breaker.record_success()
+        if code >= 400:
+            api_errors.inc('telegram', api_method)
+        return code, payload
+
+
+class PendingRepostIndex:
+    """Pending reposts by chat id of the channel the repost is made on, then of the reposted channel"""
+
+    def __init__(self):
+        self._by_chat = {}
+        self._chats = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._chats)
+
+    def load(self):
+        conn = Database.get_connection()
+        if not conn:
+            return
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT r.id, f.channel_id, t.channel_id "
+            "FROM reposts r "
+            "JOIN channels f ON f.id = r.from_channel_id "
+            "JOIN channels t ON t.id = r.to_channel_id "
+            "WHERE r.status = 'pending'"
+        )
+        rows = cursor.fetchall()
+        cursor.close()
+        conn.close()
+        for repost_id, from_chat_id, to_chat_id in rows:
+            self.add(repost_id, from_chat_id, to_chat_id)
+        logger.info(f"Indexed {len(self)} pending reposts for auto-confirmation")
+
+    def add(self, repost_id, from_chat_id, to_chat_id):
+        if from_chat_id is None or to_chat_id is None:
+            return
+        with self._lock:
+            self._by_chat.setdefault(from_chat_id, {})[to_chat_id] = repost_id
+            self._chats[repost_id] = from_chat_id, to_chat_id
+
+    def find(self, from_chat_id, to_chat_id):
+        reposts = self._by_chat.get(from_chat_id)
+        return reposts.get(to_chat_id) if reposts else None
+
+    def discard(self, repost_id):
+        with self._lock:
+            chats = self._chats.pop(repost_id, None)
+            if not chats:
+                return
+            reposts = self._by_chat[chats[0]]
+            if reposts.get(chats[1]) == repost_id:
+                del reposts[chats[1]]
+                if not reposts:
+                    del self._by_chat[chats[0]]
+
+
+# Filled in post_init, kept in step by /done, /confirm and the expiry scheduler
+pending_index = PendingRepostIndex()
+# Filled in post_init, kept in step by /done and rejections
+pair_index = PairIndex()
+page_cache = PageCache(PAGE_CACHE_TTL)
+
+
+def cached_reply_key(user_id, command, args):
+    # Statistics are the same for everyone, other replies are per user and arguments
+    if command == 'stat':
+        return command
+    return user_id, command, ' '.join(args).lower()
+
+
+# Message builders for dynamic replies: *_parts return (header, item blocks, footer) for split_pages
+def my_channels_parts(channels):
+    return "📋 *Ваши каналы:*\n\n", [
+        f"• *{ch['channel_username']}* - 👥 {ch['subscriber_count']} подписчиков\n"
+        for ch in channels
+    ], ""
+
+
+def find_results_parts(channels):
+    return f"🔍 *Найдено {len(channels)} похожих каналов:*\n\n", [
+        f"• *{ch['channel_username']}* - 👥 {ch['subscriber_count']} подписчиков\n"
+        f"  ✅ Подтверждено: {ch['confirmed_count']} | ⏳ Ожидает: {ch['pending_count']}\n"
+        for ch in channels
+    ], "\n💡 Подпишитесь на канал, сделайте репост и используйте /done *[канал]* *[на_каком_канале]*."
+
+
+def find_all_results_parts(own_channels, found):
+    return "🔍 *Похожие каналы для ваших каналов:*\n", [
+        "".join([
+            f"\n*{own['channel_username']}* (👥 {own['subscriber_count']}):\n",
+            *[
+                f"• *{ch['channel_username']}* - 👥 {ch['subscriber_count']} подписчиков\n"
+                f"  ✅ Подтверждено: {ch['confirmed_count']} | ⏳ Ожидает: {ch['pending_count']}\n"
+                for ch in found.get(own['channel_username'], [])
+            ],
+            "" if own['channel_username'] in found else "  😔 Похожих каналов пока нет\n",
+        ])
+        for own in own_channels
+    ], "\n💡 Подпишитесь на канал, сделайте репост и используйте /done *[канал]* *[на_каком_канале]*."
+
+
+def pending_list_parts(reposts):
+    return "📋 *Ожидают подтверждения:*\n\n", [
+        f"• *{r['from_channel']}* → *{r['to_channel']}*\n"
+        f"  📅 {r['created_date'].strftime('%d.%m.%Y %H:%M')}\n\n"
+        for r in reposts
+    ], "Используйте /confirm *[свой_канал]* *[канал_репоста]* для подтверждения."
+
+
+def render_digest(reposts, total):
+    """Plain text: sent from the digest thread without parse_mode"""
+    more = total - len(reposts)
+    return "".join([
+        f"🔔 Новые запросы на подтверждение репостов: {total}\n\n",
+        *[f"• {r['from_channel']} → {r['to_channel']}\n" for r in reposts],
+        f"…и ещё {more}\n" if more > 0 else "",
+        "\nПодтвердите командой /confirm [свой_канал] [канал_репоста], список всех запросов: /list",
+    ])
+
+
+def render_difference(difference):
+    if difference > 0:
+        return f"📈 +{difference}"
+    if difference < 0:
+        return f"📉 {difference}"
+    return "➡️ без изменений"
+
+
+def render_growth(new_count, summary):
+    # 7- and 30-day changes from the precomputed summary, when there is history that old
+    return "".join(
+        f"\n📅 За {days} дней: {render_difference(new_count - summary[key])}"
+        for days, key in ((7, 'count_7d'), (30, 'count_30d'))
+        if summary[key] is not None
+    )
+
+
+def render_updated_counts(updated_counts):
+    if not updated_counts:
+        return ""
+    text = "\n\n📊 *Обновлена статистика:*"
+    for channel, count in updated_counts.items():
+        text += f"\n• *{channel}*: {count} подписчиков"
+    return text
+
+
+def render_channel_names(rows, key='channel_username'):
+    return ", ".join(f"*{row[key]}*" for row in rows)
+
+
+def render_bulk_done(created, existing, missing):
+    parts = []
+    if created:
+        parts.append(f"✅ Уведомления отправлены владельцам каналов: {render_channel_names(created)}.\n"
+                     "Ожидайте подтверждения.")
+    if existing:
+        parts.append(f"⏳ Уже ожидают подтверждения: {render_channel_names(existing)}.")
+    if missing:
+        parts.append("❌ Не найдены в каталоге: " + ", ".join(f"*{name}*" for name in missing) + ".")
+    return "\n\n".join(parts)
+
+
+def render_done_notice(repost_channel, targets):
+    return "".join([
+        "🔔 *Новое уведомление о репосте!*\n\n",
+        f"Канал *{repost_channel}* сообщает, что сделал репост для {render_channel_names(targets)}.\n\n",
+        "Проверьте и подтвердите кнопками ниже или командой:\n",
+        *[f"/confirm *{target['channel_username']}* *{repost_channel}*\n" for target in targets],
+    ])
+
+
+def render_confirmed_notice(my_channel, reposts, stats_text):
+    return (
+        f"🎉 *Ваш репост подтверждён!*\n\n"
+        f"Владелец канала *{my_channel}* подтвердил репост с "
+        f"{'ваших каналов' if len(reposts) > 1 else 'вашего канала'} "
+        f"{render_channel_names(reposts, 'from_channel')}.{stats_text}"
+    )
+
+
+def repost_buttons(repost_id, channel=None):
+    """Confirm/Reject row of a notification, labelled with the channel when it lists several"""
+    return [
+        InlineKeyboardButton(
+            f"✅ {channel}" if channel else "✅ Подтвердить",
+            callback_data=sign_callback(CALLBACK_SECRET, 'confirm', repost_id)
+        ),
+        InlineKeyboardButton(
+            f"❌ {channel}" if channel else "❌ Отклонить",
+            callback_data=sign_callback(CALLBACK_SECRET, 'reject', repost_id)
+        ),
+    ]
+
+
+def page_buttons(token, page, total):
+    """Prev/Next row of a paginated reply"""
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton("◀️ Назад", callback_data=page_callback(token, page - 1)))
+    if page < total - 1:
+        row.append(InlineKeyboardButton("Вперёд ▶️", callback_data=page_callback(token, page + 1)))
+    return InlineKeyboardMarkup([row])
+
+
+async def reply_pages(message, user_id, pages):
+    """Send the first page; further ones are kept for the Next/Prev buttons instead of re-running the query"""
+    if len(pages) == 1:
+        await message.reply_text(pages[0], parse_mode='Markdown')
+        return
+    token = page_cache.put(user_id, pages)
+    await message.reply_text(pages[0], parse_mode='Markdown', reply_markup=page_buttons(token, 0, len(pages)))
+
+
+def render_button_result(action, repost):
+    if action == 'confirm':
+        return f"✅ Репост от канала *{repost['from_channel']}* для *{repost['to_channel']}* подтверждён."
+    return f"❌ Репост от канала *{repost['from_channel']}* для *{repost['to_channel']}* отклонён."
+
+
+async def fetch_member_counts(bot, usernames):
+    """Subscriber counts {key: count} for {key: channel username}, requested concurrently"""
+    results = await asyncio.gather(
+        *(bot.get_chat_member_count(username) for username in usernames.values()), return_exceptions=True
+    )
+    counts = {}
+    for (key, username), result in zip(usernames.items(), results):
+        if isinstance(result, Exception):
+            logger.error(f"Не удалось обновить количество подписчиков для {username}: {result}")
+        else:
+            counts[key] = result
+    return counts
+
+
+async def send_notifications(bot, messages):
+    """Send (chat id, Markdown text, reply markup) triples, NOTIFY_BATCH_SIZE of them concurrently at a time"""
+    for start in range(0, len(messages), NOTIFY_BATCH_SIZE):
+        batch = messages[start:start + NOTIFY_BATCH_SIZE]
+        results = await asyncio.gather(
+            *(
+                bot.send_message(chat_id=chat_id, text=text, parse_mode='Markdown', reply_markup=markup)
+                for chat_id, text, markup in batch
+            ),
+            return_exceptions=True
+        )
+        for (chat_id, _, _), result in zip(batch, results):
+            if isinstance(result, Exception):
+                logger.error(f"Не удалось отправить уведомление {chat_id}: {result}")
+
+
+def instrumented(command, callback):
+    """Wrap a handler callback to record its latency, errors and in-flight count"""
+    @functools.wraps(callback)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        with CommandTimer(command):
+            return await callback(update, context)
+    return wrapper
+
+
+# Traffic recorder, appends every text update to TRAFFIC_RECORD_FILE
+async def record_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    message = update.message
+    if not traffic_recorder or not message or not message.text or not update.effective_user:
+        return
+
+    command, _, args = message.text.partition(' ')
+    if not command.startswith('/'):
+        command, args = '', message.text
+    traffic_recorder.record('tg', update.effective_user.id, command, args, chat_id=message.chat_id)
+
+
+# Anti-flood guard, runs before the command handlers
+async def rate_limit_guard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    if query:
+        if not rate_limiter.hit(query.from_user.id, 'button'):
+            await query.answer(THROTTLED_TEXT)
+            raise ApplicationHandlerStop
+        return
+
+    message = update.message
+    if not message or not message.text or not message.text.startswith('/') or not update.effective_user:
+        return
+
+    parts = message.text.split()
+    command = parts[0][1:].split('@')[0].lower()
+    # Made-up commands share one bucket instead of getting one each
+    if command not in HANDLED_COMMANDS:
+        command = 'default'
+    user_id = update.effective_user.id
+    if rate_limiter.hit(user_id, command):
+        return
+
+    cached = None
+    if command in CACHED_REPLY_COMMANDS:
+        cached = reply_cache.get(cached_reply_key(user_id, command, parts[1:]))
+    if cached:
+        await message.reply_text(cached, parse_mode='Markdown')
+    else:
+        await message.reply_text(THROTTLED_TEXT)
+    raise ApplicationHandlerStop
+
+
 # Command /start
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
-        "👋 Добро пожаловать в бот обмена аудиторией!\n\n"
-        "Используйте /help для просмотра всех команд.",
-        parse_mode='Markdown'
-    )
+    await update.message.reply_text(START_TEXT, parse_mode='Markdown')
 
 
 # Command /help
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    help_text = """
-📚 *Справка по командам:*
-
-/add - Добавить свой канал в каталог
-/my - Показать мои каналы
-/delete *[канал]* - Удалить канал из каталога
-/update *[канал]* - Обновить количество подписчиков
-/find *[канал]* - Найти похожие каналы для обмена
-/done *[канал]* *[на_каком_канале]* - Сообщить владельцу канала о выполненном репосте
-/confirm *[свой_канал]* *[канал_репоста]* - Подтвердить репост
-/list - Список каналов, ожидающих подтверждения
-/stat - Показать статистику бота
-/abuse *[канал]* *[причина]* - Пожаловаться на канал и владельца
-/help - Показать эту справку
-
-*Как это работает:*
-1. Добавьте свой канал командой /add
-2. Найдите похожие каналы /find
-3. Подпишитесь и сделайте репост любого поста
-4. Сообщите /done после репоста
-5. Владелец канала подтвердит /confirm
-6. Ожидайте ответного репоста
-    """
-    await update.message.reply_text(help_text, parse_mode='Markdown')
+    await update.message.reply_text(HELP_TEXT, parse_mode='Markdown')
 
 
 # Command /add
@@ -199,7 +754,7 @@ async def add_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Save in the database
         conn = Database.get_connection()
         if not conn:
-            await update.message.reply_text("❌ Ошибка. Пожалуйста, попробуйте повторить попытку позже.", parse_mode='Markdown')
+            await update.message.reply_text(ERROR_TEXT, parse_mode='Markdown')
             return
 
         cursor = conn.cursor()
@@ -210,6 +765,7 @@ async def add_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "VALUES (%s, %s, %s, %s)",
                 (channel_username, chat.id, user_id, member_count)
             )
+            record_observations(cursor, '', [(cursor.lastrowid, member_count)])
             conn.commit()
 
             await update.message.reply_text(
@@ -241,7 +797,7 @@ async def my_channels(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     conn = Database.get_connection()
     if not conn:
-        await update.message.reply_text("❌ Ошибка. Пожалуйста, попробуйте повторить попытку позже.", parse_mode='Markdown')
+        await update.message.reply_text(ERROR_TEXT, parse_mode='Markdown')
         return
 
     cursor = conn.cursor(dictionary=True)
@@ -259,11 +815,7 @@ async def my_channels(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("📭 У вас нет добавленных каналов.", parse_mode='Markdown')
         return
 
-    text = "📋 *Ваши каналы:*\n\n"
-    for ch in channels:
-        text += f"• *{ch['channel_username']}* - 👥 {ch['subscriber_count']} подписчиков\n"
-
-    await update.message.reply_text(text, parse_mode='Markdown')
+    await reply_pages(update.message, user_id, split_pages(*my_channels_parts(channels)))
 
 
 # Command /delete
@@ -284,7 +836,7 @@ async def delete_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     conn = Database.get_connection()
     if not conn:
-        await update.message.reply_text("❌ Ошибка. Пожалуйста, попробуйте повторить попытку позже.", parse_mode='Markdown')
+        await update.message.reply_text(ERROR_TEXT, parse_mode='Markdown')
         return
 
     cursor = conn.cursor()
@@ -333,14 +885,15 @@ async def update_channel_stats(update: Update, context: ContextTypes.DEFAULT_TYP
 
     conn = Database.get_connection()
     if not conn:
-        await update.message.reply_text("❌ Ошибка. Пожалуйста, попробуйте повторить попытку позже.", parse_mode='Markdown')
+        await update.message.reply_text(ERROR_TEXT, parse_mode='Markdown')
         return
 
     cursor = conn.cursor(dictionary=True)
 
     # Checking if the user is the owner
     cursor.execute(
-        "SELECT channel_id, subscriber_count FROM channels WHERE channel_username = %s AND owner_user_id = %s",
+        "SELECT id, channel_id, subscriber_count FROM channels "
+        "WHERE channel_username = %s AND owner_user_id = %s",
         (channel_username, user_id)
     )
 
@@ -363,18 +916,19 @@ async def update_channel_stats(update: Update, context: ContextTypes.DEFAULT_TYP
 
         # Обновляем в базе данных
         cursor.execute(
-            "UPDATE channels SET subscriber_count = %s WHERE channel_username = %s",
-            (new_count, channel_username)
+            "UPDATE channels SET subscriber_count = %s WHERE id = %s",
+            (new_count, channel_data['id'])
         )
+        record_observations(cursor, '', [(channel_data['id'], new_count)])
         conn.commit()
 
-        difference = new_count - old_count
-        if difference > 0:
-            change_text = f"📈 +{difference}"
-        elif difference < 0:
-            change_text = f"📉 {difference}"
-        else:
-            change_text = "➡️ без изменений"
+        # Summary just refreshed by record_observations
+        cursor.execute(
+            "SELECT count_7d, count_30d FROM subscriber_summary WHERE channel_id = %s",
+            (channel_data['id'],)
+        )
+        summary = cursor.fetchone() or {'count_7d': None, 'count_30d': None}
+        change_text = render_difference(new_count - old_count) + render_growth(new_count, summary)
 
         await update.message.reply_text(
             f"✅ Статистика канала *{channel_username}* обновлена!\n\n"
@@ -399,11 +953,7 @@ async def update_channel_stats(update: Update, context: ContextTypes.DEFAULT_TYP
 # Command /find
 async def find_channels(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args:
-        await update.message.reply_text(
-            "❌ Укажите имя своего канала.\n"
-            "Пример: /find @mychannel",
-            parse_mode='Markdown'
-        )
+        await find_for_all_channels(update, context)
         return
 
     channel_username = context.args[0].strip()
@@ -414,14 +964,14 @@ async def find_channels(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     conn = Database.get_connection()
     if not conn:
-        await update.message.reply_text("❌ Ошибка. Пожалуйста, попробуйте повторить попытку позже.", parse_mode='Markdown')
+        await update.message.reply_text(ERROR_TEXT, parse_mode='Markdown')
         return
 
     cursor = conn.cursor(dictionary=True)
 
     # Getting subscribers to a user's channel
     cursor.execute(
-        "SELECT subscriber_count FROM channels WHERE channel_username = %s",
+        "SELECT id, subscriber_count FROM channels WHERE channel_username = %s",
         (channel_username,)
     )
 
@@ -436,23 +986,25 @@ async def find_channels(update: Update, context: ContextTypes.DEFAULT_TYPE):
         conn.close()
         return
 
-    target_count = result['subscriber_count']
-    diff = math.ceil(max(target_count, 100) * 0.2)
-
-    # Looking for similar channels (±100 subscribers) with repost counts
+    # Looking for similar channels (±20%) with repost counts, reliable and closer ones more likely,
+    # except those the channel already reposted for
     cursor.execute(
-        "SELECT c.channel_username, c.subscriber_count, "
-        "(SELECT COUNT(*) FROM reposts r WHERE r.to_channel = c.channel_username AND r.status = 'confirmed') as confirmed_count, "
-        "(SELECT COUNT(*) FROM reposts r WHERE r.to_channel = c.channel_username AND r.status = 'pending') as pending_count "
+        "SELECT c.id, c.channel_username, c.subscriber_count, "
+        "(SELECT COUNT(*) FROM reposts r WHERE r.to_channel_id = c.id AND r.status = 'confirmed') + c.archived_confirmed as confirmed_count, "
+        "(SELECT COUNT(*) FROM reposts r WHERE r.to_channel_id = c.id AND r.status = 'pending') as pending_count "
         "FROM channels c "
         "WHERE c.channel_username != %s "
         "AND c.owner_user_id != %s "
         "AND c.subscriber_count BETWEEN %s AND %s "
-        "ORDER BY RAND() LIMIT 10",
-        (channel_username, user_id, max(target_count - diff, 0), target_count + diff)
+        f"ORDER BY {PROXIMITY_WEIGHTED_RANDOM} LIMIT %s",
+        (
+            channel_username, user_id, *subscriber_band(result['subscriber_count']),
+            *proximity_params(result['subscriber_count']), FIND_RESULTS_LIMIT * OVERSAMPLE
+        )
     )
 
-    channels = cursor.fetchall()
+    channels = [ch for ch in cursor.fetchall() if not pair_index.reposted((result['id'],), ch['id'])]
+    channels = channels[:FIND_RESULTS_LIMIT]
     cursor.close()
     conn.close()
 
@@ -464,20 +1016,66 @@ async def find_channels(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    text = f"🔍 *Найдено {len(channels)} похожих каналов:*\n\n"
-    for ch in channels:
-        text += (f"• *{ch['channel_username']}* - 👥 {ch['subscriber_count']} подписчиков\n"
-                 f"  ✅ Подтверждено: {ch['confirmed_count']} | ⏳ Ожидает: {ch['pending_count']}\n")
+    # The first page is shown now; later pages are not counted as impressions
+    if impression_buffer:
+        impression_buffer.record(ch['id'] for ch in channels[:FIND_PAGE_SIZE])
+    pages = split_pages(*find_results_parts(channels), per_page=FIND_PAGE_SIZE)
+    reply_cache.put(cached_reply_key(user_id, 'find', context.args), pages[0])
+    await reply_pages(update.message, user_id, pages)
 
-    text += "\n💡 Подпишитесь на канал, сделайте репост и используйте /done *[канал]* *[на_каком_канале]*."
 
-    await update.message.reply_text(text, parse_mode='Markdown')
+# Command /find without a channel: candidates for each of the user's channels
+async def find_for_all_channels(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+
+    conn = Database.get_connection()
+    if not conn:
+        await update.message.reply_text(ERROR_TEXT, parse_mode='Markdown')
+        return
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            "SELECT id, channel_username, subscriber_count FROM channels WHERE owner_user_id = %s "
+            "ORDER BY subscriber_count DESC LIMIT %s",
+            (user_id, MAX_CHANNELS)
+        )
+        own_channels = cursor.fetchall()
+        if not own_channels:
+            await update.message.reply_text(
+                "❌ У вас нет добавленных каналов. Используйте /add\n"
+                "Или укажите канал: /find @mychannel",
+                parse_mode='Markdown'
+            )
+            return
+
+        # Overlapping bands are merged, so every band is sampled once by a single statement
+        bands = merge_bands(own_channels, PER_CHANNEL_LIMIT)
+        cursor.execute(candidates_query('', bands), candidates_params(user_id, bands))
+        # Channels a member of the band already reposted for are left out
+        member_ids = [[ch['id'] for ch in members] for _, _, _, members in bands]
+        rows = [row for row in cursor.fetchall() if not pair_index.reposted(member_ids[row['band']], row['id'])]
+        found = assign_candidates(bands, rows, PER_CHANNEL_LIMIT)
+    finally:
+        cursor.close()
+        conn.close()
+
+    if impression_buffer:
+        impression_buffer.record(ch['id'] for rows in found.values() for ch in rows)
+    pages = split_pages(*find_all_results_parts(own_channels, found))
+    reply_cache.put(cached_reply_key(user_id, 'find', context.args), pages[0])
+    await reply_pages(update.message, user_id, pages)
 
 
 # Command /done
 async def done_repost(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
 
+    bulk = split_bulk_args(context.args, 'on')
+    if bulk is not None:
+        await done_reposts_bulk(update, context, *bulk)
+        return
+
     if len(context.args) < 2:
         await update.message.reply_text(
             "❌ Укажите имя канала, для которого сделали репост, и канал, на котором был сделан репост.\n"
@@ -496,7 +1094,7 @@ async def done_repost(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     conn = Database.get_connection()
     if not conn:
-        await update.message.reply_text("❌ Ошибка. Пожалуйста, попробуйте повторить попытку позже.", parse_mode='Markdown')
+        await update.message.reply_text(ERROR_TEXT, parse_mode='Markdown')
         return
 
     cursor = conn.cursor(dictionary=True)
@@ -520,11 +1118,12 @@ async def done_repost(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Check that the user is the owner of their channel
     cursor.execute(
-        "SELECT id FROM channels WHERE channel_username = %s AND owner_user_id = %s",
+        "SELECT id, channel_id FROM channels WHERE channel_username = %s AND owner_user_id = %s",
         (repost_channel, user_id)
     )
 
-    if not cursor.fetchone():
+    from_channel_row = cursor.fetchone()
+    if not from_channel_row:
         await update.message.reply_text(
             f"❌ Канал *{repost_channel}* не найден или вы не являетесь его владельцем",
             parse_mode='Markdown'
@@ -533,11 +1132,10 @@ async def done_repost(update: Update, context: ContextTypes.DEFAULT_TYPE):
         conn.close()
         return
 
-    from_channel = repost_channel
-
-    # Get the owner of the target channel
+    # Get the owner of the target channel and how they want to be notified
     cursor.execute(
-        "SELECT owner_user_id FROM channels WHERE channel_username = %s",
+        "SELECT c.id, c.channel_id, c.owner_user_id, COALESCE(s.digest, 0) AS digest FROM channels c "
+        "LEFT JOIN user_settings s ON s.user_id = c.owner_user_id WHERE c.channel_username = %s",
         (to_channel,)
     )
 
@@ -556,11 +1154,16 @@ async def done_repost(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Create a repost entry
     try:
         cursor.execute(
-            "INSERT INTO reposts (from_channel, to_channel, repost_channel, from_user_id, to_user_id, status) "
+            "INSERT INTO reposts (from_channel_id, to_channel_id, repost_channel, from_user_id, to_user_id, status) "
             "VALUES (%s, %s, %s, %s, %s, 'pending')",
-            (from_channel, to_channel, repost_channel, user_id, to_user_id)
+            (from_channel_row['id'], to_owner_result['id'], repost_channel, user_id, to_user_id)
         )
         conn.commit()
+        repost_id = cursor.lastrowid
+        if expiry_scheduler:
+            expiry_scheduler.schedule(repost_id)
+        pending_index.add(repost_id, from_channel_row['channel_id'], to_owner_result['channel_id'])
+        pair_index.add(from_channel_row['id'], to_owner_result['id'])
 
         await update.message.reply_text(
             f"✅ Уведомление отправлено владельцу канала *{to_channel}*.\n"
@@ -568,15 +1171,20 @@ async def done_repost(update: Update, context: ContextTypes.DEFAULT_TYPE):
             parse_mode='Markdown'
         )
 
+        # Owners with a digest get the repost in their next one
+        if DIGEST_INTERVAL and to_owner_result['digest']:
+            return
+
         # Notify the channel owner
         try:
             await context.bot.send_message(
                 chat_id=to_user_id,
                 text=f"🔔 *Новое уведомление о репосте!*\n\n"
                      f"Канал *{repost_channel}* сообщает, что сделал репост для *{to_channel}*.\n\n"
-                     f"Проверьте и подтвердите командой:\n"
+                     f"Проверьте и подтвердите кнопкой ниже или командой:\n"
                      f"/confirm *{to_channel}* *{repost_channel}*",
-                parse_mode='Markdown'
+                parse_mode='Markdown',
+                reply_markup=InlineKeyboardMarkup([repost_buttons(repost_id)])
             )
         except Exception as e:
             logger.error(f"Не удалось отправить уведомление: {e}")
@@ -591,6 +1199,78 @@ async def done_repost(update: Update, context: ContextTypes.DEFAULT_TYPE):
         conn.close()
 
 
+# Command /done @a @b on @mine: one request for several target channels
+async def done_reposts_bulk(update: Update, context: ContextTypes.DEFAULT_TYPE, targets, repost_channel):
+    user_id = update.effective_user.id
+
+    if not targets or not repost_channel:
+        await update.message.reply_text(
+            "❌ Укажите каналы, для которых сделали репост, и канал, на котором был сделан репост.\n"
+            "Пример: /done @first @second on @yourchannel",
+            parse_mode='Markdown'
+        )
+        return
+
+    # Repeats are dropped once the names look the way the catalog stores them
+    targets = unique_names([target if target.startswith('@') else '@' + target for target in targets])
+    if len(targets) > MAX_TARGETS:
+        await update.message.reply_text(f"❌ Не больше {MAX_TARGETS} каналов за раз.")
+        return
+
+    if not repost_channel.startswith('@'):
+        repost_channel = '@' + repost_channel
+
+    conn = Database.get_connection()
+    if not conn:
+        await update.message.reply_text(ERROR_TEXT, parse_mode='Markdown')
+        return
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        # The user's channel and every target in one query
+        channels = load_channels(cursor, '', [repost_channel, *targets])
+        own = channels.get(repost_channel.lower())
+        if not own or own['owner_user_id'] != user_id:
+            await update.message.reply_text(
+                f"❌ Канал *{repost_channel}* не найден или вы не являетесь его владельцем",
+                parse_mode='Markdown'
+            )
+            return
+
+        found = [channels[t.lower()] for t in targets if t.lower() in channels and channels[t.lower()] is not own]
+        missing = [target for target in targets if target.lower() not in channels]
+        created, existing = create_pending(conn, cursor, '', user_id, own, found) if found else ([], [])
+    except mysql.connector.IntegrityError:
+        conn.rollback()
+        await update.message.reply_text(
+            f"❌ Запрос на подтверждение репоста уже существует",
+            parse_mode='Markdown'
+        )
+        return
+    finally:
+        cursor.close()
+        conn.close()
+
+    for target in created:
+        if expiry_scheduler:
+            expiry_scheduler.schedule(target['repost_id'])
+        pending_index.add(target['repost_id'], own['channel_id'], target['channel_id'])
+        pair_index.add(own['id'], target['id'])
+
+    await update.message.reply_text(render_bulk_done(created, existing, missing), parse_mode='Markdown')
+
+    # One message per owner; owners with a digest get the reposts in their next one
+    await send_notifications(context.bot, [
+        (
+            owner_id,
+            render_done_notice(own['channel_username'], rows),
+            InlineKeyboardMarkup([repost_buttons(row['repost_id'], row['channel_username']) for row in rows])
+        )
+        for owner_id, rows in group_by(created, 'owner_user_id').items()
+        if not (DIGEST_INTERVAL and rows[0]['digest'])
+    ])
+
+
 # Command /confirm
 async def confirm_repost(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
@@ -613,7 +1293,7 @@ async def confirm_repost(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     conn = Database.get_connection()
     if not conn:
-        await update.message.reply_text("❌ Ошибка. Пожалуйста, попробуйте повторить попытку позже.", parse_mode='Markdown')
+        await update.message.reply_text(ERROR_TEXT, parse_mode='Markdown')
         return
 
     cursor = conn.cursor(dictionary=True)
@@ -624,7 +1304,8 @@ async def confirm_repost(update: Update, context: ContextTypes.DEFAULT_TYPE):
         (my_channel, user_id)
     )
 
-    if not cursor.fetchone():
+    my_channel_row = cursor.fetchone()
+    if not my_channel_row:
         await update.message.reply_text(
             f"❌ Канал *{my_channel}* не найден или вы не являетесь его владельцем",
             parse_mode='Markdown'
@@ -635,11 +1316,12 @@ async def confirm_repost(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Finding a pending repost
     cursor.execute(
-        "SELECT r.id, r.from_channel, r.from_user_id "
+        "SELECT r.id, r.from_user_id, r.from_channel_id "
         "FROM reposts r "
-        "WHERE r.to_channel = %s AND r.from_channel = %s AND r.to_user_id = %s AND r.status = 'pending' "
+        "JOIN channels f ON f.id = r.from_channel_id "
+        "WHERE r.to_channel_id = %s AND f.channel_username = %s AND r.to_user_id = %s AND r.status = 'pending' "
         "LIMIT 1",
-        (my_channel, repost_channel, user_id)
+        (my_channel_row['id'], repost_channel, user_id)
     )
 
     repost = cursor.fetchone()
@@ -654,6 +1336,7 @@ async def confirm_repost(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Updating the subscriber count on both channels.
     updated_counts = {}
+    observations = []
 
     # Updating the subscribers of the channel that reposted.
     try:
@@ -661,9 +1344,10 @@ async def confirm_repost(update: Update, context: ContextTypes.DEFAULT_TYPE):
         repost_member_count = await context.bot.get_chat_member_count(repost_chat.id)
 
         cursor.execute(
-            "UPDATE channels SET subscriber_count = %s WHERE channel_username = %s",
-            (repost_member_count, repost_channel)
+            "UPDATE channels SET subscriber_count = %s WHERE id = %s",
+            (repost_member_count, repost['from_channel_id'])
         )
+        observations.append((repost['from_channel_id'], repost_member_count))
 
         updated_counts[repost_channel] = repost_member_count
     except Exception as e:
@@ -675,28 +1359,41 @@ async def confirm_repost(update: Update, context: ContextTypes.DEFAULT_TYPE):
         my_member_count = await context.bot.get_chat_member_count(my_chat.id)
 
         cursor.execute(
-            "UPDATE channels SET subscriber_count = %s WHERE channel_username = %s",
-            (my_member_count, my_channel)
+            "UPDATE channels SET subscriber_count = %s WHERE id = %s",
+            (my_member_count, my_channel_row['id'])
         )
+        observations.append((my_channel_row['id'], my_member_count))
 
         updated_counts[my_channel] = my_member_count
     except Exception as e:
         logger.error(f"Не удалось обновить количество подписчиков для {my_channel}: {e}")
 
-    # Confirming the repost
+    record_observations(cursor, '', observations)
+
+    # Confirming the repost, unless it was confirmed or rejected in the meantime
     cursor.execute(
-        "UPDATE reposts SET status = 'confirmed', confirmed_date = NOW() WHERE id = %s",
+        "UPDATE reposts SET status = 'confirmed', confirmed_date = NOW() WHERE id = %s AND status = 'pending'",
         (repost['id'],)
     )
-    conn.commit()
+    confirmed = cursor.rowcount
+    if confirmed:
+        conn.commit()
+    else:
+        conn.rollback()
     cursor.close()
     conn.close()
+    pending_index.discard(repost['id'])
+    if not confirmed:
+        await update.message.reply_text(
+            f"❌ Нет ожидающих подтверждения репостов от канала *{repost_channel}* для *{my_channel}*.",
+            parse_mode='Markdown'
+        )
+        return
 
-    response_text = f"✅ Репост от канала *{repost_channel}* для вашего канала *{my_channel}* подтверждён!"
-    if updated_counts:
-        response_text += "\n\n📊 *Обновлена статистика:*"
-        for channel, count in updated_counts.items():
-            response_text += f"\n• *{channel}*: {count} подписчиков"
+    stats_text = render_updated_counts(updated_counts)
+    response_text = (
+        f"✅ Репост от канала *{repost_channel}* для вашего канала *{my_channel}* подтверждён!{stats_text}"
+    )
 
     await update.message.reply_text(response_text, parse_mode='Markdown')
 
@@ -704,12 +1401,8 @@ async def confirm_repost(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         notification_text = (
             f"🎉 *Ваш репост подтверждён!*\n\n"
-            f"Владелец канала *{my_channel}* подтвердил репост с вашего канала *{repost_channel}*."
+            f"Владелец канала *{my_channel}* подтвердил репост с вашего канала *{repost_channel}*.{stats_text}"
         )
-        if updated_counts:
-            notification_text += "\n\n📊 *Обновлена статистика:*"
-            for channel, count in updated_counts.items():
-                notification_text += f"\n• *{channel}*: {count} подписчиков"
 
         await context.bot.send_message(
             chat_id=repost['from_user_id'],
@@ -720,19 +1413,285 @@ async def confirm_repost(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Не удалось отправить уведомление: {e}")
 
 
+# Command /confirm_all
+async def confirm_all_reposts(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+
+    if not context.args:
+        await update.message.reply_text(
+            "❌ Укажите имя своего канала.\n"
+            "Пример: /confirm\\_all *@mychannel*",
+            parse_mode='Markdown'
+        )
+        return
+
+    my_channel = context.args[0].strip()
+    if not my_channel.startswith('@'):
+        my_channel = '@' + my_channel
+
+    conn = Database.get_connection()
+    if not conn:
+        await update.message.reply_text(ERROR_TEXT, parse_mode='Markdown')
+        return
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        # Ownership and the pending reposts in one query
+        own, reposts = pending_for_channel(cursor, '', user_id, my_channel)
+        if own is None:
+            await update.message.reply_text(
+                f"❌ Канал *{my_channel}* не найден или вы не являетесь его владельцем",
+                parse_mode='Markdown'
+            )
+            return
+        if not reposts:
+            await update.message.reply_text(
+                f"📭 Нет ожидающих подтверждения репостов для *{own['channel_username']}*.",
+                parse_mode='Markdown'
+            )
+            return
+
+        # Subscriber counts of every channel involved, requested concurrently
+        usernames = {repost['from_channel_id']: repost['from_channel'] for repost in reposts}
+        usernames[own['id']] = own['channel_username']
+        counts = await fetch_member_counts(context.bot, usernames)
+        confirmed = confirm_pending(conn, cursor, '', reposts, counts)
+    finally:
+        cursor.close()
+        conn.close()
+
+    # None of them is pending any more, confirmed here or not
+    for repost in reposts:
+        pending_index.discard(repost['id'])
+    reposts = confirmed
+
+    updated_counts = {usernames[channel_id]: count for channel_id, count in counts.items()}
+    await update.message.reply_text(
+        f"✅ Подтверждено репостов для канала *{own['channel_username']}*: {len(reposts)}"
+        f"{render_updated_counts(updated_counts)}",
+        parse_mode='Markdown'
+    )
+
+    # One message per repost author
+    notices = []
+    for from_user_id, rows in group_by(reposts, 'from_user_id').items():
+        channel_counts = {
+            usernames[channel_id]: counts[channel_id]
+            for channel_id in [own['id'], *[row['from_channel_id'] for row in rows]] if channel_id in counts
+        }
+        notices.append((
+            from_user_id,
+            render_confirmed_notice(own['channel_username'], rows, render_updated_counts(channel_counts)),
+            None
+        ))
+    await send_notifications(context.bot, notices)
+
+
+# Confirm/Reject buttons of repost notifications
+async def repost_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    parsed = verify_callback(CALLBACK_SECRET, query.data)
+    if not parsed:
+        await query.answer("❌ Кнопка недействительна")
+        return
+    action, repost_id = parsed
+    # Notifications older than 48 hours can no longer be read or edited
+    if not query.message or not query.message.is_accessible:
+        await query.answer("❌ Уведомление устарело, используйте /list")
+        return
+
+    conn = Database.get_connection()
+    if not conn:
+        await query.answer(ERROR_TEXT)
+        return
+
+    changed = False
+    cursor = conn.cursor(dictionary=True)
+    try:
+        # Primary key lookup, the channels joined by their primary keys
+        cursor.execute(
+            "SELECT r.id, r.status, r.from_user_id, r.to_user_id, r.from_channel_id, r.to_channel_id, "
+            "f.channel_username AS from_channel, t.channel_username AS to_channel "
+            "FROM reposts r "
+            "JOIN channels f ON f.id = r.from_channel_id "
+            "JOIN channels t ON t.id = r.to_channel_id "
+            "WHERE r.id = %s",
+            (repost_id,)
+        )
+        repost = cursor.fetchone()
+        if not repost or repost['to_user_id'] != query.from_user.id:
+            await query.answer("❌ Запрос на подтверждение репоста не найден")
+            return
+        if repost['status'] == 'pending':
+            updated_counts = {}
+            if action == 'confirm':
+                usernames = {
+                    repost['from_channel_id']: repost['from_channel'],
+                    repost['to_channel_id']: repost['to_channel'],
+                }
+                counts = await fetch_member_counts(context.bot, usernames)
+                changed = bool(confirm_pending(conn, cursor, '', [repost], counts))
+                updated_counts = {usernames[channel_id]: count for channel_id, count in counts.items()}
+            else:
+                cursor.execute(
+                    "UPDATE reposts SET status = 'rejected' WHERE id = %s AND status = 'pending'",
+                    (repost_id,)
+                )
+                changed = cursor.rowcount == 1
+                conn.commit()
+                if changed:
+                    pair_index.remove(repost['from_channel_id'], repost['to_channel_id'])
+            pending_index.discard(repost_id)
+        # A double tap, /confirm or expiry may have resolved the request first
+        if changed:
+            result = render_button_result(action, repost)
+        else:
+            result = f"ℹ️ Запрос от канала *{repost['from_channel']}* для *{repost['to_channel']}* уже обработан."
+    finally:
+        cursor.close()
+        conn.close()
+
+    await query.answer()
+
+    # The pressed row leaves the keyboard, the outcome is appended to the notification
+    pressed = {sign_callback(CALLBACK_SECRET, name, repost_id) for name in ('confirm', 'reject')}
+    keyboard = query.message.reply_markup.inline_keyboard if query.message.reply_markup else ()
+    rows = [row for row in keyboard if not any(button.callback_data in pressed for button in row)]
+    await query.edit_message_text(
+        f"{query.message.text_markdown}\n\n{result}",
+        parse_mode='Markdown',
+        reply_markup=InlineKeyboardMarkup(rows) if rows else None
+    )
+
+    if not changed:
+        return
+
+    # Notify the author of the repost
+    if action == 'confirm':
+        text = render_confirmed_notice(repost['to_channel'], [repost], render_updated_counts(updated_counts))
+    else:
+        text = (
+            f"❌ Владелец канала *{repost['to_channel']}* отклонил репост с вашего канала "
+            f"*{repost['from_channel']}*."
+        )
+    await send_notifications(context.bot, [(repost['from_user_id'], text, None)])
+
+
+# Next/Prev buttons of paginated replies edit the message in place
+async def page_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    parsed = parse_page_callback(query.data)
+    pages = page_cache.get(parsed[0], query.from_user.id) if parsed else None
+    if not pages or parsed[1] >= len(pages):
+        await query.answer("⌛ Результаты устарели, повторите команду")
+        return
+
+    page = parsed[1]
+    await query.answer()
+    await query.edit_message_text(
+        pages[page],
+        parse_mode='Markdown',
+        reply_markup=page_buttons(parsed[0], page, len(pages))
+    )
+
+
+# Forwarded channel posts: a forward from the reposted channel confirms the pending repost
+async def auto_confirm_repost(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    post = update.channel_post
+    origin = post.forward_origin
+    if not isinstance(origin, MessageOriginChannel):
+        return
+
+    repost_id = pending_index.find(post.chat.id, origin.chat.id)
+    if repost_id is None:
+        return
+
+    conn = Database.get_connection()
+    if not conn:
+        return
+
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute(
+        "SELECT r.id, r.from_user_id, r.to_user_id, r.from_channel_id, r.to_channel_id, "
+        "f.channel_username AS from_channel, t.channel_username AS to_channel "
+        "FROM reposts r "
+        "JOIN channels f ON f.id = r.from_channel_id "
+        "JOIN channels t ON t.id = r.to_channel_id "
+        "WHERE r.id = %s AND r.status = 'pending'",
+        (repost_id,)
+    )
+
+    repost = cursor.fetchone()
+    if not repost:
+        # Confirmed or expired elsewhere
+        pending_index.discard(repost_id)
+        cursor.close()
+        conn.close()
+        return
+
+    # Updating the subscriber count on both channels, the chat ids are already known
+    updated_counts = {}
+    observations = []
+    for chat_id, channel_id, channel_username in (
+        (post.chat.id, repost['from_channel_id'], repost['from_channel']),
+        (origin.chat.id, repost['to_channel_id'], repost['to_channel']),
+    ):
+        try:
+            member_count = await context.bot.get_chat_member_count(chat_id)
+            cursor.execute(
+                "UPDATE channels SET subscriber_count = %s WHERE id = %s",
+                (member_count, channel_id)
+            )
+            observations.append((channel_id, member_count))
+            updated_counts[channel_username] = member_count
+        except Exception as e:
+            logger.error(f"Не удалось обновить количество подписчиков для {channel_username}: {e}")
+
+    record_observations(cursor, '', observations)
+
+    cursor.execute(
+        "UPDATE reposts SET status = 'confirmed', confirmed_date = NOW() WHERE id = %s AND status = 'pending'",
+        (repost_id,)
+    )
+    confirmed = cursor.rowcount
+    conn.commit()
+    cursor.close()
+    conn.close()
+    pending_index.discard(repost_id)
+    if not confirmed:
+        return
+
+    stats_text = render_updated_counts(updated_counts)
+    notifications = (
+        (repost['from_user_id'],
+         f"🎉 *Ваш репост подтверждён автоматически!*\n\n"
+         f"Бот увидел в канале *{repost['from_channel']}* пересланный пост из *{repost['to_channel']}*.{stats_text}"),
+        (repost['to_user_id'],
+         f"✅ Репост канала *{repost['from_channel']}* для вашего канала *{repost['to_channel']}* "
+         f"подтверждён автоматически.{stats_text}"),
+    )
+    for chat_id, text in notifications:
+        try:
+            await context.bot.send_message(chat_id=chat_id, text=text, parse_mode='Markdown')
+        except Exception as e:
+            logger.error(f"Не удалось отправить уведомление: {e}")
+
+
 # Command /list
 async def list_pending(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
 
     conn = Database.get_connection()
     if not conn:
-        await update.message.reply_text("❌ Ошибка. Пожалуйста, попробуйте повторить попытку позже.")
+        await update.message.reply_text(ERROR_TEXT)
         return
 
     cursor = conn.cursor(dictionary=True)
     cursor.execute(
-        "SELECT r.from_channel, r.to_channel, r.created_date "
+        "SELECT f.channel_username AS from_channel, t.channel_username AS to_channel, r.created_date "
         "FROM reposts r "
+        "JOIN channels f ON f.id = r.from_channel_id "
+        "JOIN channels t ON t.id = r.to_channel_id "
         "WHERE r.to_user_id = %s AND r.status = 'pending' "
         "ORDER BY r.created_date DESC",
         (user_id,)
@@ -746,32 +1705,68 @@ async def list_pending(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("📭 Нет ожидающих подтверждения репостов.")
         return
 
-    text = "📋 *Ожидают подтверждения:*\n\n"
-    for r in reposts:
-        date_str = r['created_date'].strftime('%d.%m.%Y %H:%M')
-        text += f"• *{r['from_channel']}* → *{r['to_channel']}*\n  📅 {date_str}\n\n"
+    await reply_pages(update.message, user_id, split_pages(*pending_list_parts(reposts)))
 
-    text += "Используйте /confirm *[свой_канал]* *[канал_репоста]* для подтверждения."
 
-    await update.message.reply_text(text, parse_mode='Markdown')
+# Command /digest
+async def digest_settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+
+    if not DIGEST_INTERVAL:
+        await update.message.reply_text("❌ Сводки уведомлений отключены.")
+        return
+
+    choice = context.args[0].lower() if context.args else ''
+    if choice not in ('', 'on', 'off'):
+        await update.message.reply_text("❌ Используйте /digest on или /digest off")
+        return
+
+    conn = Database.get_connection()
+    if not conn:
+        await update.message.reply_text(ERROR_TEXT)
+        return
+
+    cursor = conn.cursor()
+    try:
+        if choice:
+            set_digest(cursor, '', user_id, choice == 'on')
+            conn.commit()
+            enabled = choice == 'on'
+        else:
+            enabled = digest_enabled(cursor, '', user_id)
+    finally:
+        cursor.close()
+        conn.close()
+
+    hours = max(DIGEST_INTERVAL // 3600, 1)
+    if enabled:
+        text = (
+            f"🔕 Уведомления о новых репостах приходят одной сводкой не чаще раза в {hours} ч.\n"
+            "Отключить: /digest off"
+        )
+    else:
+        text = "🔔 Уведомления о новых репостах приходят сразу.\nПолучать сводкой: /digest on"
+    await update.message.reply_text(text)
 
 
 # Command /stat
 async def show_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE):
     conn = Database.get_connection()
     if not conn:
-        await update.message.reply_text("❌ Ошибка. Пожалуйста, попробуйте повторить попытку позже.")
+        await update.message.reply_text(ERROR_TEXT)
         return
 
     cursor = conn.cursor(dictionary=True)
 
-    # Get total number of channels
-    cursor.execute("SELECT COUNT(*) as total FROM channels")
-    channels_count = cursor.fetchone()['total']
+    # Get total number of channels and of their archived confirmed reposts
+    cursor.execute("SELECT COUNT(*) as total, COALESCE(SUM(archived_confirmed), 0) as archived FROM channels")
+    row = cursor.fetchone()
+    channels_count = row['total']
+    archived_count = row['archived']
 
     # Get total number of confirmed reposts
     cursor.execute("SELECT COUNT(*) as total FROM reposts WHERE status = 'confirmed'")
-    confirmed_count = cursor.fetchone()['total']
+    confirmed_count = cursor.fetchone()['total'] + archived_count
 
     # Get total number of pending reposts
     cursor.execute("SELECT COUNT(*) as total FROM reposts WHERE status = 'pending'")
@@ -786,6 +1781,7 @@ async def show_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"✅ Подтверждённых репостов: *{confirmed_count}*\n"
         f"⏳ Ожидают подтверждения: *{pending_count}*"
     )
+    reply_cache.put(cached_reply_key(None, 'stat', ()), text)
 
     await update.message.reply_text(text, parse_mode='Markdown')
 
@@ -809,7 +1805,7 @@ async def report_abuse(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     conn = Database.get_connection()
     if not conn:
-        await update.message.reply_text("❌ Ошибка. Пожалуйста, попробуйте повторить попытку позже.")
+        await update.message.reply_text(ERROR_TEXT)
         return
 
     cursor = conn.cursor()
@@ -840,9 +1836,9 @@ async def report_abuse(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Saving the complaint
     cursor.execute(
-        "INSERT INTO abuse_reports (reporter_user_id, channel_username, reason) "
-        "VALUES (%s, %s, %s)",
-        (user_id, channel_username, reason)
+        "INSERT INTO abuse_reports (reporter_user_id, channel_id, channel_username, reason) "
+        "VALUES (%s, %s, %s, %s)",
+        (user_id, target_channel[0], channel_username, reason)
     )
     conn.commit()
     cursor.close()
@@ -855,6 +1851,17 @@ async def report_abuse(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+# Command /health (admin only)
+async def health(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if ADMIN_USER_ID is None or update.effective_user.id != ADMIN_USER_ID:
+        return
+
+    text = "🩺 *Состояние сервисов:*\n\n" + "\n".join([
+        f"• {name}: {state}" for name, state in breaker_states().items()
+    ])
+    await update.message.reply_text(text, parse_mode='Markdown')
+
+
 # Error handler
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.error(f"Update {update} caused error {context.error}")
@@ -862,48 +1869,138 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # Post-initialization hook to set up bot commands menu
 async def post_init(application: Application) -> None:
-    """Set up bot commands menu after initialization"""
-    commands = [
-        BotCommand("start", "Запустить бота"),
-        BotCommand("help", "Показать справку по командам"),
-        BotCommand("add", "Добавить свой канал в каталог"),
-        BotCommand("my", "Показать мои каналы"),
-        BotCommand("delete", "Удалить канал из каталога"),
-        BotCommand("update", "Обновить количество подписчиков"),
-        BotCommand("find", "Найти похожие каналы для обмена"),
-        BotCommand("done", "Сообщить о выполненном репосте"),
-        BotCommand("confirm", "Подтвердить репост"),
-        BotCommand("list", "Список ожидающих подтверждения"),
-        BotCommand("stat", "Показать статистику бота"),
-        BotCommand("abuse", "Пожаловаться на канал"),
-    ]
-    await application.bot.set_my_commands(commands)
+    """Set up bot commands menu, the pending repost expiry and digests after initialization"""
+    await application.bot.set_my_commands(BOT_COMMANDS)
     logger.info("Bot commands menu has been set up")
 
+    pending_index.load()
+    pair_index.load(Database.get_connection, '')
+
+    notify = thread_notifier(application, asyncio.get_running_loop())
+    if PENDING_EXPIRY_DAYS:
+        start_expiry_scheduler(notify)
+    if DIGEST_INTERVAL:
+        start_digest(Database.get_connection, '', notify, render_digest, DIGEST_INTERVAL, DIGEST_NOTIFY_RATE)
+
+
+def thread_notifier(application, loop):
+    """Blocking send_message for background threads, the bot lives on the application's event loop"""
+    def notify(user_id, text):
+        asyncio.run_coroutine_threadsafe(
+            application.bot.send_message(chat_id=user_id, text=text), loop
+        ).result(timeout=30)
+
+    return notify
+
+
+def forget_expired(repost):
+    pending_index.discard(repost['id'])
+    pair_index.remove(repost['from_channel_id'], repost['to_channel_id'])
+
+
+def start_expiry_scheduler(notify):
+    global expiry_scheduler
+
+    expiry_scheduler = ExpiryScheduler(
+        Database.get_connection, '', PENDING_EXPIRY_DAYS, PENDING_EXPIRY_BATCH_SIZE,
+        notify if PENDING_EXPIRY_NOTIFY else None, EXPIRY_NOTIFY_RATE,
+        EXPIRY_REQUESTER_TEXT, EXPIRY_OWNER_TEXT, on_expire=forget_expired
+    )
+    expiry_scheduler.start()
+
+
+# Command name -> handler, registered in this order
+COMMAND_HANDLERS = (
+    ("start", start),
+    ("help", help_command),
+    ("add", add_channel),
+    ("my", my_channels),
+    ("delete", delete_channel),
+    ("update", update_channel_stats),
+    ("find", find_channels),
+    ("done", done_repost),
+    ("confirm", confirm_repost),
+    ("confirm_all", confirm_all_reposts),
+    ("list", list_pending),
+    ("digest", digest_settings),
+    ("stat", show_statistics),
+    ("abuse", report_abuse),
+    ("health", health),
+)
+HANDLED_COMMANDS = frozenset(command for command, _ in COMMAND_HANDLERS)
+
+
+def build_application(request=None):
+    """Create the application with all handlers registered"""
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .request(request or CircuitBreakerRequest(connection_pool_size=256))
+        .post_init(post_init)
+        .build()
+    )
+
+    # Traffic recorder sees every update, including throttled ones
+    if traffic_recorder:
+        application.add_handler(TypeHandler(Update, record_update), group=-2)
+
+    # Anti-flood guard runs in an earlier group than the command handlers
+    application.add_handler(TypeHandler(Update, rate_limit_guard), group=-1)
+
+    # Registering command handlers
+    for command, callback in COMMAND_HANDLERS:
+        application.add_handler(CommandHandler(command, instrumented(command, callback)))
+
+    # Inline Next/Prev buttons of paginated replies and Confirm/Reject buttons of repost notifications
+    application.add_handler(CallbackQueryHandler(instrumented('page', page_button), pattern=r'^p:'))
+    application.add_handler(CallbackQueryHandler(instrumented('button', repost_button)))
+
+    # Forwards in catalogued channels confirm pending reposts
+    application.add_handler(MessageHandler(
+        filters.UpdateType.CHANNEL_POST & filters.FORWARDED,
+        instrumented('channel_post', auto_confirm_repost)
+    ))
+
+    # Error handler
+    application.add_error_handler(error_handler)
+
+    return application
+
 
 def main():
+    global impression_buffer
+
     # Database initialization
     Database.init_db()
 
     # Creating an application
-    application = Application.builder().token(BOT_TOKEN).post_init(post_init).build()
+    application = build_application()
 
-    # Registering command handlers
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("add", add_channel))
-    application.add_handler(CommandHandler("my", my_channels))
-    application.add_handler(CommandHandler("delete", delete_channel))
-    application.add_handler(CommandHandler("update", update_channel_stats))
-    application.add_handler(CommandHandler("find", find_channels))
-    application.add_handler(CommandHandler("done", done_repost))
-    application.add_handler(CommandHandler("confirm", confirm_repost))
-    application.add_handler(CommandHandler("list", list_pending))
-    application.add_handler(CommandHandler("stat", show_statistics))
-    application.add_handler(CommandHandler("abuse", report_abuse))
+    # Moving finished reposts to the archive table
+    if ARCHIVE_AFTER_DAYS:
+        start_archiver(
+            Database.get_connection, '', ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, ARCHIVE_INTERVAL, ARCHIVE_BATCH_PAUSE
+        )
 
-    # Error handler
-    application.add_error_handler(error_handler)
+    # Downsampling subscriber history and refreshing the /update summary
+    if HISTORY_JOB_INTERVAL:
+        start_history_jobs(Database.get_connection, '', HISTORY_RAW_DAYS, HISTORY_JOB_INTERVAL)
+
+    # Recomputing the reliability scores weighting /find
+    if MATCH_SCORE_INTERVAL:
+        start_score_job(Database.get_connection, '', MATCH_SCORE_INTERVAL)
+
+    # Counting /find impressions, written behind in batches
+    if IMPRESSION_FLUSH_INTERVAL:
+        impression_buffer = ImpressionBuffer(
+            Database.get_connection, '', IMPRESSION_FLUSH_INTERVAL, IMPRESSION_DECAY_INTERVAL
+        )
+        impression_buffer.start()
+
+    # Metrics side listener
+    if METRICS_PORT:
+        start_metrics_server(METRICS_HOST, METRICS_PORT, breaker_states)
+        logger.info(f"Serving metrics on {METRICS_HOST}:{METRICS_PORT}/metrics")
 
     # Launching the bot
     if BOT_MODE == 'webhook':
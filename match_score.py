@@ -0,0 +1,95 @@
+"""Per-channel reliability score weighting the random choice of /find candidates"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+import mysql.connector
+
+from subscriber_history import channel_id_batches
+
+logger = logging.getLogger(__name__)
+
+# Floor keeping every channel findable, and the factor for channels without
+# confirmations or new additions within RECENCY_DAYS
+MIN_SCORE = 0.01
+STALE_FACTOR = 0.5
+RECENCY_DAYS = 30
+# Pending reposts younger than this are not held against the owner yet
+PENDING_GRACE_DAYS = 2
+
+
+def channel_score(confirmed, unconfirmed, reports, active):
+    """Smoothed confirmation ratio, halved for inactive channels and divided by 1 + abuse reports.
+
+    A channel without history scores 0.5, the channels table default.
+    """
+    ratio = (confirmed + 1) / (confirmed + unconfirmed + 2)
+    score = ratio * (1 if active else STALE_FACTOR) / (1 + reports)
+    return round(max(score, MIN_SCORE), 4)
+
+
+def refresh_scores(conn, prefix):
+    """Recompute match_score of every channel, one id batch per transaction; returns the channels updated"""
+    now = datetime.now()
+    recent = now - timedelta(days=RECENCY_DAYS)
+    grace = now - timedelta(days=PENDING_GRACE_DAYS)
+    cursor = conn.cursor()
+    updated = 0
+    try:
+        for first_id, last_id in channel_id_batches(cursor, prefix):
+            cursor.execute(
+                "SELECT c.id, c.archived_confirmed + SUM(CASE WHEN r.status = 'confirmed' THEN 1 ELSE 0 END), "
+                "c.archived_unconfirmed + SUM(CASE WHEN r.status = 'rejected' "
+                "OR (r.status = 'pending' AND r.created_date < %s) THEN 1 ELSE 0 END), "
+                "SUM(CASE WHEN r.confirmed_date >= %s THEN 1 ELSE 0 END), c.added_date >= %s "
+                f"FROM {prefix}channels c LEFT JOIN {prefix}reposts r ON r.to_channel_id = c.id "
+                "WHERE c.id BETWEEN %s AND %s GROUP BY c.id, c.archived_confirmed, c.archived_unconfirmed, c.added_date",
+                (grace, recent, recent, first_id, last_id)
+            )
+            channels = cursor.fetchall()
+            if not channels:
+                continue
+            cursor.execute(
+                f"SELECT channel_id, COUNT(*) FROM {prefix}abuse_reports "
+                "WHERE channel_id BETWEEN %s AND %s GROUP BY channel_id",
+                (first_id, last_id)
+            )
+            reports = dict(cursor.fetchall())
+            cursor.executemany(
+                f"UPDATE {prefix}channels SET match_score = %s WHERE id = %s",
+                [
+                    (
+                        channel_score(int(confirmed or 0), int(unconfirmed or 0), reports.get(channel_id, 0),
+                                      bool(recent_confirmed) or bool(new)),
+                        channel_id
+                    )
+                    for channel_id, confirmed, unconfirmed, recent_confirmed, new in channels
+                ]
+            )
+            conn.commit()
+            updated += len(channels)
+    finally:
+        cursor.close()
+    return updated
+
+
+def start_score_job(get_connection, prefix, interval):
+    """Recompute the scores every interval seconds from a daemon thread"""
+    def run():
+        while True:
+            conn = get_connection()
+            if conn:
+                try:
+                    updated = refresh_scores(conn, prefix)
+                    logger.info(f"Refreshed match_score of {updated} {prefix}channels")
+                except mysql.connector.Error as err:
+                    conn.rollback()
+                    logger.error(f"Error refreshing {prefix}channels match_score: {err}")
+                finally:
+                    conn.close()
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name=f'{prefix}match-score', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,224 @@
+"""In-process metrics rendered in the Prometheus text exposition format"""
+import contextvars
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Buckets in seconds, shared by all latency histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Command being handled in the current task or thread, used to label DB queries
+current_command = contextvars.ContextVar('current_command', default='none')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {value}')
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                series = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted((labels, [list(series[0]), series[1], series[2]]) for labels, series in self._values.items())
+        bucket_names = self.labelnames + ('le',)
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{_format_labels(bucket_names, labels + (bound,))} {cumulative}')
+            lines.append(f'{self.name}_bucket{_format_labels(bucket_names, labels + ("+Inf",))} {count}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+REGISTRY = []
+
+command_latency = Histogram('bot_command_duration_seconds', 'Time spent handling a command', ['command'])
+command_errors = Counter('bot_command_errors_total', 'Commands that raised an exception', ['command'])
+updates_in_flight = Gauge('bot_updates_in_flight', 'Updates being handled right now')
+db_queries = Counter('bot_db_queries_total', 'Database queries executed', ['command'])
+db_query_seconds = Counter('bot_db_query_seconds_total', 'Time spent in database queries', ['command'])
+api_latency = Histogram('bot_api_request_duration_seconds', 'Outbound API request latency', ['api', 'method'])
+api_errors = Counter('bot_api_errors_total', 'Failed outbound API requests', ['api', 'method'])
+circuit_state = Gauge('bot_circuit_breaker_open', 'Circuit breaker state: 0 closed, 0.5 half-open, 1 open', ['breaker'])
+
+
+class CommandTimer:
+    """Context manager measuring one command: latency, errors and in-flight count"""
+
+    def __init__(self, command):
+        self.command = command
+
+    def __enter__(self):
+        self._token = current_command.set(self.command)
+        self._start = time.perf_counter()
+        updates_in_flight.inc()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        command_latency.observe(time.perf_counter() - self._start, self.command)
+        updates_in_flight.dec()
+        if exc_type is not None:
+            command_errors.inc(self.command)
+        current_command.reset(self._token)
+        return False
+
+
+class InstrumentedCursor:
+    """Cursor proxy counting queries and their time per command"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def _timed(self, method, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            command = current_command.get()
+            db_queries.inc(command)
+            db_query_seconds.inc(command, amount=time.perf_counter() - start)
+
+    def execute(self, *args, **kwargs):
+        return self._timed(self._cursor.execute, *args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        return self._timed(self._cursor.executemany, *args, **kwargs)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    """Connection proxy handing out instrumented cursors"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def render_metrics(breaker_states=None):
+    """Render every registered metric; breaker states are sampled on scrape"""
+    if breaker_states:
+        for name, state in breaker_states.items():
+            circuit_state.set({'closed': 0, 'half_open': 0.5, 'open': 1}[state], name)
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def start_metrics_server(host, port, breaker_states=None, critical=None):
+    """Serve /metrics and /health from a daemon thread on a listener of their own.
+
+    /health returns the circuit breaker states, 503 while any of the critical
+    ones (all by default) is open.
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split('?')[0]
+            states = breaker_states() if breaker_states else {}
+            if path == '/metrics':
+                status, content_type, body = 200, CONTENT_TYPE, render_metrics(states).encode('utf-8')
+            elif path == '/health':
+                status = 503 if any(
+                    state == 'open' for name, state in states.items() if critical is None or name in critical
+                ) else 200
+                content_type, body = 'application/json', json.dumps(states).encode('utf-8')
+            else:
+                self.send_error(404)
+                return
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,250 @@
+"""Schema migrations shared by the Telegram ('' prefix) and VK ('vk_' prefix) databases"""
+import logging
+
+import mysql.connector
+
+logger = logging.getLogger(__name__)
+
+# Rows per UPDATE when backfilling, keeps row locks short on large tables
+BACKFILL_BATCH_SIZE = 10000
+
+
+def column_exists(cursor, table, column):
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+        (table, column)
+    )
+    return cursor.fetchone()[0] > 0
+
+
+def index_names(cursor, table):
+    cursor.execute(
+        "SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+        (table,)
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+def index_columns(cursor, table, index):
+    cursor.execute(
+        "SELECT COLUMN_NAME FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s ORDER BY SEQ_IN_INDEX",
+        (table, index)
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def foreign_key_names(cursor, table, columns):
+    cursor.execute(
+        "SELECT DISTINCT CONSTRAINT_NAME FROM information_schema.KEY_COLUMN_USAGE "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND REFERENCED_TABLE_NAME IS NOT NULL "
+        f"AND COLUMN_NAME IN ({', '.join(['%s'] * len(columns))})",
+        (table, *columns)
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def backfill(conn, cursor, table, update_sql):
+    """Run an UPDATE ... WHERE id BETWEEN %s AND %s over the table in id batches"""
+    cursor.execute(f"SELECT MIN(id), MAX(id) FROM {table}")
+    first_id, last_id = cursor.fetchone()
+    if first_id is None:
+        return
+    for start in range(first_id, last_id + 1, BACKFILL_BATCH_SIZE):
+        cursor.execute(update_sql, (start, start + BACKFILL_BATCH_SIZE - 1))
+        conn.commit()
+
+
+def migrate_reposts_to_channel_ids(conn, prefix=''):
+    """Move {prefix}reposts from username foreign keys to integer channel ids.
+
+    Adds and backfills from_channel_id/to_channel_id, removes duplicated
+    pending pairs, then swaps the username columns, their foreign keys and
+    the composite indexes over to the id columns.
+    """
+    reposts = f'{prefix}reposts'
+    channels = f'{prefix}channels'
+    cursor = conn.cursor()
+    if not column_exists(cursor, reposts, 'from_channel'):
+        cursor.close()
+        return
+
+    logger.info(f"Migrating {reposts} to integer channel ids")
+    try:
+        if not column_exists(cursor, reposts, 'pending_key'):
+            cursor.execute(
+                f"ALTER TABLE {reposts} "
+                "ADD COLUMN pending_key TINYINT AS (IF(status = 'pending', 1, NULL)) STORED"
+            )
+        if not column_exists(cursor, reposts, 'from_channel_id'):
+            cursor.execute(
+                f"ALTER TABLE {reposts} "
+                "ADD COLUMN from_channel_id INT NULL AFTER id, "
+                "ADD COLUMN to_channel_id INT NULL AFTER from_channel_id"
+            )
+
+        backfill(
+            conn, cursor, reposts,
+            f"UPDATE {reposts} r "
+            f"JOIN {channels} f ON f.channel_username = r.from_channel "
+            f"JOIN {channels} t ON t.channel_username = r.to_channel "
+            "SET r.from_channel_id = f.id, r.to_channel_id = t.id "
+            "WHERE r.id BETWEEN %s AND %s AND r.from_channel_id IS NULL"
+        )
+        cursor.execute(f"DELETE FROM {reposts} WHERE from_channel_id IS NULL OR to_channel_id IS NULL")
+        if cursor.rowcount:
+            logger.info(f"Removed {cursor.rowcount} reposts of channels missing from {channels}")
+
+        existing = index_names(cursor, reposts)
+        if 'uniq_pending_pair' not in existing:
+            # Keep the oldest of duplicated pending requests
+            cursor.execute(
+                f"DELETE r1 FROM {reposts} r1 "
+                f"JOIN {reposts} r2 ON r1.to_channel = r2.to_channel AND r1.from_channel = r2.from_channel "
+                "WHERE r1.status = 'pending' AND r2.status = 'pending' AND r1.id > r2.id"
+            )
+            if cursor.rowcount:
+                logger.info(f"Removed {cursor.rowcount} duplicate pending reposts from {reposts}")
+        conn.commit()
+
+        foreign_keys = foreign_key_names(cursor, reposts, ('from_channel', 'to_channel'))
+        if foreign_keys:
+            cursor.execute(
+                f"ALTER TABLE {reposts} " + ', '.join(f"DROP FOREIGN KEY {name}" for name in foreign_keys)
+            )
+
+        drop_indexes = [
+            f"DROP INDEX {name}"
+            for name in ('idx_to_user', 'idx_to_channel_status', 'idx_to_user_status', 'uniq_pending_pair')
+            if name in existing
+        ]
+        cursor.execute(
+            f"ALTER TABLE {reposts} "
+            + ''.join(f"{clause}, " for clause in drop_indexes)
+            + "DROP COLUMN from_channel, "
+            "DROP COLUMN to_channel, "
+            "MODIFY from_channel_id INT NOT NULL, "
+            "MODIFY to_channel_id INT NOT NULL, "
+            "ADD INDEX idx_to_channel_status (to_channel_id, status, from_channel_id, to_user_id, from_user_id), "
+            "ADD INDEX idx_to_user_status (to_user_id, status, created_date, from_channel_id, to_channel_id), "
+            "ADD UNIQUE INDEX uniq_pending_pair (from_channel_id, to_channel_id, pending_key), "
+            f"ADD FOREIGN KEY (from_channel_id) REFERENCES {channels}(id) ON DELETE CASCADE, "
+            f"ADD FOREIGN KEY (to_channel_id) REFERENCES {channels}(id) ON DELETE CASCADE"
+        )
+        logger.info(f"{reposts} now references {channels} by id")
+    except mysql.connector.Error as err:
+        conn.rollback()
+        logger.error(f"Error migrating {reposts} to channel ids: {err}")
+    finally:
+        cursor.close()
+
+
+def migrate_abuse_reports_channel_ids(conn, prefix=''):
+    """Add and backfill {prefix}abuse_reports.channel_id; the username stays as the name at report time"""
+    reports = f'{prefix}abuse_reports'
+    channels = f'{prefix}channels'
+    cursor = conn.cursor()
+    if column_exists(cursor, reports, 'channel_id'):
+        cursor.close()
+        return
+
+    try:
+        cursor.execute(
+            f"ALTER TABLE {reports} "
+            "ADD COLUMN channel_id INT NULL AFTER reporter_user_id, "
+            "ADD INDEX idx_channel_id (channel_id), "
+            f"ADD FOREIGN KEY (channel_id) REFERENCES {channels}(id) ON DELETE SET NULL"
+        )
+        backfill(
+            conn, cursor, reports,
+            f"UPDATE {reports} a JOIN {channels} c ON c.channel_username = a.channel_username "
+            "SET a.channel_id = c.id "
+            "WHERE a.id BETWEEN %s AND %s AND a.channel_id IS NULL"
+        )
+        logger.info(f"Added channel_id column to {reports} table")
+    except mysql.connector.Error as err:
+        conn.rollback()
+        logger.error(f"Error adding channel_id to {reports}: {err}")
+    finally:
+        cursor.close()
+
+
+def migrate_reposts_archive(conn, prefix=''):
+    """Add the columns and index the reposts archiver relies on to older databases"""
+    reposts = f'{prefix}reposts'
+    channels = f'{prefix}channels'
+    cursor = conn.cursor()
+    try:
+        if not column_exists(cursor, channels, 'archived_confirmed'):
+            cursor.execute(f"ALTER TABLE {channels} ADD COLUMN archived_confirmed INT NOT NULL DEFAULT 0")
+            logger.info(f"Added archived_confirmed column to {channels} table")
+
+        if not column_exists(cursor, channels, 'archived_unconfirmed'):
+            cursor.execute(f"ALTER TABLE {channels} ADD COLUMN archived_unconfirmed INT NOT NULL DEFAULT 0")
+            # Rejected reposts archived before the counter existed
+            backfill(
+                conn, cursor, channels,
+                f"UPDATE {channels} c SET archived_unconfirmed = ("
+                f"SELECT COUNT(*) FROM {prefix}reposts_archive a WHERE a.to_channel_id = c.id AND a.status = 'rejected'"
+                ") WHERE c.id BETWEEN %s AND %s"
+            )
+            logger.info(f"Added archived_unconfirmed column to {channels} table")
+
+        existing = index_names(cursor, reposts)
+        if 'idx_status_created' not in existing:
+            cursor.execute(
+                f"ALTER TABLE {reposts} "
+                + ("DROP INDEX idx_status, " if 'idx_status' in existing else "")
+                + "ADD INDEX idx_status_created (status, created_date)"
+            )
+            logger.info(f"Added idx_status_created index to {reposts} table")
+    except mysql.connector.Error as err:
+        logger.error(f"Error preparing {reposts} for archiving: {err}")
+    finally:
+        cursor.close()
+
+
+def migrate_match_score(conn, prefix=''):
+    """Add match_score to {prefix}channels and widen idx_subs with it for the weighted /find"""
+    channels = f'{prefix}channels'
+    cursor = conn.cursor()
+    try:
+        if not column_exists(cursor, channels, 'match_score'):
+            cursor.execute(f"ALTER TABLE {channels} ADD COLUMN match_score FLOAT NOT NULL DEFAULT 0.5")
+            logger.info(f"Added match_score column to {channels} table")
+
+        existing = index_names(cursor, channels)
+        if 'idx_subs_score' not in existing:
+            cursor.execute(
+                f"ALTER TABLE {channels} "
+                + ("DROP INDEX idx_subs, " if 'idx_subs' in existing else "")
+                + "ADD INDEX idx_subs_score (subscriber_count, match_score)"
+            )
+            logger.info(f"Added idx_subs_score index to {channels} table")
+    except mysql.connector.Error as err:
+        logger.error(f"Error adding match_score to {channels}: {err}")
+    finally:
+        cursor.close()
+
+
+def migrate_impressions(conn, prefix=''):
+    """Add the /find impression counter to {prefix}channels and to the end of idx_subs_score"""
+    channels = f'{prefix}channels'
+    cursor = conn.cursor()
+    try:
+        if not column_exists(cursor, channels, 'impressions'):
+            cursor.execute(f"ALTER TABLE {channels} ADD COLUMN impressions INT NOT NULL DEFAULT 0")
+            logger.info(f"Added impressions column to {channels} table")
+
+        if 'impressions' not in index_columns(cursor, channels, 'idx_subs_score'):
+            cursor.execute(
+                f"ALTER TABLE {channels} DROP INDEX idx_subs_score, "
+                "ADD INDEX idx_subs_score (subscriber_count, match_score, impressions)"
+            )
+            logger.info(f"Added impressions to idx_subs_score index of {channels} table")
+    except mysql.connector.Error as err:
+        logger.error(f"Error adding impressions to {channels}: {err}")
+    finally:
+        cursor.close()
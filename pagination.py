@@ -0,0 +1,82 @@
+"""Splitting long replies into message-sized pages and keeping them for Next/Prev buttons"""
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+# Telegram and VK both reject messages longer than 4096 characters
+MESSAGE_LIMIT = 4096
+
+
+def text_length(text):
+    # Telegram counts UTF-16 code units, so most emoji take two
+    return len(text.encode('utf-16-le')) // 2
+
+
+def split_pages(header, items, footer, limit=MESSAGE_LIMIT, per_page=None):
+    """Pack item blocks into pages of at most limit characters and per_page items.
+
+    Every page repeats the header and footer and is numbered when there are
+    several, so a single page renders exactly as header + items + footer.
+    """
+    # Room for the "Страница N/M" line added below
+    room = limit - text_length(header) - text_length(footer) - 32
+    pages = [[]]
+    size = 0
+    for item in items:
+        page = pages[-1]
+        length = text_length(item)
+        if page and (size + length > room or (per_page and len(page) >= per_page)):
+            page = []
+            pages.append(page)
+            size = 0
+        page.append(item)
+        size += length
+
+    if len(pages) == 1:
+        return ["".join([header, *pages[0], footer])]
+    return [
+        "".join([header, *page, f"\nСтраница {number}/{len(pages)}\n", footer])
+        for number, page in enumerate(pages, 1)
+    ]
+
+
+class PageCache:
+    """Short-lived pages of one reply, keyed by a random token and bound to the user who requested them"""
+
+    def __init__(self, ttl=600, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, user_id, pages):
+        token = secrets.token_urlsafe(6)
+        with self._lock:
+            self._items[token] = (time.monotonic() + self.ttl, user_id, pages)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        return token
+
+    def get(self, token, user_id):
+        """Pages stored under token for user_id, None once expired or for anybody else"""
+        with self._lock:
+            item = self._items.get(token)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                del self._items[token]
+                return None
+            return item[2] if item[1] == user_id else None
+
+
+def page_callback(token, page):
+    return f"p:{token}:{page}"
+
+
+def parse_page_callback(data):
+    """(token, page) from a page button's callback data, None when malformed"""
+    prefix, token, page = (data.split(':') + ['', ''])[:3]
+    if prefix != 'p' or not token or not page.isdigit():
+        return None
+    return token, int(page)
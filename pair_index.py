@@ -0,0 +1,81 @@
+"""In-memory index of the channels each channel already reposted for, dropped from /find"""
+import logging
+import threading
+from array import array
+from bisect import bisect_left, insort
+
+logger = logging.getLogger(__name__)
+
+
+class PairIndex:
+    """Sorted arrays of to_channel_id per from_channel_id over pending and confirmed reposts.
+
+    One 4-byte entry per repost, so a pair asked for twice stays indexed until
+    both requests are rejected. Loaded once at startup and kept in step by every
+    insert into {prefix}reposts and every rejection, so /find filters partners
+    without a query of its own.
+    """
+
+    def __init__(self):
+        self._partners = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(partners) for partners in self._partners.values())
+
+    def load(self, get_connection, prefix):
+        conn = get_connection()
+        if not conn:
+            return
+        cursor = conn.cursor()
+        try:
+            # Streamed in order, so every array is built by appending
+            cursor.execute(
+                f"SELECT from_channel_id, to_channel_id FROM {prefix}reposts "
+                "WHERE status IN ('pending', 'confirmed') "
+                f"UNION ALL SELECT from_channel_id, to_channel_id FROM {prefix}reposts_archive "
+                "WHERE status = 'confirmed' "
+                "ORDER BY 1, 2"
+            )
+            partners = {}
+            for from_id, to_id in cursor:
+                ids = partners.get(from_id)
+                if ids is None:
+                    ids = partners[from_id] = array('i')
+                ids.append(to_id)
+        finally:
+            cursor.close()
+            conn.close()
+        with self._lock:
+            self._partners = partners
+        logger.info(f"Indexed {len(self)} {prefix}reposts channel pairs")
+
+    def add(self, from_id, to_id):
+        with self._lock:
+            ids = self._partners.get(from_id)
+            if ids is None:
+                ids = self._partners[from_id] = array('i')
+            insort(ids, to_id)
+
+    def remove(self, from_id, to_id):
+        """Forget one repost of the pair, after it was rejected or expired"""
+        with self._lock:
+            ids = self._partners.get(from_id)
+            if ids is None:
+                return
+            index = bisect_left(ids, to_id)
+            if index < len(ids) and ids[index] == to_id:
+                del ids[index]
+                if not ids:
+                    del self._partners[from_id]
+
+    def reposted(self, from_ids, to_id):
+        """Whether any of from_ids has a pending or confirmed repost for to_id"""
+        with self._lock:
+            for from_id in from_ids:
+                ids = self._partners.get(from_id)
+                if ids is not None:
+                    index = bisect_left(ids, to_id)
+                    if index < len(ids) and ids[index] == to_id:
+                        return True
+            return False
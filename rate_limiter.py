@@ -0,0 +1,107 @@
+"""Per-user sliding-window rate limiting shared by the Telegram and VK bots"""
+import threading
+import time
+from collections import OrderedDict, deque
+
+# Budget used for commands that have no explicit entry: (requests, window seconds)
+DEFAULT_BUDGET = (20, 60)
+
+THROTTLED_TEXT = "⏳ Слишком много запросов. Пожалуйста, подождите немного и повторите команду."
+
+
+def parse_rate_limits(spec):
+    """Parse "find=3/60,stat=5/60,default=20/60" into {command: (limit, window)}.
+
+    Raises ValueError for a limit below 1 or a window that is not positive.
+    """
+    budgets = {}
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        command, _, budget = item.partition('=')
+        limit, _, window = budget.partition('/')
+        limit, window = int(limit), float(window or 60)
+        if limit < 1 or window <= 0:
+            raise ValueError(f"RATE_LIMITS: {item!r} needs at least 1 request per a positive window")
+        budgets[command.strip().lower()] = (limit, window)
+    return budgets
+
+
+class RateLimiter:
+    """Sliding-window limiter keyed by user and command.
+
+    Each user holds one deque of timestamps per command, bounded by the
+    command's limit. Users are kept in LRU order and dropped once idle for
+    longer than ``idle_ttl`` or when ``max_users`` is exceeded.
+    """
+
+    def __init__(self, budgets=None, idle_ttl=600, max_users=100000):
+        budgets = dict(budgets or {})
+        self.default_budget = budgets.pop('default', DEFAULT_BUDGET)
+        self.budgets = budgets
+        self.idle_ttl = idle_ttl
+        self.max_users = max_users
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, user_id, command, now=None):
+        """Register a request and return True if it fits the user's budget"""
+        if now is None:
+            now = time.monotonic()
+        limit, window = self.budgets.get(command, self.default_budget)
+
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                entry = self._users[user_id] = [now, {}]
+            else:
+                self._users.move_to_end(user_id)
+                entry[0] = now
+            self._evict(now)
+
+            hits = entry[1].get(command)
+            if hits is None:
+                hits = entry[1][command] = deque(maxlen=limit)
+            if len(hits) == limit and now - hits[0] < window:
+                return False
+            hits.append(now)
+            return True
+
+    def _evict(self, now):
+        users = self._users
+        while users:
+            user_id, entry = next(iter(users.items()))
+            if len(users) <= self.max_users and now - entry[0] < self.idle_ttl:
+                break
+            del users[user_id]
+
+    def __len__(self):
+        return len(self._users)
+
+
+class ReplyCache:
+    """Short-lived cache of rendered replies served to throttled users"""
+
+    def __init__(self, ttl=300, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, key, text):
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, text)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                del self._items[key]
+                return None
+            return item[1]
@@ -0,0 +1,99 @@
+"""Candidate lookup for /find: subscriber bands of one or all of an owner's channels"""
+import math
+
+# Candidates drawn per own channel when /find covers all of an owner's channels,
+# and how many of the largest channels it covers
+PER_CHANNEL_LIMIT = 5
+MAX_CHANNELS = 10
+# Rows drawn per slot of the reply. Channels already reposted for are dropped from the
+# drawn rows in Python, so the statement stays the same however many partners there are;
+# a band made mostly of partners can then fill fewer slots
+OVERSAMPLE = 3
+
+# Every IMPRESSION_SCALE recent impressions lower a channel's weight by its base
+# weight again, so under-exposed and new channels are drawn more often. Only a bias:
+# no slot in the reply is reserved for them
+IMPRESSION_SCALE = 10
+
+# Weighted random order (Efraimidis-Spirakis): sorting by -ln(u) / weight draws rows
+# with probability proportional to the weight. The weight is the precomputed
+# match_score divided by the exposure, both read from idx_subs_score during the band scan
+WEIGHTED_RANDOM = f"-LN(1 - RAND()) * (1 + c.impressions / {IMPRESSION_SCALE}.0) / c.match_score"
+# The same, also preferring subscriber counts close to the requester's: halves the
+# weight at the band edges, see proximity_params
+PROXIMITY_WEIGHTED_RANDOM = (
+    f"-LN(1 - RAND()) * (1 + c.impressions / {IMPRESSION_SCALE}.0) "
+    "/ (c.match_score * (1 - ABS(c.subscriber_count - %s) / %s))"
+)
+
+
+def subscriber_band(count):
+    """Catalog range considered similar to count subscribers: ±20%, at least ±20"""
+    diff = math.ceil(max(count, 100) * 0.2)
+    return max(count - diff, 0), count + diff
+
+
+def proximity_params(count):
+    """Parameters of PROXIMITY_WEIGHTED_RANDOM for a band around count subscribers"""
+    _, high = subscriber_band(count)
+    return count, 2.0 * (high - count + 1)
+
+
+def merge_bands(channels, per_channel):
+    """Group channels whose bands overlap into disjoint [low, high] ranges.
+
+    Returns (low, high, limit, members) sorted by low, limit being per_channel
+    for every member, so a candidate is drawn once even when it is similar to
+    several of the channels.
+    """
+    merged = []
+    for channel in sorted(channels, key=lambda ch: ch['subscriber_count']):
+        low, high = subscriber_band(channel['subscriber_count'])
+        if merged and low <= merged[-1][1]:
+            last = merged[-1]
+            merged[-1] = (last[0], max(last[1], high), last[2] + per_channel, last[3] + [channel])
+        else:
+            merged.append((low, high, per_channel, [channel]))
+    return merged
+
+
+def candidates_query(prefix, bands):
+    """One statement sampling every band at random, candidates tagged with their band index.
+
+    Each band is its own derived table so MySQL walks idx_subs_score for the range
+    and only sorts that range, weighted by match_score. Rows come back in draw
+    order, so dropping some of them keeps the rest a weighted sample.
+    """
+    return " UNION ALL ".join(
+        "SELECT * FROM (SELECT c.id, c.channel_username, c.subscriber_count, "
+        f"(SELECT COUNT(*) FROM {prefix}reposts r WHERE r.to_channel_id = c.id AND r.status = 'confirmed') "
+        "+ c.archived_confirmed as confirmed_count, "
+        f"(SELECT COUNT(*) FROM {prefix}reposts r WHERE r.to_channel_id = c.id AND r.status = 'pending') "
+        f"as pending_count, {index} as band, {WEIGHTED_RANDOM} as draw "
+        f"FROM {prefix}channels c "
+        "WHERE c.owner_user_id != %s AND c.subscriber_count BETWEEN %s AND %s "
+        f"ORDER BY draw LIMIT %s) b{index}"
+        for index in range(len(bands))
+    ) + " ORDER BY draw"
+
+
+def candidates_params(user_id, bands):
+    return [value for low, high, limit, _ in bands for value in (user_id, low, high, limit * OVERSAMPLE)]
+
+
+def assign_candidates(bands, rows, per_channel):
+    """Map own channel username to its candidates.
+
+    Each candidate goes to the closest member of its band that has fewer than
+    per_channel candidates yet, so members of a merged band get a fair share.
+    """
+    found = {}
+    for row in rows:
+        members = [
+            ch for ch in bands[row['band']][3] if len(found.get(ch['channel_username'], ())) < per_channel
+        ]
+        if not members:
+            continue
+        closest = min(members, key=lambda ch: abs(ch['subscriber_count'] - row['subscriber_count']))
+        found.setdefault(closest['channel_username'], []).append(row)
+    return found
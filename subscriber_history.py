@@ -0,0 +1,139 @@
+"""Subscriber count history: raw observations, daily aggregates and the 7/30-day summary"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+import mysql.connector
+
+logger = logging.getLogger(__name__)
+
+# Channels handled per transaction by the downsampling and summary jobs
+CHANNEL_BATCH_SIZE = 1000
+
+
+def record_observations(cursor, prefix, observations):
+    """Store (channel id, subscriber count) pairs observed now and refresh their summary; the caller commits"""
+    if observations:
+        cursor.executemany(
+            f"REPLACE INTO {prefix}subscriber_history (channel_id, observed_at, subscriber_count) "
+            "VALUES (%s, NOW(), %s)",
+            [(channel_id, count) for channel_id, count in observations]
+        )
+        # The daily job alone would leave /update comparing against a week-old summary
+        ids = sorted({channel_id for channel_id, _ in observations})
+        cursor.execute(
+            summary_statement(prefix) + f"c.id IN ({', '.join(['%s'] * len(ids))})",
+            (*summary_params(), *ids)
+        )
+
+
+def summary_statement(prefix):
+    """REPLACE of {prefix}subscriber_summary rows, to be followed by a condition on c.id"""
+    # Latest raw observation at or before the point, else the last count of an older day
+    count_at = (
+        f"COALESCE((SELECT h.subscriber_count FROM {prefix}subscriber_history h "
+        "WHERE h.channel_id = c.id AND h.observed_at <= %s ORDER BY h.observed_at DESC LIMIT 1), "
+        f"(SELECT d.last_count FROM {prefix}subscriber_daily d "
+        "WHERE d.channel_id = c.id AND d.day < %s ORDER BY d.day DESC LIMIT 1))"
+    )
+    return (
+        f"REPLACE INTO {prefix}subscriber_summary (channel_id, count_7d, count_30d, refreshed_at) "
+        f"SELECT c.id, {count_at}, {count_at}, NOW() FROM {prefix}channels c WHERE "
+    )
+
+
+def summary_params():
+    """Parameters of summary_statement for the points 7 and 30 days ago"""
+    now = datetime.now()
+    points = [now - timedelta(days=7), now - timedelta(days=30)]
+    return points[0], points[0].date(), points[1], points[1].date()
+
+
+def channel_id_batches(cursor, prefix):
+    cursor.execute(f"SELECT MIN(id), MAX(id) FROM {prefix}channels")
+    first_id, last_id = cursor.fetchone()
+    if first_id is None:
+        return
+    for start in range(first_id, last_id + 1, CHANNEL_BATCH_SIZE):
+        yield start, start + CHANNEL_BATCH_SIZE - 1
+
+
+def downsample(conn, prefix, raw_days):
+    """Fold raw observations of whole days older than raw_days into daily min/max/last rows"""
+    cutoff = datetime.combine(datetime.now().date() - timedelta(days=raw_days), datetime.min.time())
+    cursor = conn.cursor()
+    folded = 0
+    try:
+        for first_id, last_id in channel_id_batches(cursor, prefix):
+            cursor.execute(
+                f"SELECT channel_id, observed_at, subscriber_count FROM {prefix}subscriber_history "
+                "WHERE channel_id BETWEEN %s AND %s AND observed_at < %s "
+                "ORDER BY channel_id, observed_at",
+                (first_id, last_id, cutoff)
+            )
+            days = {}
+            for channel_id, observed_at, count in cursor.fetchall():
+                key = channel_id, observed_at.date()
+                low, high, _ = days.get(key, (count, count, count))
+                days[key] = min(low, count), max(high, count), count
+                folded += 1
+            if not days:
+                continue
+            cursor.executemany(
+                f"REPLACE INTO {prefix}subscriber_daily (channel_id, day, min_count, max_count, last_count) "
+                "VALUES (%s, %s, %s, %s, %s)",
+                [(channel_id, day, *counts) for (channel_id, day), counts in days.items()]
+            )
+            cursor.execute(
+                f"DELETE FROM {prefix}subscriber_history "
+                "WHERE channel_id BETWEEN %s AND %s AND observed_at < %s",
+                (first_id, last_id, cutoff)
+            )
+            conn.commit()
+    finally:
+        cursor.close()
+    return folded
+
+
+def refresh_summary(conn, prefix):
+    """Precompute each channel's subscriber count 7 and 30 days ago for /update"""
+    params = summary_params()
+    cursor = conn.cursor()
+    try:
+        for first_id, last_id in channel_id_batches(cursor, prefix):
+            cursor.execute(
+                summary_statement(prefix) + "c.id BETWEEN %s AND %s",
+                (*params, first_id, last_id)
+            )
+            conn.commit()
+    finally:
+        cursor.close()
+
+
+def run_history_jobs(get_connection, prefix, raw_days):
+    conn = get_connection()
+    if not conn:
+        return
+    try:
+        folded = downsample(conn, prefix, raw_days)
+        if folded:
+            logger.info(f"Folded {folded} {prefix}subscriber_history points into daily aggregates")
+        refresh_summary(conn, prefix)
+    except mysql.connector.Error as err:
+        conn.rollback()
+        logger.error(f"Error maintaining {prefix}subscriber_history: {err}")
+    finally:
+        conn.close()
+
+
+def start_history_jobs(get_connection, prefix, raw_days, interval):
+    """Downsample history and refresh the summary every interval seconds from a daemon thread"""
+    def run():
+        while True:
+            run_history_jobs(get_connection, prefix, raw_days)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name=f'{prefix}subscriber-history', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,80 @@
+"""Opt-in recorder of incoming bot traffic for replay load tests.
+
+Messages are anonymized before they are written: user ids are remapped with
+a keyed hash and every word after the command is replaced by a short hash,
+so a recording keeps the command mix, timing and repeat patterns but no
+personal data. Records are compact JSON lines appended to a single file:
+
+    {"t":1760000000.123,"p":"tg","u":48213377123,"x":"/find @h1f0c9a2b7e"}
+"""
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+HASH_PREFIX = 'h'
+
+
+class TrafficRecorder:
+    """Appends anonymized messages to a JSON lines file, safe to share between threads"""
+
+    def __init__(self, path, key=''):
+        if not key:
+            logger.warning("TRAFFIC_RECORD_KEY is not set, pseudonyms will change after a restart")
+        self.key = key.encode('utf-8') if key else os.urandom(32)
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def _digest(self, value):
+        return hmac.new(self.key, str(value).encode('utf-8'), hashlib.sha256).digest()
+
+    def pseudonym(self, user_id):
+        """Stable positive id for a user, negative ids (chats) stay negative"""
+        value = int.from_bytes(self._digest(abs(user_id))[:5], 'big') + 1
+        return -value if user_id < 0 else value
+
+    def hash_word(self, word):
+        """Replace a word with a short hash, keeping a leading '@' so mentions still look like mentions"""
+        mention = word.startswith('@')
+        if mention:
+            word = word[1:]
+        hashed = HASH_PREFIX + self._digest(word.lower()).hex()[:10]
+        return '@' + hashed if mention else hashed
+
+    def anonymize(self, command, args):
+        """Keep the command verbatim and hash every argument word"""
+        words = [self.hash_word(word) for word in args.split()]
+        return ' '.join(([command] if command else []) + words)
+
+    def record(self, platform, user_id, command, args='', chat_id=None):
+        entry = {
+            't': round(time.time(), 3),
+            'p': platform,
+            'u': self.pseudonym(user_id),
+            'x': self.anonymize(command, args),
+        }
+        if chat_id is not None and chat_id != user_id:
+            entry['c'] = self.pseudonym(chat_id)
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def read_recording(path):
+    """Yield the recorded entries of a file in order"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
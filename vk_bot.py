@@ -2,7 +2,10 @@ import logging
 import math
 import os
 import json
+import random
 import re
+import threading
+import time
 
 from flask import Flask, request, render_template_string, redirect, url_for, session
 import mysql.connector
@@ -11,6 +14,32 @@ import requests
 from datetime import datetime
 from dotenv import load_dotenv
 
+from archiver import start_archiver
+from bulk_reposts import (
+    MAX_TARGETS, confirm_pending, create_pending, group_by, load_channels, pending_for_channel, split_bulk_args,
+    unique_names
+)
+from callback_signing import sign_callback, verify_callback
+from circuit_breaker import CircuitBreaker, breaker_states
+from digest import digest_enabled, set_digest, start_digest
+from expiry import ExpiryScheduler
+from impressions import ImpressionBuffer
+from match_score import start_score_job
+from metrics import CommandTimer, InstrumentedConnection, api_errors, api_latency, start_metrics_server
+from migrations import (
+    migrate_abuse_reports_channel_ids, migrate_impressions, migrate_match_score, migrate_reposts_archive,
+    migrate_reposts_to_channel_ids
+)
+from pagination import split_pages
+from pair_index import PairIndex
+from rate_limiter import RateLimiter, ReplyCache, THROTTLED_TEXT, parse_rate_limits
+from similar_channels import (
+    MAX_CHANNELS, OVERSAMPLE, PER_CHANNEL_LIMIT, PROXIMITY_WEIGHTED_RANDOM, assign_candidates,
+    candidates_params, candidates_query, merge_bands, proximity_params, subscriber_band
+)
+from subscriber_history import record_observations, start_history_jobs
+from traffic_recorder import TrafficRecorder
+
 load_dotenv()
 
 logging.basicConfig(
@@ -32,6 +61,17 @@ VK_CONFIRMATION_CODE = os.environ['VK_CONFIRMATION_CODE']
 VK_FLASK_HOST = os.environ.get('VK_FLASK_HOST', '0.0.0.0')
 VK_FLASK_PORT = int(os.environ.get('VK_FLASK_PORT', '5000'))
 
+# /metrics and /health listener, kept off the public Flask app; disabled when VK_METRICS_PORT is empty
+VK_METRICS_HOST = os.environ.get('VK_METRICS_HOST', '127.0.0.1')
+VK_METRICS_PORT = int(os.environ.get('VK_METRICS_PORT', '0') or 0)
+
+# Anti-flood configuration, e.g. RATE_LIMITS=find=3/60,stat=5/60,default=20/60
+RATE_LIMITS = parse_rate_limits(os.environ.get('RATE_LIMITS', 'find=5/60,stat=5/60,done=10/60,confirm=10/60'))
+RATE_LIMIT_IDLE_TTL = int(os.environ.get('RATE_LIMIT_IDLE_TTL', '600'))
+
+# Commands whose last reply is served from cache when the user is throttled
+CACHED_REPLY_COMMANDS = ('find', 'stat')
+
 # Admin interface configuration
 ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', '')
 
@@ -43,6 +83,142 @@ TG_DB_CONFIG = {
     'password': os.environ.get('DB_USER_PASSWORD', '')
 }
 
+VK_API_VERSION = '5.199'
+VK_API_URL = os.environ.get('VK_API_URL', 'https://api.vk.ru/method')
+VK_API_TIMEOUT = float(os.environ.get('VK_API_TIMEOUT', '10'))
+
+# Circuit breakers: fail fast instead of waiting for timeouts during outages
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', '5'))
+CIRCUIT_RESET_TIMEOUT = int(os.environ.get('CIRCUIT_RESET_TIMEOUT', '30'))
+
+vk_db_breaker = CircuitBreaker('vk_mysql', CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+tg_db_breaker = CircuitBreaker('tg_mysql', CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+vk_api_breaker = CircuitBreaker('vk_api', CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+
+# Opt-in recording of anonymized traffic for replay load tests
+TRAFFIC_RECORD_FILE = os.environ.get('TRAFFIC_RECORD_FILE', '')
+TRAFFIC_RECORD_KEY = os.environ.get('TRAFFIC_RECORD_KEY', '')
+traffic_recorder = TrafficRecorder(TRAFFIC_RECORD_FILE, TRAFFIC_RECORD_KEY) if TRAFFIC_RECORD_FILE else None
+
+# Archiving of confirmed and rejected reposts older than ARCHIVE_AFTER_DAYS (0 disables it)
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '30'))
+ARCHIVE_INTERVAL = int(os.environ.get('ARCHIVE_INTERVAL', '3600'))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '500'))
+ARCHIVE_BATCH_PAUSE = float(os.environ.get('ARCHIVE_BATCH_PAUSE', '0.5'))
+
+# Pending reposts are rejected after PENDING_EXPIRY_DAYS (0 disables it), both
+# parties are notified at most EXPIRY_NOTIFY_RATE messages per second
+PENDING_EXPIRY_DAYS = int(os.environ.get('PENDING_EXPIRY_DAYS', '7'))
+PENDING_EXPIRY_BATCH_SIZE = int(os.environ.get('PENDING_EXPIRY_BATCH_SIZE', '500'))
+PENDING_EXPIRY_NOTIFY = os.environ.get('PENDING_EXPIRY_NOTIFY', '1') == '1'
+EXPIRY_NOTIFY_RATE = float(os.environ.get('EXPIRY_NOTIFY_RATE', '10'))
+
+# Started with the bot when PENDING_EXPIRY_DAYS is set
+expiry_scheduler = None
+
+# Raw subscriber counts are kept HISTORY_RAW_DAYS, then folded into daily aggregates
+HISTORY_RAW_DAYS = int(os.environ.get('HISTORY_RAW_DAYS', '30'))
+HISTORY_JOB_INTERVAL = int(os.environ.get('HISTORY_JOB_INTERVAL', '86400'))
+
+# match_score weighting /find candidates is recomputed every MATCH_SCORE_INTERVAL seconds (0 disables it)
+MATCH_SCORE_INTERVAL = int(os.environ.get('MATCH_SCORE_INTERVAL', '3600'))
+
+# /find impressions are buffered in memory and written every IMPRESSION_FLUSH_INTERVAL
+# seconds (0 stops counting them), all counters are halved every IMPRESSION_DECAY_INTERVAL
+IMPRESSION_FLUSH_INTERVAL = int(os.environ.get('IMPRESSION_FLUSH_INTERVAL', '10'))
+IMPRESSION_DECAY_INTERVAL = int(os.environ.get('IMPRESSION_DECAY_INTERVAL', '86400'))
+
+# Started with the bot when IMPRESSION_FLUSH_INTERVAL is set
+impression_buffer = None
+
+# Owners who enabled 'дайджест' get new pending reposts at most once per DIGEST_INTERVAL
+# seconds (0 disables digests), sent at most DIGEST_NOTIFY_RATE messages per second
+DIGEST_INTERVAL = int(os.environ.get('DIGEST_INTERVAL', '86400'))
+DIGEST_NOTIFY_RATE = float(os.environ.get('DIGEST_NOTIFY_RATE', '10'))
+
+# Automatic repost verification through wall.get; needs a token allowed to read walls
+# (a user or service token, community tokens are refused), disabled when empty
+VK_VERIFY_TOKEN = os.environ.get('VK_VERIFY_TOKEN', '')
+VK_VERIFY_INTERVAL = int(os.environ.get('VK_VERIFY_INTERVAL', '300'))
+VK_VERIFY_WALL_COUNT = int(os.environ.get('VK_VERIFY_WALL_COUNT', '20'))
+# Most API calls VK accepts in one execute request
+VK_EXECUTE_MAX_CALLS = 25
+
+# Started with the bot when VK_VERIFY_TOKEN is set
+repost_verifier = None
+
+# Channels each group already reposted for; filled in main, kept in step by 'готово' and rejections
+pair_index = PairIndex()
+
+# Key signing the Confirm/Reject callback buttons; an inline keyboard holds at most
+# 10 buttons, so pairs for at most 5 reposts
+VK_CALLBACK_SECRET = (os.environ.get('CALLBACK_SECRET', '') or VK_ACCESS_TOKEN).encode('utf-8')
+VK_INLINE_MAX_REPOSTS = 5
+
+# Static replies, rendered once at import time
+ERROR_TEXT = "❌ Ошибка. Пожалуйста, попробуйте повторить попытку позже."
+
+# Expiry notices, formatted with from_channel, to_channel and days
+EXPIRY_REQUESTER_TEXT = (
+    "⌛ Владелец группы {to_channel} не подтвердил репост в группе {from_channel} за {days} дн., "
+    "запрос отменён."
+)
+EXPIRY_OWNER_TEXT = (
+    "⌛ Запрос на подтверждение репоста группы {from_channel} для {to_channel} не был подтверждён "
+    "за {days} дн. и отменён."
+)
+
+START_TEXT = (
+    "👋 Добро пожаловать в бот обмена аудиторией!\n\n"
+    "Используйте команду 'помощь' для просмотра всех команд."
+)
+
+HELP_TEXT = """
+📚 Справка по командам:
+
+добавить - Добавить свою группу в каталог
+мои - Показать мои группы
+удалить [группа] - Удалить группу из каталога
+обновить [группа] - Обновить количество подписчиков
+найти [группа] - Найти похожие группы для обмена (без группы - для всех ваших групп)
+готово [группа] [на_какой_группе] - Сообщить владельцу группы о выполненном репосте
+готово [группа] [группа] ... на [на_какой_группе] - То же для нескольких групп сразу
+подтвердить [своя_группа] [группа_репоста] - Подтвердить репост
+подтвердить_все [своя_группа] - Подтвердить все ожидающие репосты для группы
+список - Список групп, ожидающих подтверждения
+дайджест [вкл|выкл] - Получать уведомления о репостах одной сводкой
+статистика - Показать статистику бота
+жалоба [группа] [причина] - Пожаловаться на группу и владельца
+помощь - Показать эту справку
+
+Как это работает:
+1. Добавьте свою группу командой 'добавить'
+2. Найдите похожие группы 'найти'
+3. Подпишитесь и сделайте репост любого поста
+4. Сообщите 'готово' после репоста
+5. Владелец группы подтвердит 'подтвердить'
+6. Ожидайте ответного репоста
+    """
+
+FIND_HELP_TEXT = (
+    "Для поиска групп используйте команду:\nнайти [имя_вашей_группы]\n\nПример: найти mygroup\n\n"
+    "Команда 'найти' без группы подберёт похожие группы для всех ваших групп."
+)
+DONE_HELP_TEXT = (
+    "Для отправки уведомления о репосте используйте команду:\n"
+    "готово [имя_группы] [на_какой_группе]\n\nПример: готово targetgroup yourgroup"
+)
+VERIFIED_REQUESTER_TEXT = (
+    "🎉 Ваш репост подтверждён автоматически!\n\n"
+    "Бот нашёл на стене группы {from_channel} репост записи из {to_channel}."
+)
+VERIFIED_OWNER_TEXT = "✅ Репост группы {from_channel} для вашей группы {to_channel} подтверждён автоматически."
+UNKNOWN_COMMAND_TEXT = "❓ Неизвестная команда. Используйте 'помощь' для просмотра списка команд."
+MAIN_MENU_TEXT = "Выберите действие:"
+
+rate_limiter = RateLimiter(RATE_LIMITS, idle_ttl=RATE_LIMIT_IDLE_TTL)
+reply_cache = ReplyCache()
+
 app = Flask(__name__)
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', os.urandom(24))
 
@@ -51,10 +227,14 @@ class VKDatabase:
 
     @staticmethod
     def get_connection():
+        if not vk_db_breaker.allow_request():
+            return None
         try:
             conn = mysql.connector.connect(**VK_DB_CONFIG)
-            return conn
+            vk_db_breaker.record_success()
+            return InstrumentedConnection(conn)
         except Error as e:
+            vk_db_breaker.record_failure()
             logger.error(f"Error connecting to the VK database: {e}")
             return None
 
@@ -74,25 +254,93 @@ class VKDatabase:
                 owner_user_id BIGINT NOT NULL,
                 subscriber_count INT NOT NULL,
                 added_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                archived_confirmed INT NOT NULL DEFAULT 0,
+                archived_unconfirmed INT NOT NULL DEFAULT 0,
+                match_score FLOAT NOT NULL DEFAULT 0.5,
+                impressions INT NOT NULL DEFAULT 0,
                 INDEX idx_owner (owner_user_id),
-                INDEX idx_subs (subscriber_count)
+                INDEX idx_subs_score (subscriber_count, match_score, impressions)
             )
         ''')
 
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS vk_reposts (
                 id INT AUTO_INCREMENT PRIMARY KEY,
-                from_channel VARCHAR(255) NOT NULL,
-                to_channel VARCHAR(255) NOT NULL,
+                from_channel_id INT NOT NULL,
+                to_channel_id INT NOT NULL,
+                repost_channel VARCHAR(255) NULL,
                 from_user_id BIGINT NOT NULL,
                 to_user_id BIGINT NOT NULL,
                 status ENUM('pending', 'confirmed', 'rejected') DEFAULT 'pending',
                 created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 confirmed_date TIMESTAMP NULL,
-                INDEX idx_status (status),
-                INDEX idx_to_user (to_user_id),
-                FOREIGN KEY (from_channel) REFERENCES vk_channels(channel_username) ON DELETE CASCADE,
-                FOREIGN KEY (to_channel) REFERENCES vk_channels(channel_username) ON DELETE CASCADE
+                pending_key TINYINT AS (IF(status = 'pending', 1, NULL)) STORED,
+                INDEX idx_status_created (status, created_date),
+                INDEX idx_to_channel_status (to_channel_id, status, from_channel_id, to_user_id, from_user_id),
+                INDEX idx_to_user_status (to_user_id, status, created_date, from_channel_id, to_channel_id),
+                UNIQUE INDEX uniq_pending_pair (from_channel_id, to_channel_id, pending_key),
+                FOREIGN KEY (from_channel_id) REFERENCES vk_channels(id) ON DELETE CASCADE,
+                FOREIGN KEY (to_channel_id) REFERENCES vk_channels(id) ON DELETE CASCADE
+            )
+        ''')
+
+        # Finished reposts moved out of vk_reposts by the archiver, kept for the admin interface
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS vk_reposts_archive (
+                id INT PRIMARY KEY,
+                from_channel_id INT NOT NULL,
+                to_channel_id INT NOT NULL,
+                repost_channel VARCHAR(255) NULL,
+                from_user_id BIGINT NOT NULL,
+                to_user_id BIGINT NOT NULL,
+                status ENUM('pending', 'confirmed', 'rejected') NOT NULL,
+                created_date TIMESTAMP NULL,
+                confirmed_date TIMESTAMP NULL,
+                archived_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_created (created_date)
+            )
+        ''')
+
+        # Subscriber counts: raw observations, daily aggregates of older ones, precomputed deltas
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS vk_subscriber_history (
+                channel_id INT NOT NULL,
+                observed_at TIMESTAMP NOT NULL,
+                subscriber_count INT NOT NULL,
+                PRIMARY KEY (channel_id, observed_at),
+                FOREIGN KEY (channel_id) REFERENCES vk_channels(id) ON DELETE CASCADE
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS vk_subscriber_daily (
+                channel_id INT NOT NULL,
+                day DATE NOT NULL,
+                min_count INT NOT NULL,
+                max_count INT NOT NULL,
+                last_count INT NOT NULL,
+                PRIMARY KEY (channel_id, day),
+                FOREIGN KEY (channel_id) REFERENCES vk_channels(id) ON DELETE CASCADE
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS vk_subscriber_summary (
+                channel_id INT PRIMARY KEY,
+                count_7d INT NULL,
+                count_30d INT NULL,
+                refreshed_at TIMESTAMP NULL,
+                FOREIGN KEY (channel_id) REFERENCES vk_channels(id) ON DELETE CASCADE
+            )
+        ''')
+
+        # Per-user preferences, digest_sent_at is where the next digest window starts
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS vk_user_settings (
+                user_id BIGINT PRIMARY KEY,
+                digest TINYINT NOT NULL DEFAULT 0,
+                digest_sent_at TIMESTAMP NULL,
+                INDEX idx_digest_due (digest, digest_sent_at)
             )
         ''')
 
@@ -100,10 +348,13 @@ class VKDatabase:
             CREATE TABLE IF NOT EXISTS vk_abuse_reports (
                 id INT AUTO_INCREMENT PRIMARY KEY,
                 reporter_user_id BIGINT NOT NULL,
+                channel_id INT NULL,
                 channel_username VARCHAR(255) NOT NULL,
                 reason TEXT NOT NULL,
                 report_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                INDEX idx_channel (channel_username)
+                INDEX idx_channel (channel_username),
+                INDEX idx_channel_id (channel_id),
+                FOREIGN KEY (channel_id) REFERENCES vk_channels(id) ON DELETE SET NULL
             )
         ''')
 
@@ -111,7 +362,7 @@ class VKDatabase:
         try:
             cursor.execute('''
                 ALTER TABLE vk_reposts
-                ADD COLUMN repost_channel VARCHAR(255) NULL AFTER to_channel
+                ADD COLUMN repost_channel VARCHAR(255) NULL
             ''')
             conn.commit()
             logger.info("Added repost_channel column to vk_reposts table")
@@ -121,6 +372,13 @@ class VKDatabase:
             else:
                 logger.error(f"Error adding repost_channel column: {err}")
 
+        # Older databases reference channels by username
+        migrate_reposts_to_channel_ids(conn, 'vk_')
+        migrate_abuse_reports_channel_ids(conn, 'vk_')
+        migrate_reposts_archive(conn, 'vk_')
+        migrate_match_score(conn, 'vk_')
+        migrate_impressions(conn, 'vk_')
+
         conn.commit()
         cursor.close()
         conn.close()
@@ -132,12 +390,14 @@ class TGDatabase:
 
     @staticmethod
     def get_connection():
-        if not TG_DB_CONFIG['database']:
+        if not TG_DB_CONFIG['database'] or not tg_db_breaker.allow_request():
             return None
         try:
             conn = mysql.connector.connect(**TG_DB_CONFIG)
-            return conn
+            tg_db_breaker.record_success()
+            return InstrumentedConnection(conn)
         except Error as e:
+            tg_db_breaker.record_failure()
             logger.error(f"Error connecting to the Telegram database: {e}")
             return None
 
@@ -281,6 +541,14 @@ def get_admin_template():
         </form>
         {% endif %}
 
+        {% if section == 'reposts' %}
+        <!-- Hot table or archive of finished reposts -->
+        <div class="btn-group mb-3">
+            <a href="{{ url_for('bot_admin', platform=platform, section=section) }}" class="btn btn-sm {% if archive %}btn-outline-primary{% else %}btn-primary{% endif %}">Актуальные</a>
+            <a href="{{ url_for('bot_admin', platform=platform, section=section, archive=1) }}" class="btn btn-sm {% if archive %}btn-primary{% else %}btn-outline-primary{% endif %}">Архив</a>
+        </div>
+        {% endif %}
+
         {% if error %}
         <div class="alert alert-warning">{{ error }}</div>
         {% endif %}
@@ -331,8 +599,8 @@ def get_admin_template():
                     {% for item in items %}
                     <tr>
                         <td>{{ item.id }}</td>
-                        <td>{{ item.from_channel }}</td>
-                        <td>{{ item.to_channel }}</td>
+                        <td>{{ item.from_channel or '-' }}</td>
+                        <td>{{ item.to_channel or '-' }}</td>
                         <td>{{ item.repost_channel or '-' }}</td>
                         <td>{{ item.from_user_id }}</td>
                         <td>{{ item.to_user_id }}</td>
@@ -385,7 +653,7 @@ def get_admin_template():
             <ul class="pagination justify-content-center">
                 {% if page > 1 %}
                 <li class="page-item">
-                    <a class="page-link" href="{{ url_for('bot_admin', platform=platform, section=section, page=page-1, search=search) }}">Назад</a>
+                    <a class="page-link" href="{{ url_for('bot_admin', platform=platform, section=section, page=page-1, search=search, archive=1 if archive else None) }}">Назад</a>
                 </li>
                 {% endif %}
 
@@ -393,7 +661,7 @@ def get_admin_template():
                     {% if p == page %}
                     <li class="page-item active"><span class="page-link">{{ p }}</span></li>
                     {% elif p == 1 or p == total_pages or (p >= page - 2 and p <= page + 2) %}
-                    <li class="page-item"><a class="page-link" href="{{ url_for('bot_admin', platform=platform, section=section, page=p, search=search) }}">{{ p }}</a></li>
+                    <li class="page-item"><a class="page-link" href="{{ url_for('bot_admin', platform=platform, section=section, page=p, search=search, archive=1 if archive else None) }}">{{ p }}</a></li>
                     {% elif p == page - 3 or p == page + 3 %}
                     <li class="page-item disabled"><span class="page-link">...</span></li>
                     {% endif %}
@@ -401,7 +669,7 @@ def get_admin_template():
 
                 {% if page < total_pages %}
                 <li class="page-item">
-                    <a class="page-link" href="{{ url_for('bot_admin', platform=platform, section=section, page=page+1, search=search) }}">Вперёд</a>
+                    <a class="page-link" href="{{ url_for('bot_admin', platform=platform, section=section, page=page+1, search=search, archive=1 if archive else None) }}">Вперёд</a>
                 </li>
                 {% endif %}
             </ul>
@@ -456,20 +724,26 @@ def admin_get_vk_channels(page=1, search=''):
     return items, total_count, total_pages
 
 
-def admin_get_vk_reposts(page=1):
-    """Get VK reposts with pagination"""
+def admin_get_vk_reposts(page=1, archive=False):
+    """Get VK reposts, or archived reposts, with pagination"""
     conn = VKDatabase.get_connection()
     if not conn:
         return [], 0, 0
 
     cursor = conn.cursor(dictionary=True)
     offset = (page - 1) * ITEMS_PER_PAGE
+    table = 'vk_reposts_archive' if archive else 'vk_reposts'
 
-    cursor.execute("SELECT COUNT(*) as total FROM vk_reposts")
+    cursor.execute(f"SELECT COUNT(*) as total FROM {table}")
     total_count = cursor.fetchone()['total']
 
+    # Archived rows may outlive their channels
     cursor.execute(
-        "SELECT * FROM vk_reposts ORDER BY created_date DESC LIMIT %s OFFSET %s",
+        "SELECT r.*, f.channel_username AS from_channel, t.channel_username AS to_channel "
+        f"FROM {table} r "
+        "LEFT JOIN vk_channels f ON f.id = r.from_channel_id "
+        "LEFT JOIN vk_channels t ON t.id = r.to_channel_id "
+        "ORDER BY r.created_date DESC LIMIT %s OFFSET %s",
         (ITEMS_PER_PAGE, offset)
     )
 
@@ -543,20 +817,26 @@ def admin_get_tg_channels(page=1, search=''):
     return items, total_count, total_pages
 
 
-def admin_get_tg_reposts(page=1):
-    """Get Telegram reposts with pagination"""
+def admin_get_tg_reposts(page=1, archive=False):
+    """Get Telegram reposts, or archived reposts, with pagination"""
     conn = TGDatabase.get_connection()
     if not conn:
         return [], 0, 0
 
     cursor = conn.cursor(dictionary=True)
     offset = (page - 1) * ITEMS_PER_PAGE
+    table = 'reposts_archive' if archive else 'reposts'
 
-    cursor.execute("SELECT COUNT(*) as total FROM reposts")
+    cursor.execute(f"SELECT COUNT(*) as total FROM {table}")
     total_count = cursor.fetchone()['total']
 
+    # Archived rows may outlive their channels
     cursor.execute(
-        "SELECT * FROM reposts ORDER BY created_date DESC LIMIT %s OFFSET %s",
+        "SELECT r.*, f.channel_username AS from_channel, t.channel_username AS to_channel "
+        f"FROM {table} r "
+        "LEFT JOIN channels f ON f.id = r.from_channel_id "
+        "LEFT JOIN channels t ON t.id = r.to_channel_id "
+        "ORDER BY r.created_date DESC LIMIT %s OFFSET %s",
         (ITEMS_PER_PAGE, offset)
     )
 
@@ -608,7 +888,19 @@ def bot_admin():
     section = request.args.get('section', 'channels')
     page = int(request.args.get('page', 1))
     search = request.args.get('search', '')
+    archive = request.args.get('archive') == '1'
+
+    # Only known sections get their own metrics label
+    label = 'admin'
+    if platform in ('telegram', 'vk') and section in ('channels', 'reposts', 'reports'):
+        label = f'admin_{platform}_{section}'
 
+    with CommandTimer(label):
+        return render_admin_page(platform, section, page, search, archive)
+
+
+def render_admin_page(platform, section, page, search, archive=False):
+    """Load the requested admin section and render the page"""
     items = []
     total_count = 0
     total_pages = 1
@@ -620,7 +912,7 @@ def bot_admin():
             if not items and not search:
                 error = "Не удалось подключиться к базе данных Telegram или таблица пуста."
         elif section == 'reposts':
-            items, total_count, total_pages = admin_get_tg_reposts(page)
+            items, total_count, total_pages = admin_get_tg_reposts(page, archive)
             if not items:
                 error = "Не удалось подключиться к базе данных Telegram или таблица пуста."
         elif section == 'reports':
@@ -633,7 +925,7 @@ def bot_admin():
             if not items and not search:
                 error = "Не удалось подключиться к базе данных VK или таблица пуста."
         elif section == 'reposts':
-            items, total_count, total_pages = admin_get_vk_reposts(page)
+            items, total_count, total_pages = admin_get_vk_reposts(page, archive)
             if not items:
                 error = "Не удалось подключиться к базе данных VK или таблица пуста."
         elif section == 'reports':
@@ -647,6 +939,7 @@ def bot_admin():
         section=section,
         page=page,
         search=search,
+        archive=archive,
         items=items,
         total_count=total_count,
         total_pages=total_pages,
@@ -679,59 +972,147 @@ def admin_logout():
     return redirect(url_for('admin_login'))
 
 
-def remove_emoji(text):
-    """Remove emojis from text"""
-    emoji_pattern = re.compile("["
-        u"\U0001F600-\U0001F64F"  # emoticons
-        u"\U0001F300-\U0001F5FF"  # symbols & pictographs
-        u"\U0001F680-\U0001F6FF"  # transport & map symbols
-        u"\U0001F1E0-\U0001F1FF"  # flags (iOS)
-        u"\U00002702-\U000027B0"
-        u"\U000024C2-\U0001F251"
-        "]+", flags=re.UNICODE)
-    return emoji_pattern.sub(r'', text)
+EMOJI_PATTERN = re.compile("["
+    u"\U0001F600-\U0001F64F"  # emoticons
+    u"\U0001F300-\U0001F5FF"  # symbols & pictographs
+    u"\U0001F680-\U0001F6FF"  # transport & map symbols
+    u"\U0001F1E0-\U0001F1FF"  # flags (iOS)
+    u"\U00002702-\U000027B0"
+    u"\U000024C2-\U0001F251"
+    "]+", flags=re.UNICODE)
 
 
-def vk_send_message(user_id, message, keyboard=None, attachment=None):
-    """Send message to VK user"""
-    # https://dev.vk.com/ru/api/api-requests
-    # https://dev.vk.com/ru/method/messages.send
+def remove_emoji(text):
+    """Remove emojis from text"""
+    return EMOJI_PATTERN.sub('', text)
+
+
+class CommandRouter:
+    """Command table: exact aliases in a dict, argument commands in a prefix trie"""
+
+    _END = object()
+
+    def __init__(self):
+        self.exact = {}
+        self.trie = {}
+
+    def add(self, name, aliases, handler, prefix=False):
+        """Register a handler for aliases; prefix handlers also receive the message text"""
+        for alias in aliases:
+            if not prefix:
+                self.exact[alias] = (name, handler, False)
+                continue
+            node = self.trie
+            for char in alias:
+                node = node.setdefault(char, {})
+            node[self._END] = (name, handler, True)
+
+    def resolve(self, text):
+        """Return (name, handler, takes_text) for a normalized message or None"""
+        route = self.exact.get(text)
+        if route is not None:
+            return route
+        node = self.trie
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                break
+            route = node.get(self._END, route)
+        return route
+
+    def split(self, text):
+        """Split a normalized message into the matched alias and the remaining text"""
+        if text in self.exact:
+            return text, ''
+        node = self.trie
+        length = 0
+        for index, char in enumerate(text):
+            node = node.get(char)
+            if node is None:
+                break
+            if self._END in node:
+                length = index + 1
+        return text[:length], text[length:]
+
+
+def vk_build_message_form(user_id, message, keyboard=None, attachment=None):
+    """Build the multipart form for messages.send"""
     if type(message) is not str:
         message = json.dumps(message)
     if not attachment and (message.startswith('photo-') or message.startswith('video-')):
         attachment = message
         message = ''
 
-    import random
     files = {
         'message': (None, message),
         'peer_id': (None, user_id),
         'access_token': (None, VK_ACCESS_TOKEN),
-        'v': (None, '5.199'),
+        'v': (None, VK_API_VERSION),
         'random_id': (None, str(random.randint(0, 2**31)))
     }
     if attachment is not None:
         files['attachment'] = (None, attachment)
     if keyboard is not None:
-        files['keyboard'] = (None, json.dumps(keyboard))
+        # Precompiled keyboards are already serialized
+        files['keyboard'] = (None, keyboard if type(keyboard) is str else json.dumps(keyboard))
+    return files
 
-    response = requests.post('https://api.vk.ru/method/messages.send', files=files)
-    return response.json() if response.status_code == 200 else None
+
+def vk_api_request(http_method, api_method, **kwargs):
+    """Call a VK API method through the circuit breaker, return the decoded response or None"""
+    # https://dev.vk.com/ru/api/api-requests
+    if not vk_api_breaker.allow_request():
+        logger.warning(f"VK API circuit breaker is open, skipping {api_method}")
+        api_errors.inc('vk', api_method)
+        return None
+    start = time.perf_counter()
+    try:
+        response = requests.request(http_method, f'{VK_API_URL}/{api_method}', timeout=VK_API_TIMEOUT, **kwargs)
+    except requests.RequestException as e:
+        vk_api_breaker.record_failure()
+        api_errors.inc('vk', api_method)
+        # The exception text contains the request URL with the access token
+        logger.error(f"VK API request {api_method} failed: {type(e).__name__}")
+        return None
+    finally:
+        api_latency.observe(time.perf_counter() - start, 'vk', api_method)
+    if response.status_code >= 500:
+        vk_api_breaker.record_failure()
+        api_errors.inc('vk', api_method)
+        return None
+    vk_api_breaker.record_success()
+    if response.status_code != 200:
+        api_errors.inc('vk', api_method)
+        return None
+    data = response.json()
+    if 'error' in data:
+        api_errors.inc('vk', api_method)
+    return data
+
+
+def vk_send_message(user_id, message, keyboard=None, attachment=None):
+    """Send message to VK user"""
+    # https://dev.vk.com/ru/method/messages.send
+    files = vk_build_message_form(user_id, message, keyboard, attachment)
+    return vk_api_request('POST', 'messages.send', files=files)
+
+
+def vk_compile_keyboard(buttons, one_time=False, inline=False):
+    """Serialize a keyboard once so it can be reused for every reply"""
+    # https://dev.vk.com/ru/api/bots/development/keyboard
+    return json.dumps({
+        'one_time': one_time,
+        'inline': inline,
+        'buttons': buttons
+    })
 
 
 def vk_send_buttons(user_id, buttons, message='', one_time=False, inline=False):
     """Send buttons to VK user"""
-    # https://dev.vk.com/ru/api/bots/development/keyboard
     # https://dev.vk.com/ru/method/messages.send
     if buttons is None:
         return None
-    keyboard = {
-        'one_time': one_time,
-        'inline': inline,
-        'buttons': buttons
-    }
-    result = vk_send_message(user_id, message, keyboard)
-    return result
+    return vk_send_message(user_id, message, vk_compile_keyboard(buttons, one_time, inline))
 
 
 def vk_create_buttons(data, color='primary', columns=2):
@@ -742,14 +1123,17 @@ def vk_create_buttons(data, color='primary', columns=2):
     row = []
     for index, item in enumerate(data):
         label = item.get('name')
-        command = item.get('value') or remove_emoji(label)
+        # Items with a payload become callback buttons, answered through message_event
+        payload = item.get('payload')
+        if payload is None:
+            payload = {'command': item.get('value') or remove_emoji(label)}
         row.append({
             'action': {
-                'type': 'text',
-                'payload': json.dumps({'command': command}),
+                'type': 'callback' if 'payload' in item else 'text',
+                'payload': json.dumps(payload),
                 'label': label
             },
-            'color': color
+            'color': item.get('color', color)
         })
         if (index + 1) % columns == 0:
             buttons.append(row)
@@ -759,6 +1143,37 @@ def vk_create_buttons(data, color='primary', columns=2):
     return buttons
 
 
+def vk_repost_buttons(reposts, label_key=None):
+    """Inline keyboard with Confirm/Reject callback buttons, a row per repost"""
+    data = []
+    for repost in reposts[:VK_INLINE_MAX_REPOSTS]:
+        name = repost[label_key][:30] if label_key else None
+        data.append({
+            'name': f"✅ {name}" if name else "✅ Подтвердить",
+            'payload': {'repost': sign_callback(VK_CALLBACK_SECRET, 'confirm', repost['id'])},
+            'color': 'positive'
+        })
+        data.append({
+            'name': f"❌ {name}" if name else "❌ Отклонить",
+            'payload': {'repost': sign_callback(VK_CALLBACK_SECRET, 'reject', repost['id'])},
+            'color': 'negative'
+        })
+    return vk_compile_keyboard(vk_create_buttons(data, columns=2), inline=True) if data else None
+
+
+def vk_answer_event(event, text):
+    """Acknowledge a callback button press with a snackbar"""
+    # https://dev.vk.com/ru/method/messages.sendMessageEventAnswer
+    return vk_api_request('POST', 'messages.sendMessageEventAnswer', data={
+        'event_id': event.get('event_id'),
+        'user_id': event.get('user_id'),
+        'peer_id': event.get('peer_id'),
+        'event_data': json.dumps({'type': 'show_snackbar', 'text': text}, ensure_ascii=False),
+        'access_token': VK_ACCESS_TOKEN,
+        'v': VK_API_VERSION
+    })
+
+
 def vk_get_group_info(group_id=None):
     """Get VK group information"""
     # https://dev.vk.com/ru/method/groups.getById
@@ -769,53 +1184,329 @@ def vk_get_group_info(group_id=None):
         'group_id': group_id,
         'fields': 'members_count',
         'access_token': VK_ACCESS_TOKEN,
-        'v': '5.199'
+        'v': VK_API_VERSION
     }
-    response = requests.get('https://api.vk.ru/method/groups.getById', params=params)
-    if response.status_code != 200:
+    data = vk_api_request('GET', 'groups.getById', params=params)
+    if data is None:
         return None
-    data = response.json()
     groups = data.get('response', {}).get('groups', [])
     return groups[0] if groups else None
 
 
+def vk_get_groups_info(group_names):
+    """Get several VK groups in one groups.getById request, {lowercase screen name or clubN: group}"""
+    # https://dev.vk.com/ru/method/groups.getById
+    data = vk_api_request('GET', 'groups.getById', params={
+        'group_ids': ','.join(group_names),
+        'fields': 'members_count',
+        'access_token': VK_ACCESS_TOKEN,
+        'v': VK_API_VERSION
+    })
+    if data is None:
+        return {}
+    groups = {}
+    for group in data.get('response', {}).get('groups', []):
+        groups[f"club{group['id']}"] = group
+        if group.get('screen_name'):
+            groups[group['screen_name'].lower()] = group
+    return groups
+
+
+def vk_send_messages(messages):
+    """Send (user_id, text, keyboard or None) triples as messages.send calls batched into execute requests"""
+    # https://dev.vk.com/ru/method/execute
+    for start in range(0, len(messages), VK_EXECUTE_MAX_CALLS):
+        batch = messages[start:start + VK_EXECUTE_MAX_CALLS]
+        code = 'return [' + ','.join(
+            'API.messages.send(' + json.dumps({
+                'peer_id': user_id,
+                'message': text,
+                'random_id': random.randint(0, 2**31),
+                **({'keyboard': keyboard} if keyboard else {})
+            }, ensure_ascii=False) + ')'
+            for user_id, text, keyboard in batch
+        ) + '];'
+        data = vk_api_request('POST', 'execute', data={
+            'code': code,
+            'access_token': VK_ACCESS_TOKEN,
+            'v': VK_API_VERSION
+        })
+        if data is None or 'response' not in data:
+            logger.error(f"Failed to send {len(batch)} notifications")
+
+
+def vk_get_walls(group_ids, count):
+    """Get the latest posts of up to 25 group walls in one execute request, {group_id: items}"""
+    # https://dev.vk.com/ru/method/execute
+    # https://dev.vk.com/ru/method/wall.get
+    code = 'return [' + ','.join(
+        f'API.wall.get({{"owner_id": -{group_id}, "count": {count}}})' for group_id in group_ids
+    ) + '];'
+    data = vk_api_request('POST', 'execute', data={
+        'code': code,
+        'access_token': VK_VERIFY_TOKEN,
+        'v': VK_API_VERSION
+    })
+    if data is None or 'response' not in data:
+        return {}
+    # Failed calls come back as false, their errors in execute_errors
+    return {
+        group_id: result.get('items', [])
+        for group_id, result in zip(group_ids, data['response'])
+        if result
+    }
+
+
+class VKRepostVerifier:
+    """Confirms pending reposts whose repost group wall has a copy of a post from the target group"""
+
+    def __init__(self, wall_count=VK_VERIFY_WALL_COUNT):
+        self.wall_count = wall_count
+        # Group id -> newest post id already checked, so only newer posts are looked at
+        self._last_seen = {}
+        self._forgotten = set()
+        self._lock = threading.Lock()
+
+    def forget(self, group_id):
+        """Check the whole page of a group again, a new pending repost may be older than the last seen post"""
+        with self._lock:
+            self._last_seen.pop(group_id, None)
+            self._forgotten.add(group_id)
+
+    def pending_by_group(self):
+        """Pending reposts grouped by the numeric id of the group the repost is made on"""
+        conn = VKDatabase.get_connection()
+        if not conn:
+            return {}
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(
+                "SELECT r.id, r.from_user_id, r.to_user_id, f.channel_id AS from_group_id, t.channel_id AS to_group_id, "
+                "f.channel_username AS from_channel, t.channel_username AS to_channel "
+                "FROM vk_reposts r "
+                "JOIN vk_channels f ON f.id = r.from_channel_id "
+                "JOIN vk_channels t ON t.id = r.to_channel_id "
+                "WHERE r.status = 'pending'"
+            )
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+        pending = {}
+        for row in rows:
+            if str(row['from_group_id']).isdigit() and str(row['to_group_id']).isdigit():
+                pending.setdefault(int(row['from_group_id']), []).append(row)
+        return pending
+
+    def check(self):
+        """Look for the pending reposts on their group walls, return how many were confirmed"""
+        with self._lock:
+            self._forgotten.clear()
+        pending = self.pending_by_group()
+        group_ids = list(pending)
+        confirmed = 0
+        for start in range(0, len(group_ids), VK_EXECUTE_MAX_CALLS):
+            walls = vk_get_walls(group_ids[start:start + VK_EXECUTE_MAX_CALLS], self.wall_count)
+            for group_id, items in walls.items():
+                last_seen = self._last_seen.get(group_id, 0)
+                sources = {
+                    -copy['owner_id']
+                    for item in items if item['id'] > last_seen
+                    for copy in item.get('copy_history', [])
+                }
+                if items:
+                    with self._lock:
+                        if group_id not in self._forgotten:
+                            self._last_seen[group_id] = max(last_seen, max(item['id'] for item in items))
+                for row in pending[group_id]:
+                    if int(row['to_group_id']) in sources:
+                        confirmed += self.confirm(row)
+        return confirmed
+
+    def confirm(self, row):
+        conn = VKDatabase.get_connection()
+        if not conn:
+            return 0
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "UPDATE vk_reposts SET status = 'confirmed', confirmed_date = NOW() WHERE id = %s AND status = 'pending'",
+                (row['id'],)
+            )
+            confirmed = cursor.rowcount
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+        if confirmed:
+            vk_send_message(row['from_user_id'], VERIFIED_REQUESTER_TEXT.format(**row))
+            vk_send_message(row['to_user_id'], VERIFIED_OWNER_TEXT.format(**row))
+        return confirmed
+
+    def run(self, interval):
+        while True:
+            try:
+                confirmed = self.check()
+                if confirmed:
+                    logger.info(f"Verified {confirmed} reposts on VK walls")
+            except Exception:
+                # Anything from the VK API or the database; the next pass starts afresh
+                logger.exception("Error verifying VK reposts")
+            time.sleep(interval)
+
+    def start(self, interval):
+        thread = threading.Thread(target=self.run, args=(interval,), name='vk-repost-verifier', daemon=True)
+        thread.start()
+        return thread
+
+
 # Command handlers
+# Keyboards, compiled once at startup
+MAIN_MENU_BUTTONS = [
+    {'name': '➕ Добавить группу', 'value': 'добавить'},
+    {'name': '📋 Мои группы', 'value': 'мои'},
+    {'name': '🔍 Найти группы', 'value': 'найти_помощь'},
+    {'name': '✅ Готово', 'value': 'готово_помощь'},
+    {'name': '📊 Статистика', 'value': 'статистика'},
+    {'name': 'ℹ️ Помощь', 'value': 'помощь'},
+]
+MAIN_MENU_KEYBOARD = vk_compile_keyboard(vk_create_buttons(MAIN_MENU_BUTTONS, columns=2))
+
+
+def cached_reply_key(user_id, command, message_text):
+    """Key of a cached reply: statistics are shared, other replies are per user"""
+    if command == 'stat':
+        return command
+    return user_id, message_text
+
+
+# Message builders for dynamic replies
+def my_channels_parts(channels):
+    """Header, item blocks and footer of the list of the user's groups"""
+    return "📋 Ваши группы:\n\n", [
+        f"• {ch['channel_username']} - 👥 {ch['subscriber_count']} подписчиков\n"
+        for ch in channels
+    ], ""
+
+
+def find_results_parts(channels):
+    """Header, item blocks and footer of find results"""
+    return f"🔍 Найдено {len(channels)} похожих групп:\n\n", [
+        f"• {ch['channel_username']} - 👥 {ch['subscriber_count']} подписчиков\n"
+        f"  ✅ Подтверждено: {ch['confirmed_count']} | ⏳ Ожидает: {ch['pending_count']}\n"
+        for ch in channels
+    ], "\n💡 Подпишитесь на группу, сделайте репост и используйте команду 'готово [группа] [на_какой_группе]'."
+
+
+def find_all_results_parts(own_channels, found):
+    """Header, one block per user's group and footer of find results grouped by the user's groups"""
+    return "🔍 Похожие группы для ваших групп:\n", [
+        "".join([
+            f"\n{own['channel_username']} (👥 {own['subscriber_count']}):\n",
+            *[
+                f"• {ch['channel_username']} - 👥 {ch['subscriber_count']} подписчиков\n"
+                f"  ✅ Подтверждено: {ch['confirmed_count']} | ⏳ Ожидает: {ch['pending_count']}\n"
+                for ch in found.get(own['channel_username'], [])
+            ],
+            "" if own['channel_username'] in found else "  😔 Похожих групп пока нет\n",
+        ])
+        for own in own_channels
+    ], "\n💡 Подпишитесь на группу, сделайте репост и используйте команду 'готово [группа] [на_какой_группе]'."
+
+
+def render_bulk_done(created, existing, missing):
+    """Render the reply to a bulk done command"""
+    parts = []
+    if created:
+        parts.append(
+            "✅ Уведомления отправлены владельцам групп: "
+            + ", ".join(target['channel_username'] for target in created) + ".\nОжидайте подтверждения."
+        )
+    if existing:
+        parts.append("⏳ Уже ожидают подтверждения: " + ", ".join(t['channel_username'] for t in existing) + ".")
+    if missing:
+        parts.append("❌ Не найдены в каталоге: " + ", ".join(missing) + ".")
+    return "\n\n".join(parts)
+
+
+def render_done_notice(repost_channel, targets):
+    """Render one owner's notification about reposts for several of their groups"""
+    return "".join([
+        "🔔 Новое уведомление о репосте!\n\n",
+        f"Группа {repost_channel} сообщает, что сделала репост для "
+        + ", ".join(target['channel_username'] for target in targets) + ".\n\n",
+        "Проверьте и подтвердите командой:\n",
+        *[f"подтвердить {target['channel_username']} {repost_channel}\n" for target in targets],
+    ])
+
+
+def render_confirmed_notice(my_channel, reposts, stats_text):
+    """Render one author's notification about confirmed reposts"""
+    return (
+        f"🎉 Ваш репост подтверждён!\n\n"
+        f"Владелец группы {my_channel} подтвердил репост с "
+        f"{'ваших групп' if len(reposts) > 1 else 'вашей группы'} "
+        + ", ".join(repost['from_channel'] for repost in reposts) + f".{stats_text}"
+    )
+
+
+def pending_list_parts(reposts):
+    """Header, item blocks and footer of the reposts awaiting confirmation"""
+    return "📋 Ожидают подтверждения:\n\n", [
+        f"• {r['from_channel']} → {r['to_channel']}\n"
+        f"  📅 {r['created_date'].strftime('%d.%m.%Y %H:%M')}\n\n"
+        for r in reposts
+    ], "Используйте 'подтвердить [своя_группа] [группа_репоста]' для подтверждения."
+
+
+def render_digest(reposts, total):
+    """Render one owner's digest of new pending reposts"""
+    more = total - len(reposts)
+    return "".join([
+        f"🔔 Новые запросы на подтверждение репостов: {total}\n\n",
+        *[f"• {r['from_channel']} → {r['to_channel']}\n" for r in reposts],
+        f"…и ещё {more}\n" if more > 0 else "",
+        "\nПодтвердите командой 'подтвердить [своя_группа] [группа_репоста]', список всех запросов: 'список'",
+    ])
+
+
+def render_difference(difference):
+    """Render a subscriber count change"""
+    if difference > 0:
+        return f"📈 +{difference}"
+    if difference < 0:
+        return f"📉 {difference}"
+    return "➡️ без изменений"
+
+
+def render_growth(new_count, summary):
+    """Render 7- and 30-day changes from the precomputed summary, when there is history that old"""
+    return "".join(
+        f"\n📅 За {days} дней: {render_difference(new_count - summary[key])}"
+        for days, key in ((7, 'count_7d'), (30, 'count_30d'))
+        if summary[key] is not None
+    )
+
+
+def render_updated_counts(updated_counts):
+    """Render refreshed subscriber counts"""
+    if not updated_counts:
+        return ""
+    text = "\n\n📊 Обновлена статистика:"
+    for channel, count in updated_counts.items():
+        text += f"\n• {channel}: {count} подписчиков"
+    return text
+
+
 def handle_start(user_id):
     """Handle /start command"""
-    text = (
-        "👋 Добро пожаловать в бот обмена аудиторией!\n\n"
-        "Используйте команду 'помощь' для просмотра всех команд."
-    )
-    vk_send_message(user_id, text)
+    vk_send_message(user_id, START_TEXT)
     send_main_menu(user_id)
 
 
 def handle_help(user_id):
     """Handle /help command"""
-    help_text = """
-📚 Справка по командам:
-
-добавить - Добавить свою группу в каталог
-мои - Показать мои группы
-удалить [группа] - Удалить группу из каталога
-обновить [группа] - Обновить количество подписчиков
-найти [группа] - Найти похожие группы для обмена
-готово [группа] [на_какой_группе] - Сообщить владельцу группы о выполненном репосте
-подтвердить [своя_группа] [группа_репоста] - Подтвердить репост
-список - Список групп, ожидающих подтверждения
-статистика - Показать статистику бота
-жалоба [группа] [причина] - Пожаловаться на группу и владельца
-помощь - Показать эту справку
-
-Как это работает:
-1. Добавьте свою группу командой 'добавить'
-2. Найдите похожие группы 'найти'
-3. Подпишитесь и сделайте репост любого поста
-4. Сообщите 'готово' после репоста
-5. Владелец группы подтвердит 'подтвердить'
-6. Ожидайте ответного репоста
-    """
-    vk_send_message(user_id, help_text)
+    vk_send_message(user_id, HELP_TEXT)
 
 
 def handle_add_channel(user_id, message_text):
@@ -849,7 +1540,7 @@ def handle_add_channel(user_id, message_text):
         # Save in the database
         conn = VKDatabase.get_connection()
         if not conn:
-            vk_send_message(user_id, "❌ Ошибка. Пожалуйста, попробуйте повторить попытку позже.")
+            vk_send_message(user_id, ERROR_TEXT)
             return
 
         cursor = conn.cursor()
@@ -860,6 +1551,7 @@ def handle_add_channel(user_id, message_text):
                 "VALUES (%s, %s, %s, %s)",
                 (screen_name, channel_id, user_id, member_count)
             )
+            record_observations(cursor, 'vk_', [(cursor.lastrowid, member_count)])
             conn.commit()
 
             vk_send_message(
@@ -889,7 +1581,7 @@ def handle_my_channels(user_id):
     """Handle my channels command"""
     conn = VKDatabase.get_connection()
     if not conn:
-        vk_send_message(user_id, "❌ Ошибка. Пожалуйста, попробуйте повторить попытку позже.")
+        vk_send_message(user_id, ERROR_TEXT)
         return
 
     cursor = conn.cursor(dictionary=True)
@@ -907,11 +1599,9 @@ def handle_my_channels(user_id):
         vk_send_message(user_id, "📭 У вас нет добавленных групп.")
         return
 
-    text = "📋 Ваши группы:\n\n"
-    for ch in channels:
-        text += f"• {ch['channel_username']} - 👥 {ch['subscriber_count']} подписчиков\n"
-
-    vk_send_message(user_id, text)
+    # Long lists go out as several messages within the size limit
+    for page in split_pages(*my_channels_parts(channels)):
+        vk_send_message(user_id, page)
 
 
 def handle_delete_channel(user_id, message_text):
@@ -929,7 +1619,7 @@ def handle_delete_channel(user_id, message_text):
 
     conn = VKDatabase.get_connection()
     if not conn:
-        vk_send_message(user_id, "❌ Ошибка. Пожалуйста, попробуйте повторить попытку позже.")
+        vk_send_message(user_id, ERROR_TEXT)
         return
 
     cursor = conn.cursor()
@@ -975,14 +1665,15 @@ def handle_update_channel_stats(user_id, message_text):
 
     conn = VKDatabase.get_connection()
     if not conn:
-        vk_send_message(user_id, "❌ Ошибка. Пожалуйста, попробуйте повторить попытку позже.")
+        vk_send_message(user_id, ERROR_TEXT)
         return
 
     cursor = conn.cursor(dictionary=True)
 
     # Checking if the user is the owner
     cursor.execute(
-        "SELECT channel_id, subscriber_count FROM vk_channels WHERE channel_username = %s AND owner_user_id = %s",
+        "SELECT id, channel_id, subscriber_count FROM vk_channels "
+        "WHERE channel_username = %s AND owner_user_id = %s",
         (channel_username, user_id)
     )
 
@@ -1014,18 +1705,19 @@ def handle_update_channel_stats(user_id, message_text):
 
         # Update in the database
         cursor.execute(
-            "UPDATE vk_channels SET subscriber_count = %s WHERE channel_username = %s",
-            (new_count, channel_username)
+            "UPDATE vk_channels SET subscriber_count = %s WHERE id = %s",
+            (new_count, channel_data['id'])
         )
+        record_observations(cursor, 'vk_', [(channel_data['id'], new_count)])
         conn.commit()
 
-        difference = new_count - old_count
-        if difference > 0:
-            change_text = f"📈 +{difference}"
-        elif difference < 0:
-            change_text = f"📉 {difference}"
-        else:
-            change_text = "➡️ без изменений"
+        # Summary just refreshed by record_observations
+        cursor.execute(
+            "SELECT count_7d, count_30d FROM vk_subscriber_summary WHERE channel_id = %s",
+            (channel_data['id'],)
+        )
+        summary = cursor.fetchone() or {'count_7d': None, 'count_30d': None}
+        change_text = render_difference(new_count - old_count) + render_growth(new_count, summary)
 
         vk_send_message(
             user_id,
@@ -1050,25 +1742,21 @@ def handle_find_channels(user_id, message_text):
     """Handle find channels command"""
     parts = message_text.split(maxsplit=1)
     if len(parts) < 2:
-        vk_send_message(
-            user_id,
-            "❌ Укажите имя своей группы.\n"
-            "Пример: найти mygroup"
-        )
+        handle_find_for_all_channels(user_id, message_text)
         return
 
     channel_username = parts[1].strip()
 
     conn = VKDatabase.get_connection()
     if not conn:
-        vk_send_message(user_id, "❌ Ошибка. Пожалуйста, попробуйте повторить попытку позже.")
+        vk_send_message(user_id, ERROR_TEXT)
         return
 
     cursor = conn.cursor(dictionary=True)
 
     # Getting subscribers to a user's channel
     cursor.execute(
-        "SELECT subscriber_count FROM vk_channels WHERE channel_username = %s",
+        "SELECT id, subscriber_count FROM vk_channels WHERE channel_username = %s",
         (channel_username,)
     )
 
@@ -1083,23 +1771,24 @@ def handle_find_channels(user_id, message_text):
         conn.close()
         return
 
-    target_count = result['subscriber_count']
-    diff = math.ceil(max(target_count, 100) * 0.2)
-
-    # Looking for similar channels (±20%) with repost counts
+    # Looking for similar channels (±20%) with repost counts, reliable and closer ones more likely,
+    # except those the channel already reposted for
     cursor.execute(
-        "SELECT c.channel_username, c.subscriber_count, "
-        "(SELECT COUNT(*) FROM vk_reposts r WHERE r.to_channel = c.channel_username AND r.status = 'confirmed') as confirmed_count, "
-        "(SELECT COUNT(*) FROM vk_reposts r WHERE r.to_channel = c.channel_username AND r.status = 'pending') as pending_count "
+        "SELECT c.id, c.channel_username, c.subscriber_count, "
+        "(SELECT COUNT(*) FROM vk_reposts r WHERE r.to_channel_id = c.id AND r.status = 'confirmed') + c.archived_confirmed as confirmed_count, "
+        "(SELECT COUNT(*) FROM vk_reposts r WHERE r.to_channel_id = c.id AND r.status = 'pending') as pending_count "
         "FROM vk_channels c "
         "WHERE c.channel_username != %s "
         "AND c.owner_user_id != %s "
         "AND c.subscriber_count BETWEEN %s AND %s "
-        "ORDER BY RAND() LIMIT 10",
-        (channel_username, user_id, max(target_count - diff, 0), target_count + diff)
+        f"ORDER BY {PROXIMITY_WEIGHTED_RANDOM} LIMIT {10 * OVERSAMPLE}",
+        (
+            channel_username, user_id, *subscriber_band(result['subscriber_count']),
+            *proximity_params(result['subscriber_count'])
+        )
     )
 
-    channels = cursor.fetchall()
+    channels = [ch for ch in cursor.fetchall() if not pair_index.reposted((result['id'],), ch['id'])][:10]
     cursor.close()
     conn.close()
 
@@ -1111,19 +1800,65 @@ def handle_find_channels(user_id, message_text):
         )
         return
 
-    text = f"🔍 Найдено {len(channels)} похожих групп:\n\n"
-    for ch in channels:
-        text += (f"• {ch['channel_username']} - 👥 {ch['subscriber_count']} подписчиков\n"
-                 f"  ✅ Подтверждено: {ch['confirmed_count']} | ⏳ Ожидает: {ch['pending_count']}\n")
+    if impression_buffer:
+        impression_buffer.record(ch['id'] for ch in channels)
+    pages = split_pages(*find_results_parts(channels))
+    reply_cache.put(cached_reply_key(user_id, 'find', message_text), pages[0])
+    for page in pages:
+        vk_send_message(user_id, page)
 
-    text += "\n💡 Подпишитесь на группу, сделайте репост и используйте команду 'готово [группа] [на_какой_группе]'."
 
-    vk_send_message(user_id, text)
+def handle_find_for_all_channels(user_id, message_text):
+    """Handle find command without a group: candidates for each of the user's groups"""
+    conn = VKDatabase.get_connection()
+    if not conn:
+        vk_send_message(user_id, ERROR_TEXT)
+        return
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            "SELECT id, channel_username, subscriber_count FROM vk_channels WHERE owner_user_id = %s "
+            "ORDER BY subscriber_count DESC LIMIT %s",
+            (user_id, MAX_CHANNELS)
+        )
+        own_channels = cursor.fetchall()
+        if not own_channels:
+            vk_send_message(
+                user_id,
+                "❌ У вас нет добавленных групп. Используйте команду 'добавить'\n"
+                "Или укажите группу: найти mygroup"
+            )
+            return
+
+        # Overlapping bands are merged, so every band is sampled once by a single statement
+        bands = merge_bands(own_channels, PER_CHANNEL_LIMIT)
+        cursor.execute(candidates_query('vk_', bands), candidates_params(user_id, bands))
+        # Channels a member of the band already reposted for are left out
+        member_ids = [[ch['id'] for ch in members] for _, _, _, members in bands]
+        rows = [row for row in cursor.fetchall() if not pair_index.reposted(member_ids[row['band']], row['id'])]
+        found = assign_candidates(bands, rows, PER_CHANNEL_LIMIT)
+    finally:
+        cursor.close()
+        conn.close()
+
+    if impression_buffer:
+        impression_buffer.record(ch['id'] for rows in found.values() for ch in rows)
+    # Up to MAX_CHANNELS groups with their candidates go out as several messages within the size limit
+    pages = split_pages(*find_all_results_parts(own_channels, found))
+    reply_cache.put(cached_reply_key(user_id, 'find', message_text), pages[0])
+    for page in pages:
+        vk_send_message(user_id, page)
 
 
 def handle_done_repost(user_id, message_text):
     """Handle done repost command"""
     parts = message_text.split()
+    bulk = split_bulk_args(parts[1:], 'на')
+    if bulk is not None:
+        handle_done_reposts_bulk(user_id, *bulk)
+        return
+
     if len(parts) < 3:
         vk_send_message(
             user_id,
@@ -1137,7 +1872,7 @@ def handle_done_repost(user_id, message_text):
 
     conn = VKDatabase.get_connection()
     if not conn:
-        vk_send_message(user_id, "❌ Ошибка. Пожалуйста, попробуйте повторить попытку позже.")
+        vk_send_message(user_id, ERROR_TEXT)
         return
 
     cursor = conn.cursor(dictionary=True)
@@ -1161,11 +1896,12 @@ def handle_done_repost(user_id, message_text):
 
     # Check that the user is the owner of their channel
     cursor.execute(
-        "SELECT id FROM vk_channels WHERE channel_username = %s AND owner_user_id = %s",
+        "SELECT id, channel_id FROM vk_channels WHERE channel_username = %s AND owner_user_id = %s",
         (repost_channel, user_id)
     )
 
-    if not cursor.fetchone():
+    from_channel_row = cursor.fetchone()
+    if not from_channel_row:
         vk_send_message(
             user_id,
             f"❌ Группа {repost_channel} не найдена или вы не являетесь её владельцем"
@@ -1174,11 +1910,10 @@ def handle_done_repost(user_id, message_text):
         conn.close()
         return
 
-    from_channel = repost_channel
-
-    # Get the owner of the target channel
+    # Get the owner of the target channel and how they want to be notified
     cursor.execute(
-        "SELECT owner_user_id FROM vk_channels WHERE channel_username = %s",
+        "SELECT c.id, c.owner_user_id, COALESCE(s.digest, 0) AS digest FROM vk_channels c "
+        "LEFT JOIN vk_user_settings s ON s.user_id = c.owner_user_id WHERE c.channel_username = %s",
         (to_channel,)
     )
 
@@ -1197,11 +1932,17 @@ def handle_done_repost(user_id, message_text):
     # Create a repost entry
     try:
         cursor.execute(
-            "INSERT INTO vk_reposts (from_channel, to_channel, repost_channel, from_user_id, to_user_id, status) "
+            "INSERT INTO vk_reposts (from_channel_id, to_channel_id, repost_channel, from_user_id, to_user_id, status) "
             "VALUES (%s, %s, %s, %s, %s, 'pending')",
-            (from_channel, to_channel, repost_channel, user_id, to_user_id)
+            (from_channel_row['id'], to_owner_result['id'], repost_channel, user_id, to_user_id)
         )
         conn.commit()
+        repost_id = cursor.lastrowid
+        pair_index.add(from_channel_row['id'], to_owner_result['id'])
+        if expiry_scheduler:
+            expiry_scheduler.schedule(repost_id)
+        if repost_verifier and str(from_channel_row['channel_id']).isdigit():
+            repost_verifier.forget(int(from_channel_row['channel_id']))
 
         vk_send_message(
             user_id,
@@ -1209,6 +1950,10 @@ def handle_done_repost(user_id, message_text):
             "Ожидайте подтверждения."
         )
 
+        # Owners with a digest get the repost in their next one
+        if DIGEST_INTERVAL and to_owner_result['digest']:
+            return
+
         # Notify the channel owner
         try:
             vk_send_message(
@@ -1216,7 +1961,8 @@ def handle_done_repost(user_id, message_text):
                 f"🔔 Новое уведомление о репосте!\n\n"
                 f"Группа {repost_channel} сообщает, что сделала репост для {to_channel}.\n\n"
                 f"Проверьте и подтвердите командой:\n"
-                f"подтвердить {to_channel} {repost_channel}"
+                f"подтвердить {to_channel} {repost_channel}",
+                keyboard=vk_repost_buttons([{'id': repost_id}])
             )
         except Exception as e:
             logger.error(f"Failed to send notification: {e}")
@@ -1231,6 +1977,73 @@ def handle_done_repost(user_id, message_text):
         conn.close()
 
 
+def handle_done_reposts_bulk(user_id, targets, repost_channel):
+    """Handle done command for several target groups at once"""
+    if not targets or not repost_channel:
+        vk_send_message(
+            user_id,
+            "❌ Укажите группы, для которых сделали репост, и группу, на которой был сделан репост.\n"
+            "Пример: готово first second на yourgroup"
+        )
+        return
+
+    targets = unique_names(targets)
+    if len(targets) > MAX_TARGETS:
+        vk_send_message(user_id, f"❌ Не больше {MAX_TARGETS} групп за раз.")
+        return
+
+    conn = VKDatabase.get_connection()
+    if not conn:
+        vk_send_message(user_id, ERROR_TEXT)
+        return
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        # The user's group and every target in one query
+        channels = load_channels(cursor, 'vk_', [repost_channel, *targets])
+        own = channels.get(repost_channel.lower())
+        if not own or own['owner_user_id'] != user_id:
+            vk_send_message(
+                user_id,
+                f"❌ Группа {repost_channel} не найдена или вы не являетесь её владельцем"
+            )
+            return
+
+        found = [channels[t.lower()] for t in targets if t.lower() in channels and channels[t.lower()] is not own]
+        missing = [target for target in targets if target.lower() not in channels]
+        created, existing = create_pending(conn, cursor, 'vk_', user_id, own, found) if found else ([], [])
+    except mysql.connector.IntegrityError:
+        conn.rollback()
+        vk_send_message(user_id, "❌ Запрос на подтверждение репоста уже существует")
+        return
+    finally:
+        cursor.close()
+        conn.close()
+
+    for target in created:
+        pair_index.add(own['id'], target['id'])
+        if expiry_scheduler:
+            expiry_scheduler.schedule(target['repost_id'])
+    if created and repost_verifier and str(own['channel_id']).isdigit():
+        repost_verifier.forget(int(own['channel_id']))
+
+    vk_send_message(user_id, render_bulk_done(created, existing, missing))
+
+    # One message per owner; owners with a digest get the reposts in their next one
+    vk_send_messages([
+        (
+            owner_id,
+            render_done_notice(own['channel_username'], rows),
+            vk_repost_buttons(
+                [{'id': row['repost_id'], 'channel_username': row['channel_username']} for row in rows],
+                'channel_username' if len(rows) > 1 else None
+            )
+        )
+        for owner_id, rows in group_by(created, 'owner_user_id').items()
+        if not (DIGEST_INTERVAL and rows[0]['digest'])
+    ])
+
+
 def handle_confirm_repost(user_id, message_text):
     """Handle confirm repost command"""
     parts = message_text.split()
@@ -1247,7 +2060,7 @@ def handle_confirm_repost(user_id, message_text):
 
     conn = VKDatabase.get_connection()
     if not conn:
-        vk_send_message(user_id, "❌ Ошибка. Пожалуйста, попробуйте повторить попытку позже.")
+        vk_send_message(user_id, ERROR_TEXT)
         return
 
     cursor = conn.cursor(dictionary=True)
@@ -1258,7 +2071,8 @@ def handle_confirm_repost(user_id, message_text):
         (my_channel, user_id)
     )
 
-    if not cursor.fetchone():
+    my_channel_row = cursor.fetchone()
+    if not my_channel_row:
         vk_send_message(
             user_id,
             f"❌ Группа {my_channel} не найдена или вы не являетесь её владельцем"
@@ -1269,11 +2083,12 @@ def handle_confirm_repost(user_id, message_text):
 
     # Finding a pending repost
     cursor.execute(
-        "SELECT r.id, r.from_channel, r.from_user_id "
+        "SELECT r.id, r.from_user_id, r.from_channel_id "
         "FROM vk_reposts r "
-        "WHERE r.to_channel = %s AND r.from_channel = %s AND r.to_user_id = %s AND r.status = 'pending' "
+        "JOIN vk_channels f ON f.id = r.from_channel_id "
+        "WHERE r.to_channel_id = %s AND f.channel_username = %s AND r.to_user_id = %s AND r.status = 'pending' "
         "LIMIT 1",
-        (my_channel, repost_channel, user_id)
+        (my_channel_row['id'], repost_channel, user_id)
     )
 
     repost = cursor.fetchone()
@@ -1288,6 +2103,7 @@ def handle_confirm_repost(user_id, message_text):
 
     # Updating the subscriber count on both channels
     updated_counts = {}
+    observations = []
 
     # Updating the subscribers of the channel that reposted
     try:
@@ -1295,9 +2111,10 @@ def handle_confirm_repost(user_id, message_text):
         if repost_group_info:
             repost_member_count = repost_group_info.get('members_count', 0)
             cursor.execute(
-                "UPDATE vk_channels SET subscriber_count = %s WHERE channel_username = %s",
-                (repost_member_count, repost_channel)
+                "UPDATE vk_channels SET subscriber_count = %s WHERE id = %s",
+                (repost_member_count, repost['from_channel_id'])
             )
+            observations.append((repost['from_channel_id'], repost_member_count))
             updated_counts[repost_channel] = repost_member_count
     except Exception as e:
         logger.error(f"Failed to update subscriber count for {repost_channel}: {e}")
@@ -1308,27 +2125,37 @@ def handle_confirm_repost(user_id, message_text):
         if my_group_info:
             my_member_count = my_group_info.get('members_count', 0)
             cursor.execute(
-                "UPDATE vk_channels SET subscriber_count = %s WHERE channel_username = %s",
-                (my_member_count, my_channel)
+                "UPDATE vk_channels SET subscriber_count = %s WHERE id = %s",
+                (my_member_count, my_channel_row['id'])
             )
+            observations.append((my_channel_row['id'], my_member_count))
             updated_counts[my_channel] = my_member_count
     except Exception as e:
         logger.error(f"Failed to update subscriber count for {my_channel}: {e}")
 
-    # Confirming the repost
+    record_observations(cursor, 'vk_', observations)
+
+    # Confirming the repost, unless it was confirmed or rejected in the meantime
     cursor.execute(
-        "UPDATE vk_reposts SET status = 'confirmed', confirmed_date = NOW() WHERE id = %s",
+        "UPDATE vk_reposts SET status = 'confirmed', confirmed_date = NOW() WHERE id = %s AND status = 'pending'",
         (repost['id'],)
     )
-    conn.commit()
+    confirmed = cursor.rowcount
+    if confirmed:
+        conn.commit()
+    else:
+        conn.rollback()
     cursor.close()
     conn.close()
+    if not confirmed:
+        vk_send_message(
+            user_id,
+            f"❌ Нет ожидающих подтверждения репостов от группы {repost_channel} для {my_channel}."
+        )
+        return
 
-    response_text = f"✅ Репост от группы {repost_channel} для вашей группы {my_channel} подтверждён!"
-    if updated_counts:
-        response_text += "\n\n📊 Обновлена статистика:"
-        for channel, count in updated_counts.items():
-            response_text += f"\n• {channel}: {count} подписчиков"
+    stats_text = render_updated_counts(updated_counts)
+    response_text = f"✅ Репост от группы {repost_channel} для вашей группы {my_channel} подтверждён!{stats_text}"
 
     vk_send_message(user_id, response_text)
 
@@ -1336,29 +2163,171 @@ def handle_confirm_repost(user_id, message_text):
     try:
         notification_text = (
             f"🎉 Ваш репост подтверждён!\n\n"
-            f"Владелец группы {my_channel} подтвердил репост с вашей группы {repost_channel}."
+            f"Владелец группы {my_channel} подтвердил репост с вашей группы {repost_channel}.{stats_text}"
         )
-        if updated_counts:
-            notification_text += "\n\n📊 Обновлена статистика:"
-            for channel, count in updated_counts.items():
-                notification_text += f"\n• {channel}: {count} подписчиков"
 
         vk_send_message(repost['from_user_id'], notification_text)
     except Exception as e:
         logger.error(f"Failed to send notification: {e}")
 
 
+def handle_confirm_all_reposts(user_id, message_text):
+    """Handle confirm all command"""
+    parts = message_text.split()
+    if len(parts) < 2:
+        vk_send_message(
+            user_id,
+            "❌ Укажите имя своей группы.\n"
+            "Пример: подтвердить_все mygroup"
+        )
+        return
+
+    my_channel = parts[1].strip()
+
+    conn = VKDatabase.get_connection()
+    if not conn:
+        vk_send_message(user_id, ERROR_TEXT)
+        return
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        # Ownership and the pending reposts in one query
+        own, reposts = pending_for_channel(cursor, 'vk_', user_id, my_channel)
+        if own is None:
+            vk_send_message(
+                user_id,
+                f"❌ Группа {my_channel} не найдена или вы не являетесь её владельцем"
+            )
+            return
+        if not reposts:
+            vk_send_message(user_id, f"📭 Нет ожидающих подтверждения репостов для {own['channel_username']}.")
+            return
+
+        # Subscriber counts of every group involved in one request
+        usernames = {repost['from_channel_id']: repost['from_channel'] for repost in reposts}
+        usernames[own['id']] = own['channel_username']
+        groups = vk_get_groups_info(list(dict.fromkeys(usernames.values())))
+        counts = {
+            channel_id: groups[username.lower()].get('members_count', 0)
+            for channel_id, username in usernames.items() if username.lower() in groups
+        }
+        reposts = confirm_pending(conn, cursor, 'vk_', reposts, counts)
+    finally:
+        cursor.close()
+        conn.close()
+
+    updated_counts = {usernames[channel_id]: count for channel_id, count in counts.items()}
+    vk_send_message(
+        user_id,
+        f"✅ Подтверждено репостов для группы {own['channel_username']}: {len(reposts)}"
+        f"{render_updated_counts(updated_counts)}"
+    )
+
+    # One message per repost author
+    notices = []
+    for from_user_id, rows in group_by(reposts, 'from_user_id').items():
+        channel_counts = {
+            usernames[channel_id]: counts[channel_id]
+            for channel_id in [own['id'], *[row['from_channel_id'] for row in rows]] if channel_id in counts
+        }
+        notices.append((
+            from_user_id,
+            render_confirmed_notice(own['channel_username'], rows, render_updated_counts(channel_counts)),
+            None
+        ))
+    vk_send_messages(notices)
+
+
+def handle_repost_button(event):
+    """Handle a Confirm/Reject callback button press"""
+    user_id = event.get('user_id')
+    if not rate_limiter.hit(user_id, 'button'):
+        vk_answer_event(event, THROTTLED_TEXT)
+        return
+
+    payload = event.get('payload') or {}
+    if isinstance(payload, str):
+        try:
+            payload = json.loads(payload)
+        except ValueError:
+            payload = {}
+    parsed = verify_callback(VK_CALLBACK_SECRET, payload.get('repost') if isinstance(payload, dict) else None)
+    if not parsed:
+        vk_answer_event(event, "❌ Кнопка недействительна")
+        return
+    action, repost_id = parsed
+
+    conn = VKDatabase.get_connection()
+    if not conn:
+        vk_answer_event(event, ERROR_TEXT)
+        return
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        # A single primary key update, guarded by the owner and the pending status
+        if action == 'confirm':
+            cursor.execute(
+                "UPDATE vk_reposts SET status = 'confirmed', confirmed_date = NOW() "
+                "WHERE id = %s AND to_user_id = %s AND status = 'pending'",
+                (repost_id, user_id)
+            )
+        else:
+            cursor.execute(
+                "UPDATE vk_reposts SET status = 'rejected' WHERE id = %s AND to_user_id = %s AND status = 'pending'",
+                (repost_id, user_id)
+            )
+        conn.commit()
+        if cursor.rowcount != 1:
+            vk_answer_event(event, "ℹ️ Запрос уже обработан или не найден")
+            return
+
+        cursor.execute(
+            "SELECT r.from_user_id, r.from_channel_id, r.to_channel_id, "
+            "f.channel_username AS from_channel, t.channel_username AS to_channel "
+            "FROM vk_reposts r "
+            "JOIN vk_channels f ON f.id = r.from_channel_id "
+            "JOIN vk_channels t ON t.id = r.to_channel_id "
+            "WHERE r.id = %s",
+            (repost_id,)
+        )
+        repost = cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.close()
+
+    if action == 'reject':
+        pair_index.remove(repost['from_channel_id'], repost['to_channel_id'])
+
+    if action == 'confirm':
+        vk_answer_event(event, "✅ Репост подтверждён")
+        text = (
+            f"🎉 Ваш репост подтверждён!\n\n"
+            f"Владелец группы {repost['to_channel']} подтвердил репост с вашей группы {repost['from_channel']}."
+        )
+    else:
+        vk_answer_event(event, "❌ Репост отклонён")
+        text = f"❌ Владелец группы {repost['to_channel']} отклонил репост с вашей группы {repost['from_channel']}."
+
+    # Notify the author of the repost
+    try:
+        vk_send_message(repost['from_user_id'], text)
+    except Exception as e:
+        logger.error(f"Failed to send notification: {e}")
+
+
 def handle_list_pending(user_id):
     """Handle list pending command"""
     conn = VKDatabase.get_connection()
     if not conn:
-        vk_send_message(user_id, "❌ Ошибка. Пожалуйста, попробуйте повторить попытку позже.")
+        vk_send_message(user_id, ERROR_TEXT)
         return
 
     cursor = conn.cursor(dictionary=True)
     cursor.execute(
-        "SELECT r.from_channel, r.to_channel, r.created_date "
+        "SELECT r.id, f.channel_username AS from_channel, t.channel_username AS to_channel, r.created_date "
         "FROM vk_reposts r "
+        "JOIN vk_channels f ON f.id = r.from_channel_id "
+        "JOIN vk_channels t ON t.id = r.to_channel_id "
         "WHERE r.to_user_id = %s AND r.status = 'pending' "
         "ORDER BY r.created_date DESC",
         (user_id,)
@@ -1372,13 +2341,49 @@ def handle_list_pending(user_id):
         vk_send_message(user_id, "📭 Нет ожидающих подтверждения репостов.")
         return
 
-    text = "📋 Ожидают подтверждения:\n\n"
-    for r in reposts:
-        date_str = r['created_date'].strftime('%d.%m.%Y %H:%M')
-        text += f"• {r['from_channel']} → {r['to_channel']}\n  📅 {date_str}\n\n"
+    # Long lists go out as several messages within the size limit; buttons for the
+    # newest reposts come with the first one, an inline keyboard is limited in size
+    for index, page in enumerate(split_pages(*pending_list_parts(reposts))):
+        vk_send_message(user_id, page, keyboard=None if index else vk_repost_buttons(reposts, 'from_channel'))
 
-    text += "Используйте 'подтвердить [своя_группа] [группа_репоста]' для подтверждения."
 
+def handle_digest_settings(user_id, message_text):
+    """Handle digest command"""
+    if not DIGEST_INTERVAL:
+        vk_send_message(user_id, "❌ Сводки уведомлений отключены.")
+        return
+
+    parts = message_text.split(maxsplit=1)
+    choice = parts[1].strip() if len(parts) > 1 else ''
+    if choice not in ('', 'вкл', 'выкл'):
+        vk_send_message(user_id, "❌ Используйте 'дайджест вкл' или 'дайджест выкл'")
+        return
+
+    conn = VKDatabase.get_connection()
+    if not conn:
+        vk_send_message(user_id, ERROR_TEXT)
+        return
+
+    cursor = conn.cursor()
+    try:
+        if choice:
+            set_digest(cursor, 'vk_', user_id, choice == 'вкл')
+            conn.commit()
+            enabled = choice == 'вкл'
+        else:
+            enabled = digest_enabled(cursor, 'vk_', user_id)
+    finally:
+        cursor.close()
+        conn.close()
+
+    hours = max(DIGEST_INTERVAL // 3600, 1)
+    if enabled:
+        text = (
+            f"🔕 Уведомления о новых репостах приходят одной сводкой не чаще раза в {hours} ч.\n"
+            "Отключить: дайджест выкл"
+        )
+    else:
+        text = "🔔 Уведомления о новых репостах приходят сразу.\nПолучать сводкой: дайджест вкл"
     vk_send_message(user_id, text)
 
 
@@ -1386,18 +2391,20 @@ def handle_show_statistics(user_id):
     """Handle show statistics command"""
     conn = VKDatabase.get_connection()
     if not conn:
-        vk_send_message(user_id, "❌ Ошибка. Пожалуйста, попробуйте повторить попытку позже.")
+        vk_send_message(user_id, ERROR_TEXT)
         return
 
     cursor = conn.cursor(dictionary=True)
 
-    # Get total number of channels
-    cursor.execute("SELECT COUNT(*) as total FROM vk_channels")
-    channels_count = cursor.fetchone()['total']
+    # Get total number of channels and of their archived confirmed reposts
+    cursor.execute("SELECT COUNT(*) as total, COALESCE(SUM(archived_confirmed), 0) as archived FROM vk_channels")
+    row = cursor.fetchone()
+    channels_count = row['total']
+    archived_count = row['archived']
 
     # Get total number of confirmed reposts
     cursor.execute("SELECT COUNT(*) as total FROM vk_reposts WHERE status = 'confirmed'")
-    confirmed_count = cursor.fetchone()['total']
+    confirmed_count = cursor.fetchone()['total'] + archived_count
 
     # Get total number of pending reposts
     cursor.execute("SELECT COUNT(*) as total FROM vk_reposts WHERE status = 'pending'")
@@ -1412,6 +2419,7 @@ def handle_show_statistics(user_id):
         f"✅ Подтверждённых репостов: {confirmed_count}\n"
         f"⏳ Ожидают подтверждения: {pending_count}"
     )
+    reply_cache.put(cached_reply_key(user_id, 'stat', ''), text)
 
     vk_send_message(user_id, text)
 
@@ -1432,7 +2440,7 @@ def handle_report_abuse(user_id, message_text):
 
     conn = VKDatabase.get_connection()
     if not conn:
-        vk_send_message(user_id, "❌ Ошибка. Пожалуйста, попробуйте повторить попытку позже.")
+        vk_send_message(user_id, ERROR_TEXT)
         return
 
     cursor = conn.cursor()
@@ -1464,9 +2472,9 @@ def handle_report_abuse(user_id, message_text):
 
     # Saving the complaint
     cursor.execute(
-        "INSERT INTO vk_abuse_reports (reporter_user_id, channel_username, reason) "
-        "VALUES (%s, %s, %s)",
-        (user_id, channel_username, reason)
+        "INSERT INTO vk_abuse_reports (reporter_user_id, channel_id, channel_username, reason) "
+        "VALUES (%s, %s, %s, %s)",
+        (user_id, target_channel[0], channel_username, reason)
     )
     conn.commit()
     cursor.close()
@@ -1479,18 +2487,39 @@ def handle_report_abuse(user_id, message_text):
     )
 
 
+def handle_find_help(user_id):
+    """Handle find help button"""
+    vk_send_message(user_id, FIND_HELP_TEXT)
+
+
+def handle_done_help(user_id):
+    """Handle done help button"""
+    vk_send_message(user_id, DONE_HELP_TEXT)
+
+
 def send_main_menu(user_id):
     """Send main menu buttons to user"""
-    buttons_data = [
-        {'name': '➕ Добавить группу', 'value': 'добавить'},
-        {'name': '📋 Мои группы', 'value': 'мои'},
-        {'name': '🔍 Найти группы', 'value': 'найти_помощь'},
-        {'name': '✅ Готово', 'value': 'готово_помощь'},
-        {'name': '📊 Статистика', 'value': 'статистика'},
-        {'name': 'ℹ️ Помощь', 'value': 'помощь'},
-    ]
-    buttons = vk_create_buttons(buttons_data, columns=2)
-    vk_send_buttons(user_id, buttons, "Выберите действие:")
+    vk_send_message(user_id, MAIN_MENU_TEXT, MAIN_MENU_KEYBOARD)
+
+
+# Command table: aliases are looked up in a dict, argument commands by prefix
+vk_router = CommandRouter()
+vk_router.add('start', ['начать', 'start', 'старт'], handle_start)
+vk_router.add('help', ['помощь', 'help', 'справка'], handle_help)
+vk_router.add('my', ['мои', 'мои группы'], handle_my_channels)
+vk_router.add('list', ['список', 'ожидают'], handle_list_pending)
+vk_router.add('stat', ['статистика', 'стат', 'stat'], handle_show_statistics)
+vk_router.add('help', ['найти_помощь'], handle_find_help)
+vk_router.add('help', ['готово_помощь'], handle_done_help)
+vk_router.add('add', ['добавить'], handle_add_channel, prefix=True)
+vk_router.add('delete', ['удалить'], handle_delete_channel, prefix=True)
+vk_router.add('update', ['обновить'], handle_update_channel_stats, prefix=True)
+vk_router.add('find', ['найти'], handle_find_channels, prefix=True)
+vk_router.add('done', ['готово'], handle_done_repost, prefix=True)
+vk_router.add('confirm', ['подтвердить'], handle_confirm_repost, prefix=True)
+vk_router.add('confirm_all', ['подтвердить_все'], handle_confirm_all_reposts, prefix=True)
+vk_router.add('abuse', ['жалоба'], handle_report_abuse, prefix=True)
+vk_router.add('digest', ['дайджест'], handle_digest_settings, prefix=True)
 
 
 @app.route('/vk_callback', methods=['POST'])
@@ -1505,7 +2534,8 @@ def vk_callback():
         return 'fail'
 
     # Debug logging
-    logger.debug(json.dumps(data, indent=4, ensure_ascii=False))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(json.dumps(data, indent=4, ensure_ascii=False))
 
     event_type = data.get('type')
     group_id = data.get('group_id')
@@ -1536,82 +2566,103 @@ def vk_callback():
         # Normalize message text to lowercase for command matching
         message_text_lower = message_text.lower()
 
-        # Handle start command
-        if message_text_lower in ['начать', 'start', 'старт']:
-            handle_start(message_user_id)
-
-        # Handle help command
-        elif message_text_lower in ['помощь', 'help', 'справка']:
-            handle_help(message_user_id)
-
-        # Handle add command
-        elif message_text_lower.startswith('добавить'):
-            handle_add_channel(message_user_id, message_text_lower)
-
-        # Handle my channels command
-        elif message_text_lower in ['мои', 'мои группы']:
-            handle_my_channels(message_user_id)
-
-        # Handle delete command
-        elif message_text_lower.startswith('удалить'):
-            handle_delete_channel(message_user_id, message_text_lower)
-
-        # Handle update command
-        elif message_text_lower.startswith('обновить'):
-            handle_update_channel_stats(message_user_id, message_text_lower)
-
-        # Handle find command
-        elif message_text_lower.startswith('найти'):
-            if message_text_lower == 'найти_помощь':
-                vk_send_message(
-                    message_user_id,
-                    "Для поиска групп используйте команду:\nнайти [имя_вашей_группы]\n\nПример: найти mygroup"
-                )
+        if traffic_recorder:
+            command_alias, command_args = vk_router.split(message_text_lower)
+            traffic_recorder.record('vk', message_user_id, command_alias, command_args)
+
+        # Dispatch through the command table
+        route = vk_router.resolve(message_text_lower)
+        command = route[0] if route else 'unknown'
+
+        with CommandTimer(command):
+            # Anti-flood: throttled users get the cached reply or a short notice
+            if not rate_limiter.hit(message_user_id, command):
+                cached = None
+                if command in CACHED_REPLY_COMMANDS:
+                    cached = reply_cache.get(cached_reply_key(message_user_id, command, message_text_lower))
+                vk_send_message(message_user_id, cached or THROTTLED_TEXT)
+            elif route is None:
+                vk_send_message(message_user_id, UNKNOWN_COMMAND_TEXT)
+                send_main_menu(message_user_id)
             else:
-                handle_find_channels(message_user_id, message_text_lower)
-
-        # Handle done command
-        elif message_text_lower.startswith('готово'):
-            if message_text_lower == 'готово_помощь':
-                vk_send_message(
-                    message_user_id,
-                    "Для отправки уведомления о репосте используйте команду:\nготово [имя_группы] [на_какой_группе]\n\nПример: готово targetgroup yourgroup"
-                )
-            else:
-                handle_done_repost(message_user_id, message_text_lower)
-
-        # Handle confirm command
-        elif message_text_lower.startswith('подтвердить'):
-            handle_confirm_repost(message_user_id, message_text_lower)
+                _, handler, takes_text = route
+                if takes_text:
+                    handler(message_user_id, message_text_lower)
+                else:
+                    handler(message_user_id)
 
-        # Handle list command
-        elif message_text_lower in ['список', 'ожидают']:
-            handle_list_pending(message_user_id)
-
-        # Handle statistics command
-        elif message_text_lower in ['статистика', 'стат', 'stat']:
-            handle_show_statistics(message_user_id)
-
-        # Handle abuse command
-        elif message_text_lower.startswith('жалоба'):
-            handle_report_abuse(message_user_id, message_text_lower)
-
-        # Unknown command
-        else:
-            vk_send_message(
-                message_user_id,
-                "❓ Неизвестная команда. Используйте 'помощь' для просмотра списка команд."
-            )
-            send_main_menu(message_user_id)
+        return 'ok'
 
+    # Handle message_event from the Confirm/Reject callback buttons
+    if event_type == 'message_event':
+        event = data.get('object', {})
+        with CommandTimer('button'):
+            if not rate_limiter.hit(event.get('user_id'), 'button'):
+                vk_answer_event(event, THROTTLED_TEXT)
+            else:
+                handle_repost_button(event)
         return 'ok'
 
     return 'ok'
 
 
+def forget_expired(repost):
+    pair_index.remove(repost['from_channel_id'], repost['to_channel_id'])
+
+
 def main():
+    global expiry_scheduler, repost_verifier, impression_buffer
+
     # Database initialization
     VKDatabase.init_db()
+    pair_index.load(VKDatabase.get_connection, 'vk_')
+
+    # Rejecting pending reposts nobody confirmed in time
+    if PENDING_EXPIRY_DAYS:
+        expiry_scheduler = ExpiryScheduler(
+            VKDatabase.get_connection, 'vk_', PENDING_EXPIRY_DAYS, PENDING_EXPIRY_BATCH_SIZE,
+            vk_send_message if PENDING_EXPIRY_NOTIFY else None, EXPIRY_NOTIFY_RATE,
+            EXPIRY_REQUESTER_TEXT, EXPIRY_OWNER_TEXT, on_expire=forget_expired
+        )
+        expiry_scheduler.start()
+
+    # Moving finished reposts to the archive table
+    if ARCHIVE_AFTER_DAYS:
+        start_archiver(
+            VKDatabase.get_connection, 'vk_', ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, ARCHIVE_INTERVAL,
+            ARCHIVE_BATCH_PAUSE
+        )
+
+    # Downsampling subscriber history and refreshing the /update summary
+    if HISTORY_JOB_INTERVAL:
+        start_history_jobs(VKDatabase.get_connection, 'vk_', HISTORY_RAW_DAYS, HISTORY_JOB_INTERVAL)
+
+    # Recomputing the reliability scores weighting /find
+    if MATCH_SCORE_INTERVAL:
+        start_score_job(VKDatabase.get_connection, 'vk_', MATCH_SCORE_INTERVAL)
+
+    # Counting /find impressions, written behind in batches
+    if IMPRESSION_FLUSH_INTERVAL:
+        impression_buffer = ImpressionBuffer(
+            VKDatabase.get_connection, 'vk_', IMPRESSION_FLUSH_INTERVAL, IMPRESSION_DECAY_INTERVAL
+        )
+        impression_buffer.start()
+
+    # Coalescing new repost notifications for owners who asked for it
+    if DIGEST_INTERVAL:
+        start_digest(
+            VKDatabase.get_connection, 'vk_', vk_send_message, render_digest, DIGEST_INTERVAL, DIGEST_NOTIFY_RATE
+        )
+
+    # Looking for pending reposts on group walls
+    if VK_VERIFY_TOKEN and VK_VERIFY_INTERVAL:
+        repost_verifier = VKRepostVerifier()
+        repost_verifier.start(VK_VERIFY_INTERVAL)
+
+    if VK_METRICS_PORT:
+        # The admin interface's tg_mysql does not make the VK bot unhealthy
+        start_metrics_server(VK_METRICS_HOST, VK_METRICS_PORT, breaker_states, critical=('vk_mysql', 'vk_api'))
+        logger.info(f"Serving metrics on {VK_METRICS_HOST}:{VK_METRICS_PORT}/metrics")
 
     logger.info(f"Starting VK bot on {VK_FLASK_HOST}:{VK_FLASK_PORT}")
     app.run(host=VK_FLASK_HOST, port=VK_FLASK_PORT, debug=False)